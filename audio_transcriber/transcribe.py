@@ -3,16 +3,24 @@ from loguru import logger
 from pathlib import Path
 
 import os
-import whisper
+import sys
 import argparse
 
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from utils.audio_cache import DecodedAudioCache
+from utils.whisper_utils import load_whisper_model
+
 class AudioTranscriberV2:
-    def __init__(self, model_size='base', output_dir='data/transcripts'):
+    def __init__(self, model_size='base', output_dir='data/transcripts', quantize=False, num_threads=None,
+                 audio_cache_dir=None):
         """Initialize with specified Whisper model size and output directory
         Available sizes: tiny, base, small, medium, large
+        With quantize=True the linear layers run as dynamic int8 on CPU.
+        With audio_cache_dir, decoded audio is cached there for later runs.
         """
-        logger.info(f"Loading Whisper model ({model_size})...")
-        self.model = whisper.load_model(model_size)
+        logger.info(f"Loading Whisper model ({model_size}{', int8' if quantize else ''})...")
+        self.model = load_whisper_model(model_size, quantize=quantize, num_threads=num_threads)
+        self.audio_cache = DecodedAudioCache(audio_cache_dir) if audio_cache_dir else None
         self.output_dir = Path(output_dir)
         self.output_dir.mkdir(parents=True, exist_ok=True)
         logger.info("Model loaded successfully!")
@@ -40,7 +48,8 @@ class AudioTranscriberV2:
                 raise ValueError("Unsupported audio format. Use MP3, MP4, WAV, or M4A files.")
 
             logger.info(f"\nTranscribing: {audio_path}")
-            result = self.model.transcribe(audio_path)
+            audio = self.audio_cache.load(audio_path) if self.audio_cache else audio_path
+            result = self.model.transcribe(audio, fp16=self.model.device.type == 'cuda')
             transcript = result["text"]
 
             if not transcript.strip():
@@ -86,11 +95,17 @@ def main():
     parser.add_argument('input', help='Input audio file or directory')
     parser.add_argument('--model', help='Whisper model size (tiny, base, small, medium, large)', default='base')
     parser.add_argument('--output', help='Output directory for transcripts', default='data/transcripts')
+    parser.add_argument('--quantize', action='store_true', help='Use dynamic int8 quantization (CPU only)')
+    parser.add_argument('--threads', type=int, help='Number of torch threads for CPU inference')
+    parser.add_argument('--audio_cache_dir', help='Cache decoded audio in this directory (e.g. data/cache/audio)')
     
     args = parser.parse_args()
     
     # Initialize transcriber
-    transcriber = AudioTranscriberV2(model_size=args.model, output_dir=args.output)
+    transcriber = AudioTranscriberV2(
+        model_size=args.model, output_dir=args.output, quantize=args.quantize, num_threads=args.threads,
+        audio_cache_dir=args.audio_cache_dir
+    )
     
     # Process input
     input_path = Path(args.input)
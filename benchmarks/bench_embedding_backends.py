@@ -0,0 +1,46 @@
+import os
+import sys
+import time
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.embedding_backends import EMBEDDING_BACKENDS, HashingSVDBackend, create_backend
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare embedding backends on a sample of preprocessed texts')
+    parser.add_argument('sample', help='Text file with one preprocessed text per line')
+    parser.add_argument('--backend', nargs=2, action='append', default=[], metavar=('NAME', 'MODEL_PATH'),
+                        help=f"Backend to benchmark, one of {', '.join(EMBEDDING_BACKENDS)} (repeatable)")
+    parser.add_argument('--fit_hashing_svd', metavar='MODEL_DIR',
+                        help='Fit a hashing_svd model on the sample into MODEL_DIR and benchmark it')
+    parser.add_argument('--dim', type=int, default=300, help='Dimension of the fitted hashing_svd model')
+    parser.add_argument('--batch_size', type=int, default=256, help='Texts embedded per call')
+    args = parser.parse_args()
+
+    with open(args.sample, 'r', encoding='utf-8') as f:
+        texts = [line.strip() for line in f if line.strip()]
+    print(f"Sample: {args.sample} ({len(texts)} texts)")
+
+    backends = list(args.backend)
+    if args.fit_hashing_svd:
+        start = time.perf_counter()
+        HashingSVDBackend.fit(texts, args.fit_hashing_svd, dim=args.dim)
+        print(f"Fitted hashing_svd in {time.perf_counter() - start:.1f}s -> {args.fit_hashing_svd}")
+        backends.append(('hashing_svd', args.fit_hashing_svd))
+    if not backends:
+        parser.error('pass at least one --backend or --fit_hashing_svd')
+
+    print(f"{'backend':<20} {'dim':>5} {'load (s)':>9} {'memory (MB)':>12} {'embeddings/s':>13}")
+    for name, model_path in backends:
+        start = time.perf_counter()
+        backend = create_backend(name, model_path)
+        load_seconds = time.perf_counter() - start
+        stats = backend.benchmark(texts, args.batch_size)
+        print(f"{name:<20} {stats['dim']:>5} {load_seconds:>9.2f} {stats['memory_mb']:>12.1f} "
+              f"{stats['embeddings_per_sec']:>13.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+import os
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.lexical_index import LexicalIndex
+
+
+def synthetic_corpus(num_docs: int, vocab_size: int, mean_length: int, seed: int = 0):
+    """Yield (text_id, processed_text) with a Zipf-distributed vocabulary"""
+    rng = np.random.default_rng(seed)
+    vocab = np.array([f"w{i}" for i in range(vocab_size)])
+    lengths = np.maximum(1, rng.poisson(mean_length, num_docs))
+    for doc_id, length in enumerate(lengths):
+        term_ids = np.minimum(rng.zipf(1.2, length), vocab_size) - 1
+        yield f"doc-{doc_id}", ' '.join(vocab[term_ids])
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Build and query a LexicalIndex on a synthetic corpus')
+    parser.add_argument('--docs', type=int, default=1_000_000, help='Number of documents')
+    parser.add_argument('--vocab', type=int, default=200_000, help='Vocabulary size')
+    parser.add_argument('--length', type=int, default=60, help='Mean processed document length in tokens')
+    parser.add_argument('--segment_docs', type=int, default=100_000, help='Documents per flushed segment')
+    parser.add_argument('--queries', type=int, default=1000, help='Number of timed queries')
+    parser.add_argument('--index_dir', help='Index directory (default: temporary directory)')
+    args = parser.parse_args()
+
+    index_dir = args.index_dir or tempfile.mkdtemp(prefix='lexical_bench_')
+    try:
+        index = LexicalIndex(index_dir)
+        start = time.perf_counter()
+        for i, (text_id, text) in enumerate(synthetic_corpus(args.docs, args.vocab, args.length), 1):
+            index.add(text_id, text)
+            if i % args.segment_docs == 0:
+                index.flush()
+        index.flush()
+        build_seconds = time.perf_counter() - start
+        size_mb = sum(os.path.getsize(os.path.join(index_dir, f)) for f in os.listdir(index_dir)) / 1e6
+        print(f"Indexed {args.docs} docs in {build_seconds:.1f}s ({args.docs / build_seconds:.0f} docs/s), "
+              f"{len(index.segments)} segments, {size_mb:.1f} MB on disk")
+
+        start = time.perf_counter()
+        index.merge()
+        print(f"Merged into one segment in {time.perf_counter() - start:.1f}s")
+
+        # Reopen so query timings include cold segment opening, as in a fresh process
+        start = time.perf_counter()
+        index = LexicalIndex(index_dir)
+        print(f"Opened index in {(time.perf_counter() - start) * 1000:.1f} ms")
+
+        rng = np.random.default_rng(1)
+        for label, low in (('common terms', 0), ('rare terms', args.vocab // 10)):
+            latencies = []
+            for _ in range(args.queries):
+                terms = rng.integers(low, low + max(10, args.vocab // 100), rng.integers(1, 4))
+                query = ' '.join(f"w{t}" for t in terms)
+                start = time.perf_counter()
+                index.search(query, 10)
+                latencies.append((time.perf_counter() - start) * 1000)
+            latencies = np.array(latencies)
+            print(f"{label}: p50 {np.percentile(latencies, 50):.2f} ms, p95 {np.percentile(latencies, 95):.2f} ms, "
+                  f"p99 {np.percentile(latencies, 99):.2f} ms")
+    finally:
+        if not args.index_dir:
+            shutil.rmtree(index_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
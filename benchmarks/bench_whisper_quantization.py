@@ -0,0 +1,75 @@
+import os
+import sys
+import time
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import whisper
+
+from utils.audio_cache import DecodedAudioCache
+from utils.whisper_utils import configure_torch_threads, load_whisper_model
+
+
+def word_error_rate(reference: str, hypothesis: str) -> float:
+    """Word-level Levenshtein distance divided by the reference length"""
+    ref = reference.lower().split()
+    hyp = hypothesis.lower().split()
+    if not ref:
+        return 0.0 if not hyp else 1.0
+    previous = list(range(len(hyp) + 1))
+    for i, ref_word in enumerate(ref, 1):
+        current = [i] + [0] * len(hyp)
+        for j, hyp_word in enumerate(hyp, 1):
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (ref_word != hyp_word))
+        previous = current
+    return previous[-1] / len(ref)
+
+
+def run(model_size: str, quantize: bool, audio, language: str = None):
+    start = time.perf_counter()
+    model = load_whisper_model(model_size, quantize=quantize)
+    load_seconds = time.perf_counter() - start
+    start = time.perf_counter()
+    # Greedy decoding keeps the two runs comparable
+    result = model.transcribe(audio, fp16=False, temperature=0.0, language=language)
+    return load_seconds, time.perf_counter() - start, result['text'].strip()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare float32 and int8-quantized Whisper on CPU')
+    parser.add_argument('audio', help='Local audio file used as the fixed benchmark sample')
+    parser.add_argument('--model', default='small', help='Whisper model size')
+    parser.add_argument('--threads', type=int, help='Number of torch threads')
+    parser.add_argument('--language', help='Force the decoding language (e.g. fr)')
+    parser.add_argument('--reference', help='Reference transcript file; defaults to the float32 output')
+    parser.add_argument('--audio_cache_dir', help='Reuse decoded audio cached in this directory (e.g. data/cache/audio)')
+    args = parser.parse_args()
+
+    configure_torch_threads(args.threads)
+    if args.audio_cache_dir:
+        audio = DecodedAudioCache(args.audio_cache_dir).load(args.audio)
+    else:
+        audio = whisper.audio.load_audio(args.audio)
+    duration = len(audio) / whisper.audio.SAMPLE_RATE
+    print(f"Audio: {args.audio} ({duration:.1f}s), model: {args.model}")
+
+    results = {}
+    for label, quantize in (('float32', False), ('int8', True)):
+        results[label] = run(args.model, quantize, audio, args.language)
+
+    if args.reference:
+        with open(args.reference, 'r', encoding='utf-8') as f:
+            reference, reference_label = f.read(), args.reference
+    else:
+        reference, reference_label = results['float32'][2], 'float32 output'
+
+    print(f"{'mode':<8} {'load (s)':>9} {'transcribe (s)':>15} {'RTF':>7} {'WER':>7}")
+    for label, (load_seconds, seconds, text) in results.items():
+        print(f"{label:<8} {load_seconds:>9.2f} {seconds:>15.2f} {seconds / duration:>7.3f} "
+              f"{word_error_rate(reference, text):>7.3f}")
+    print(f"WER is measured against the {reference_label}")
+
+
+if __name__ == "__main__":
+    main()
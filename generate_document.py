@@ -2,50 +2,152 @@ import os
 os.environ['OPENAI_API_KEY'] = ''
 
 
+import re
+import threading
 from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
 from langchain_core.prompts import ChatPromptTemplate, PromptTemplate
 from langchain_openai import ChatOpenAI
 import argparse
+import tiktoken
 from docx import Document
 from docx.shared import Inches
 import requests
 from io import BytesIO
 
-# Set your OpenAI API key
-class DocumentGenerator:
-    def __init__(self, output_file='data/document.docx'):
-        self.output_file = Path(output_file)
-        self.llm = ChatOpenAI(api_key=os.environ['OPENAI_API_KEY'], model_name="gpt-3.5-turbo")
+from utils.llm_utils import FakeSummaryChatModel, LLMResponseCache
 
-    def generate_sections(self, transcript_text):
-        """Generate sections in French using a single prompt"""
+SECTIONS_PROMPT = "Écrivez un résumé concis, une segmentation thématique, et les points clés du texte suivant en français : {context}"
+MAP_PROMPT = "Résumez en français cet extrait d'une transcription, en conservant les thèmes abordés, les positions exprimées et les citations importantes : {context}"
+REDUCE_PROMPT = "À partir des résumés partiels suivants d'une même transcription, écrivez un résumé concis, une segmentation thématique, et les points clés en français : {context}"
+
+LOGO_URL = 'https://coda.newjobs.com/api/imagesproxy/ms/clu/xnov/xnovagenfrx/branding/165159/Novagen-Conseil-logo.png'
+
+class ApproximateEncoding:
+    """Word/punctuation tokenizer used when the tiktoken vocabulary cannot be loaded (e.g. offline)"""
 
-        # Define the prompt
-        prompt = ChatPromptTemplate([
-            ("human", "Écrivez un résumé concis, une segmentation thématique, et les points clés du texte suivant en français : {context}")
-        ])
+    def encode(self, text):
+        return re.findall(r'\w+|[^\w\s]', text)
 
-        # Format the prompt
-        formatted_prompt = prompt.format(context=transcript_text)
+    def decode(self, tokens):
+        return ' '.join(tokens)
 
-        # Generate the response
-        response = self.llm(formatted_prompt)
 
-        return response.content
+def load_encoding():
+    try:
+        return tiktoken.get_encoding('cl100k_base')
+    except Exception:
+        return ApproximateEncoding()
 
-    def process_transcript(self, transcript_path):
+class DocumentGenerator:
+    def __init__(self, output_file='data/document.docx', llm=None, cache_dir='data/cache/llm',
+                 chunk_tokens=3000, max_workers=4, session=None, logo_cache='data/cache/logo.png'):
+        """Transcripts longer than `chunk_tokens` are summarized with a map-reduce pass
+        of at most `max_workers` concurrent LLM calls. Every LLM response is cached
+        under `cache_dir` (pass None to disable the cache). One HTTP session and
+        one cached copy of the logo are shared by every generated document."""
+        self.output_file = Path(output_file)
+        self.llm = llm or ChatOpenAI(api_key=os.environ['OPENAI_API_KEY'], model_name="gpt-3.5-turbo")
+        self.model_name = getattr(self.llm, 'model_name', None) or type(self.llm).__name__
+        self.cache = LLMResponseCache(cache_dir) if cache_dir else None
+        self.chunk_tokens = chunk_tokens
+        self.max_workers = max_workers
+        self.encoding = load_encoding()
+        # Bounds concurrent LLM calls across all documents generated in parallel
+        self._llm_slots = threading.BoundedSemaphore(max_workers)
+        self.session = session or requests.Session()
+        self.logo_cache = Path(logo_cache)
+        self._logo = None
+        self._logo_lock = threading.Lock()
+
+    def count_tokens(self, text):
+        return len(self.encoding.encode(text))
+
+    def split_transcript(self, transcript_text, max_tokens=None):
+        """Split a transcript into pieces of at most `max_tokens`, on sentence boundaries when possible"""
+        max_tokens = max_tokens or self.chunk_tokens
+        chunks, current, current_tokens = [], [], 0
+        for sentence in re.split(r'(?<=[.!?])\s+', transcript_text.strip()):
+            tokens = self.encoding.encode(sentence)
+            # A single overlong sentence is cut on token boundaries
+            pieces = [self.encoding.decode(tokens[i:i + max_tokens]) for i in range(0, len(tokens), max_tokens)] \
+                if len(tokens) > max_tokens else [sentence]
+            for piece in pieces:
+                piece_tokens = min(len(tokens), max_tokens)
+                if current and current_tokens + piece_tokens > max_tokens:
+                    chunks.append(' '.join(current))
+                    current, current_tokens = [], 0
+                current.append(piece)
+                current_tokens += piece_tokens
+        if current:
+            chunks.append(' '.join(current))
+        return chunks
+
+    def call_llm(self, template, context):
+        """Run one prompt through the LLM, answering from the response cache when possible"""
+        key = LLMResponseCache.make_key(self.model_name, template, context) if self.cache else None
+        if key:
+            cached = self.cache.get(key)
+            if cached is not None:
+                return cached
+
+        prompt = ChatPromptTemplate([("human", template)])
+        with self._llm_slots:
+            response = self.llm.invoke(prompt.format_messages(context=context)).content
+
+        if key:
+            self.cache.set(key, response, model=self.model_name)
+        return response
+
+    def generate_sections(self, transcript_text):
+        """Generate sections in French, with a map-reduce pass over chunks for long transcripts"""
+        if self.count_tokens(transcript_text) <= self.chunk_tokens:
+            return self.call_llm(SECTIONS_PROMPT, transcript_text)
+
+        # Map: summarize every chunk concurrently with a bounded pool
+        chunks = self.split_transcript(transcript_text)
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            summaries = list(executor.map(lambda chunk: self.call_llm(MAP_PROMPT, chunk), chunks))
+
+        # Reduce: collapse partial summaries until they fit in one prompt
+        combined = '\n\n'.join(summaries)
+        while self.count_tokens(combined) > self.chunk_tokens and len(summaries) > 1:
+            groups = self.split_transcript(combined)
+            if len(groups) >= len(summaries):
+                break
+            with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+                summaries = list(executor.map(lambda group: self.call_llm(MAP_PROMPT, group), groups))
+            combined = '\n\n'.join(summaries)
+        return self.call_llm(REDUCE_PROMPT, combined)
+
+    def get_logo(self):
+        """Logo image bytes, downloaded once and then served from the local cache"""
+        with self._logo_lock:
+            if self._logo is None:
+                if self.logo_cache.exists():
+                    self._logo = self.logo_cache.read_bytes()
+                else:
+                    response = self.session.get(LOGO_URL, timeout=30)
+                    response.raise_for_status()
+                    self.logo_cache.parent.mkdir(parents=True, exist_ok=True)
+                    tmp_path = self.logo_cache.with_suffix('.tmp')
+                    tmp_path.write_bytes(response.content)
+                    os.replace(tmp_path, self.logo_cache)
+                    self._logo = response.content
+            return self._logo
+
+    def process_transcript(self, transcript_path, output_file=None):
         """Process a single transcript and generate a Word document"""
         document = Document()
+        output_file = Path(output_file) if output_file else self.output_file
 
         transcript_file = Path(transcript_path)
         if transcript_file.exists():
             # Add title
             document.add_heading(transcript_file.stem, level=1)
 
-            # Download and add image from URL
-            image_url = 'https://coda.newjobs.com/api/imagesproxy/ms/clu/xnov/xnovagenfrx/branding/165159/Novagen-Conseil-logo.png'
-            response = requests.get(image_url)
-            image_stream = BytesIO(response.content)
+            # Add the (cached) logo image
+            image_stream = BytesIO(self.get_logo())
             document.add_picture(image_stream, width=Inches(2.0))
 
             with open(transcript_file, 'r', encoding='utf-8') as file:
@@ -54,16 +156,67 @@ class DocumentGenerator:
                 document.add_paragraph(str(sections))
 
             # Save the generated document
-            document.save(self.output_file)
+            output_file.parent.mkdir(parents=True, exist_ok=True)
+            document.save(output_file)
 
-            print(f"Document généré : {self.output_file}")
+            print(f"Document généré : {output_file}")
         else:
             print(f"Erreur : Le fichier {transcript_path} n'existe pas.")
 
+    def process_directory(self, input_dir, output_dir='data/documents', workers=4, force=False):
+        """Generate one document per transcript in `input_dir`, in parallel.
+
+        Transcripts whose document is newer than the transcript are skipped
+        unless `force` is set.
+        """
+        output_dir = Path(output_dir)
+        results = {"generated": [], "skipped": [], "failed": []}
+        jobs = []
+        for transcript_file in sorted(Path(input_dir).glob('*.txt')):
+            output_file = output_dir / f"{transcript_file.stem}.docx"
+            if not force and output_file.exists() and output_file.stat().st_mtime >= transcript_file.stat().st_mtime:
+                results["skipped"].append(str(transcript_file))
+            else:
+                jobs.append((transcript_file, output_file))
+
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = {
+                executor.submit(self.process_transcript, transcript_file, output_file): transcript_file
+                for transcript_file, output_file in jobs
+            }
+            for future, transcript_file in futures.items():
+                try:
+                    future.result()
+                    results["generated"].append(str(transcript_file))
+                except Exception as e:
+                    results["failed"].append((str(transcript_file), str(e)))
+        return results
+
 if __name__ == "__main__":
-    parser = argparse.ArgumentParser(description='Generate a document from a transcript file.')
-    parser.add_argument('transcript_path', help='Path to the transcript file')
+    parser = argparse.ArgumentParser(description='Generate documents from a transcript file or a directory of transcripts.')
+    parser.add_argument('transcript_path', help='Path to the transcript file, or a directory of .txt transcripts')
+    parser.add_argument('--output', default='data/document.docx', help='Output document for a single transcript')
+    parser.add_argument('--output_dir', default='data/documents', help='Output directory in batch mode')
+    parser.add_argument('--workers', type=int, default=4, help='Documents generated in parallel in batch mode')
+    parser.add_argument('--force', action='store_true', help='Regenerate documents that are already up to date')
+    parser.add_argument('--chunk_tokens', type=int, default=3000, help='Maximum tokens per summarized chunk')
+    parser.add_argument('--max_workers', type=int, default=4, help='Maximum concurrent LLM calls')
+    parser.add_argument('--cache_dir', default='data/cache/llm', help='Directory of the LLM response cache')
+    parser.add_argument('--no_cache', action='store_true', help='Disable the LLM response cache')
+    parser.add_argument('--fake_llm', action='store_true', help='Use a local fake chat model instead of the OpenAI API')
     args = parser.parse_args()
 
-    generator = DocumentGenerator()
-    generator.process_transcript(args.transcript_path)
+    generator = DocumentGenerator(
+        output_file=args.output,
+        llm=FakeSummaryChatModel() if args.fake_llm else None,
+        cache_dir=None if args.no_cache else args.cache_dir,
+        chunk_tokens=args.chunk_tokens,
+        max_workers=args.max_workers
+    )
+    if Path(args.transcript_path).is_dir():
+        results = generator.process_directory(args.transcript_path, args.output_dir, args.workers, args.force)
+        print(f"\n{len(results['generated'])} documents générés, {len(results['skipped'])} déjà à jour")
+        for transcript_path, error in results['failed']:
+            print(f"Erreur : {transcript_path} : {error}")
+    else:
+        generator.process_transcript(args.transcript_path)
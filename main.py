@@ -1,112 +1,611 @@
 import os
+import json
+import time
+import queue
 import argparse
-from typing import List, Dict
+import numpy as np
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from typing import List, Dict, Optional, Tuple
 from tqdm import tqdm
 
 from config import (
     DATA_DIR, AUDIO_DIR, TRANSCRIPT_DIR, VECTOR_DIR,
-    WHISPER_MODEL, FASTTEXT_MODEL, VECTOR_DIMENSION
+    WHISPER_MODEL, VECTOR_DIMENSION
 )
 from utils.db_utils import DatabaseManager
 from utils.text_utils import TextPreprocessor
 from utils.vector_utils import VectorManager
+from utils.embedding_backends import EMBEDDING_BACKENDS, configured_backend
+from utils.lexical_index import LexicalIndex
+from utils.columnar_export import EXPORT_FORMATS, export_texts, import_texts
+from utils.scheduler import AUDIO_EXTENSIONS, CostReport, schedule_files
+from utils.file_watcher import Debouncer, create_watcher, file_signature, is_excluded, walk_files
+from utils.memory_budget import MemoryBudget, parse_size
+from utils.file_utils import atomic_write_bytes
 from modules.structured_data import StructuredDataLoader
 from modules.document_data import DocumentLoader
 from modules.audio_data import AudioProcessor
 from modules.xml_json_data import XMLJSONLoader
 
-def process_files(
-    file_paths: List[str],
-    text_column: str = None,
-    text_fields: List[str] = None,
-    text_tags: List[str] = None
-) -> Dict[str, List[str]]:
-    """Process multiple files and return text IDs"""
-    
-    # Initialize managers and processors
-    db_manager = DatabaseManager()
-    structured_loader = StructuredDataLoader(db_manager)
-    document_loader = DocumentLoader(db_manager)
-    audio_processor = AudioProcessor(db_manager, WHISPER_MODEL)
-    xml_json_loader = XMLJSONLoader(db_manager)
-    
-    results = {
-        "success": [],
-        "failed": []
-    }
-    
-    for file_path in tqdm(file_paths, desc="Processing files"):
+class FileLoaders:
+    """Dispatches a file to the loader for its type. Whisper models are only
+    loaded when audio arrives, one per concurrent transcription, and are kept
+    for later files. With a `budget`, spreadsheets, JSON and XML are read and
+    inserted in smaller chunks as memory fills up."""
+
+    def __init__(self, db_manager: DatabaseManager, text_column: str = None, text_fields: List[str] = None,
+                 text_tags: List[str] = None, whisper_quantize: bool = False, torch_threads: Optional[int] = None,
+                 audio_cache_dir: Optional[str] = None, budget: Optional[MemoryBudget] = None):
+        self.db_manager = db_manager
+        self.budget = budget
+        self.text_column = text_column
+        self.text_fields = text_fields
+        self.text_tags = text_tags
+        self.whisper_quantize = whisper_quantize
+        self.torch_threads = torch_threads
+        self.audio_cache_dir = audio_cache_dir
+        self.structured_loader = StructuredDataLoader(db_manager)
+        self.document_loader = DocumentLoader(db_manager)
+        self.xml_json_loader = XMLJSONLoader(db_manager)
+        self._idle_audio_processors = queue.SimpleQueue()
+
+    def _new_audio_processor(self) -> AudioProcessor:
+        return AudioProcessor(self.db_manager, WHISPER_MODEL, quantize=self.whisper_quantize, num_threads=self.torch_threads,
+                              audio_cache_dir=self.audio_cache_dir)
+
+    def preload_audio(self, count: int = 1):
+        """Load `count` Whisper models ahead of the first audio file"""
+        for _ in range(count):
+            self._idle_audio_processors.put(self._new_audio_processor())
+
+    def transcribe(self, file_path: str) -> Dict:
+        try:
+            processor = self._idle_audio_processors.get_nowait()
+        except queue.Empty:
+            processor = self._new_audio_processor()
+        try:
+            return processor.transcribe_audio(file_path)
+        finally:
+            self._idle_audio_processors.put(processor)
+
+    def _chunk(self, size: int, minimum: int) -> int:
+        return self.budget.scale(size, minimum) if self.budget else size
+
+    def load(self, file_path: str) -> Dict:
+        """Load one file into the database and return the loader's result"""
         try:
             file_ext = os.path.splitext(file_path)[1].lower()
             
             if file_ext in ['.csv']:
-                result = structured_loader.load_csv(file_path, text_column)
+                return self.structured_loader.load_csv(file_path, self.text_column, chunk_size=self._chunk(10000, 500))
             elif file_ext in ['.xlsx', '.xls']:
-                result = structured_loader.load_xlsx(file_path, text_column)
+                return self.structured_loader.load_xlsx(file_path, self.text_column, batch_size=self._chunk(1000, 100),
+                                                        max_workers=self._chunk(4, 1))
             elif file_ext == '.pdf':
-                result = document_loader.load_pdf(file_path)
+                return self.document_loader.load_pdf(file_path)
             elif file_ext == '.txt':
-                result = document_loader.load_txt(file_path)
-            elif file_ext in ['.mp3', '.mp4', '.wav', '.m4a']:
-                result = audio_processor.transcribe_audio(file_path)
+                return self.document_loader.load_txt(file_path)
+            elif file_ext in AUDIO_EXTENSIONS:
+                return self.transcribe(file_path)
             elif file_ext == '.json':
-                result = xml_json_loader.load_json(file_path, text_fields)
+                return self.xml_json_loader.load_json(file_path, self.text_fields, batch_size=self._chunk(1000, 100))
             elif file_ext in ['.xml', '.html']:
-                result = xml_json_loader.load_xml(file_path, text_tags)
-            else:
-                result = {"status": "error", "message": f"Unsupported file type: {file_ext}"}
-            
-            if result["status"] == "success":
-                results["success"].append(file_path)
-            else:
-                results["failed"].append((file_path, result["message"]))
-                
+                return self.xml_json_loader.load_xml(file_path, self.text_tags, batch_size=self._chunk(1000, 100))
+            return {"status": "error", "message": f"Unsupported file type: {file_ext}"}
         except Exception as e:
-            results["failed"].append((file_path, str(e)))
+            return {"status": "error", "message": str(e)}
+
+    def timed_load(self, file_path: str) -> Tuple[Dict, float]:
+        start = time.perf_counter()
+        result = self.load(file_path)
+        return result, time.perf_counter() - start
+
+# Loaders of a document worker process
+_worker_loaders: Optional[FileLoaders] = None
+
+def _init_document_worker(loader_args: Dict, max_rss: Optional[int] = None):
+    global _worker_loaders
+    # Workers measure the memory of the whole process tree, from the parent down
+    budget = MemoryBudget(max_rss, pid=os.getppid()) if max_rss else None
+    _worker_loaders = FileLoaders(DatabaseManager(), budget=budget, **loader_args)
+
+def _load_in_document_worker(file_path: str) -> Tuple[Dict, float]:
+    return _worker_loaders.timed_load(file_path)
+
+def process_files(
+    file_paths: List[str],
+    text_column: str = None,
+    text_fields: List[str] = None,
+    text_tags: List[str] = None,
+    whisper_quantize: bool = False,
+    torch_threads: Optional[int] = None,
+    workers: int = 4,
+    audio_workers: int = 1,
+    loaders: Optional[FileLoaders] = None,
+    budget: Optional[MemoryBudget] = None,
+    audio_cache_dir: Optional[str] = None
+) -> Dict:
+    """Process multiple files and return text IDs
+
+    Files are ordered by estimated cost (audio duration, PDF page count or
+    file size), largest first. Audio goes to its own pool of `audio_workers`
+    threads, each holding one Whisper model. The other files run in `workers`
+    processes, or inline when `workers` is 1. `results["report"]` compares
+    estimated and actual processing time.
+
+    Files are handed to the pools as they free up. While the process tree is
+    over the memory `budget`, no new file is started in a pool that already
+    has one running, and loaders read in smaller chunks.
+
+    `loaders` are resident FileLoaders (see `watch`) used for audio and for
+    inline documents instead of new ones.
+    """
+    budget = budget or MemoryBudget()
+    # Creates missing tables once, before worker processes connect
+    db_manager = loaders.db_manager if loaders else DatabaseManager()
+    loader_args = {
+        'text_column': text_column, 'text_fields': text_fields, 'text_tags': text_tags,
+        'whisper_quantize': whisper_quantize, 'torch_threads': torch_threads, 'audio_cache_dir': audio_cache_dir
+    }
+    audio_jobs, document_jobs, estimated_makespan = schedule_files(file_paths, workers, audio_workers)
+    
+    results = {
+        "success": [],
+        "failed": [],
+        "report": CostReport()
+    }
+    results["report"].estimated_makespan = estimated_makespan
+    start = time.perf_counter()
+    
+    if workers > 1:
+        document_pool = ProcessPoolExecutor(workers, initializer=_init_document_worker,
+                                            initargs=(loader_args, budget.max_rss))
+        load_document = _load_in_document_worker
+    else:
+        document_pool = ThreadPoolExecutor(1)
+        load_document = (loaders or FileLoaders(db_manager, budget=budget, **loader_args)).timed_load
+    audio_pool = ThreadPoolExecutor(max(1, audio_workers), thread_name_prefix='audio')
+    audio_loaders = loaders or (FileLoaders(db_manager, budget=budget, **loader_args) if audio_jobs else None)
+    
+    # (queued jobs, pool, load function, maximum files in flight); documents come
+    # first so worker processes fork before Whisper is loaded
+    queues = [
+        (deque(document_jobs), document_pool, load_document, 2 * workers),
+        (deque(audio_jobs), audio_pool, audio_loaders.timed_load if audio_loaders else None, max(1, audio_workers)),
+    ]
+    in_flight = [0, 0]
+    futures = {}
+    
+    def submit():
+        for index, (jobs, pool, load, limit) in enumerate(queues):
+            while jobs and in_flight[index] < limit and (not in_flight[index] or not budget.over_limit()):
+                job = jobs.popleft()
+                futures[pool.submit(load, job[0])] = (job, index)
+                in_flight[index] += 1
+    
+    try:
+        with tqdm(total=len(document_jobs) + len(audio_jobs), desc="Processing files") as progress:
+            submit()
+            while futures:
+                done, _ = wait(futures, return_when=FIRST_COMPLETED)
+                for future in done:
+                    (file_path, kind, units, estimated), index = futures.pop(future)
+                    in_flight[index] -= 1
+                    try:
+                        result, seconds = future.result()
+                    except Exception as e:
+                        result, seconds = {"status": "error", "message": str(e)}, 0.0
+                    results["report"].record(file_path, kind, units, estimated, seconds)
+                    
+                    if result["status"] == "success":
+                        results["success"].append(file_path)
+                    else:
+                        results["failed"].append((file_path, result["message"]))
+                    progress.update()
+                submit()
+    finally:
+        document_pool.shutdown()
+        audio_pool.shutdown()
+    results["report"].wall_seconds = time.perf_counter() - start
     
     return results
 
-def process_texts():
-    """Process all unprocessed texts in the database"""
+def open_vector_manager(embedding_backend: Optional[str] = None, embedding_model: Optional[str] = None,
+                        read_only: bool = False) -> VectorManager:
+    """VectorManager over the on-disk index with the configured embedding backend"""
+    embedding_backend, embedding_model = configured_backend(embedding_backend, embedding_model)
+    return VectorManager(
+        embedding_model, VECTOR_DIMENSION, index_dir=os.path.join(VECTOR_DIR, 'index_store'), backend=embedding_backend,
+        read_only=read_only
+    )
+
+def migrate_content_hashes():
+    """Deduplicate an existing text_data table by content hash and drop the
+    vectors and lexical postings of the merged rows"""
     db_manager = DatabaseManager()
-    text_processor = TextPreprocessor()
-    vector_manager = VectorManager(FASTTEXT_MODEL, VECTOR_DIMENSION)
+    merged_ids = db_manager.migrate_content_hashes()
+    print(f"Merged {len(merged_ids)} texts with duplicate content")
+    if not merged_ids:
+        return
     
-    # Get unprocessed texts
-    texts = db_manager.get_unprocessed_texts()
-    if not texts:
+    vector_manager = open_vector_manager()
+    stale_ids = vector_manager.metadata.vector_ids_for_texts(merged_ids)
+    if len(stale_ids):
+        vector_manager.remove_from_index(stale_ids)
+        vector_manager.save_index()
+    lexical_index = LexicalIndex(os.path.join(VECTOR_DIR, 'lexical_index'))
+    lexical_index.remove(merged_ids)
+    lexical_index.flush()
+
+def backfill_text_vectors(batch_size: int = 10000):
+    """Record the vector ids of texts indexed before text_vectors existed, so
+    that filtered searches see them"""
+    db_manager = DatabaseManager()
+    vector_manager = open_vector_manager(read_only=True)
+    tombstones = vector_manager.store.tombstones
+    recorded = 0
+    for vector_ids, text_ids in vector_manager.metadata.iter_mappings():
+        live = np.nonzero(~np.isin(vector_ids, tombstones))[0]
+        for start in range(0, len(live), batch_size):
+            rows = live[start:start + batch_size]
+            db_manager.save_text_vectors([(int(vector_ids[row]), text_ids[row]) for row in rows])
+            recorded += len(rows)
+    print(f"Recorded {recorded} vector ids")
+
+def import_exported_texts(input_dir: str, embedding_backend: Optional[str] = None,
+                          embedding_model: Optional[str] = None):
+    """Rebuild the vector index (and the lexical index, if it is empty) from
+    a Parquet/Arrow export without re-embedding"""
+    vector_manager = open_vector_manager(embedding_backend, embedding_model)
+    lexical_index = LexicalIndex(os.path.join(VECTOR_DIR, 'lexical_index'))
+    if lexical_index.live_docs:
+        print("Lexical index is not empty, only the vector index is rebuilt")
+        lexical_index = None
+    imported = import_texts(vector_manager, input_dir, lexical_index)
+    print(f"Imported {imported} vectors from {input_dir}")
+
+def process_texts(batch_size: int = 256, dedup_threshold: Optional[float] = None, checkpoint_every: int = 5000,
+                  embedding_backend: Optional[str] = None, embedding_model: Optional[str] = None,
+                  db_manager: Optional[DatabaseManager] = None, text_processor: Optional[TextPreprocessor] = None,
+                  vector_manager: Optional[VectorManager] = None, lexical_index: Optional[LexicalIndex] = None,
+                  budget: Optional[MemoryBudget] = None, page_size: int = 5000):
+    """Process all unprocessed texts in the database
+
+    With `dedup_threshold`, texts whose vector has at least that cosine
+    similarity to an indexed text (or an earlier text of the same batch) are
+    recorded as duplicates of it instead of being indexed.
+
+    Every `checkpoint_every` texts the vector metadata, lexical index and
+    vector index are flushed; the index manifest commit carries a journal of
+    the checkpoint's texts, and only then are the texts marked as processed in
+    the database. A killed run therefore resumes after its last checkpoint
+    without re-embedding or double-indexing anything.
+
+    Texts recorded in `text_vectors` are being re-processed: their previous
+    vectors and postings are removed first. Indexes built before that table
+    existed need `--backfill_text_vectors` for this.
+
+    `embedding_backend` / `embedding_model` override EMBEDDING_BACKEND /
+    EMBEDDING_MODEL from config (see utils.embedding_backends).
+
+    The database, preprocessor, vector manager and lexical index are opened
+    here unless resident instances are passed in (see `watch`).
+
+    Texts are read from the database `page_size` at a time. Near the memory
+    `budget`, pages and batches shrink and a checkpoint is taken early to
+    release buffered index data, once at least a tenth of `checkpoint_every`
+    texts is buffered. Smaller early checkpoints are only taken while the
+    previous one actually lowered RSS, so memory held elsewhere does not turn
+    every batch into a checkpoint.
+    """
+    db_manager = db_manager or DatabaseManager()
+    text_processor = text_processor or TextPreprocessor()
+    vector_manager = vector_manager or open_vector_manager(embedding_backend, embedding_model)
+    lexical_index = lexical_index or LexicalIndex(os.path.join(VECTOR_DIR, 'lexical_index'))
+    
+    budget = budget or MemoryBudget()
+    
+    # Replay a checkpoint that reached the index but not the database
+    checkpoint_id = db_manager.get_last_checkpoint_id()
+    journal = vector_manager.store.checkpoint
+    if journal and journal['id'] > checkpoint_id:
+        replayed = [text for text in db_manager.get_texts_by_ids(journal['text_ids']).values()
+                    if text.processed_content is None]
+        db_manager.commit_checkpoint(
+            journal['id'],
+            [(text.id, text_processor.preprocess_text(text.content)) for text in replayed],
+            [tuple(duplicate) for duplicate in journal['duplicates']],
+            journal['next_vector_id'],
+            [tuple(vector) for vector in journal.get('vectors', [])]
+        )
+        checkpoint_id = journal['id']
+        print(f"Recovered {len(replayed)} texts from interrupted checkpoint {checkpoint_id}")
+    # Drop postings flushed for a checkpoint that never reached the index
+    lexical_index.discard_after(checkpoint_id)
+    
+    total = db_manager.count_unprocessed_texts()
+    if not total:
         print("No unprocessed texts found")
         return
     
-    print(f"Processing {len(texts)} texts...")
-    for text in tqdm(texts):
-        # Clean and preprocess text
-        processed_text = text_processor.preprocess_text(text.content)
-        
-        # Update processed content in database
-        db_manager.save_text_data(
-            text_id=text.id,
-            source_file=text.source_file,
-            content=text.content,
-            processed_content=processed_text
+    pending_texts = []
+    pending_duplicates = []
+    pending_vectors = []
+    min_early_checkpoint = max(batch_size, checkpoint_every // 10)
+    early_checkpoint_helped = False
+    
+    def checkpoint():
+        nonlocal checkpoint_id
+        checkpoint_id += 1
+        # Metadata and lexical segments first: the index manifest is the commit point
+        vector_manager.save_metadata()
+        lexical_index.flush(checkpoint_id)
+        vector_manager.save_index(checkpoint={
+            'id': checkpoint_id,
+            'next_vector_id': vector_manager.store.next_id,
+            'text_ids': [text_id for text_id, _ in pending_texts],
+            'duplicates': pending_duplicates,
+            'vectors': pending_vectors,
+        })
+        db_manager.commit_checkpoint(
+            checkpoint_id, pending_texts, pending_duplicates, vector_manager.store.next_id, pending_vectors
         )
+        pending_texts.clear()
+        pending_duplicates.clear()
+        pending_vectors.clear()
+        lexical_index.maybe_merge()
+    
+    print(f"Processing {total} texts...")
+    duplicate_count = 0
+    progress = tqdm(total=total)
+    # Unprocessed texts are streamed in pages, both pages and batches shrinking as memory fills up
+    for texts in db_manager.iter_unprocessed_texts(lambda: budget.scale(page_size, batch_size)):
+        # Texts that are being re-processed replace their previous vectors and postings
+        indexed_ids = db_manager.indexed_text_ids([text.id for text in texts])
+        if indexed_ids:
+            stale_ids = vector_manager.metadata.vector_ids_for_texts(list(indexed_ids))
+            if len(stale_ids):
+                vector_manager.remove_from_index(stale_ids)
+            lexical_index.remove(list(indexed_ids))
+        
+        start = 0
+        while start < len(texts):
+            batch = texts[start:start + budget.scale(batch_size, max(1, batch_size // 16))]
+            start += len(batch)
+            
+            # Clean and preprocess text
+            processed_texts = [text_processor.preprocess_text(text.content) for text in batch]
+            vectors = vector_manager.batch_to_vectors(processed_texts)
+        
+            duplicates = {}
+            if dedup_threshold is not None:
+                duplicates = vector_manager.find_near_duplicates(vectors, dedup_threshold)
+                index_matches = [match for source, match, _ in duplicates.values() if source == 'index']
+                canonical_by_vector = {
+                    meta['vector_id']: meta['text_id']
+                    for meta in vector_manager.lookup_metadata(index_matches) if meta
+                }
         
-        # Generate and save vector
-        vector = vector_manager.text_to_vector(processed_text)
-        vector_manager.add_to_index(vector.reshape(1, -1))
+            for row, text in enumerate(batch):
+                pending_texts.append((text.id, processed_texts[row]))
+                if row in duplicates:
+                    source, match, similarity = duplicates[row]
+                    canonical_id = batch[match].id if source == 'batch' else canonical_by_vector.get(match)
+                    pending_duplicates.append((text.id, canonical_id, similarity))
+        
+            # Generate and save vectors for the texts that are not duplicates
+            keep = [row for row in range(len(batch)) if row not in duplicates]
+            duplicate_count += len(batch) - len(keep)
+            if keep:
+                vector_ids = vector_manager.add_to_index(vectors[keep])
+                vector_manager.add_metadata(
+                    vector_ids,
+                    [batch[row].id for row in keep],
+                    [batch[row].source_file for row in keep],
+                    [(0, len(batch[row].content)) for row in keep]
+                )
+                for vector_id, row in zip(vector_ids, keep):
+                    pending_vectors.append((int(vector_id), batch[row].id))
+                    lexical_index.add(batch[row].id, processed_texts[row])
+            
+            progress.update(len(batch))
+            # A checkpoint also releases the buffered vectors, metadata and postings
+            if len(pending_texts) >= checkpoint_every:
+                checkpoint()
+            elif (pending_texts and (early_checkpoint_helped or len(pending_texts) >= min_early_checkpoint)
+                  and budget.over_limit()):
+                rss_before = budget.rss(fresh=True)
+                checkpoint()
+                rss_after = budget.rss(fresh=True)
+                early_checkpoint_helped = rss_before is not None and rss_after is not None and rss_after < rss_before
+    progress.close()
     
-    # Save the FAISS index
-    vector_manager.save_index(os.path.join(VECTOR_DIR, 'faiss_index'))
+    # Commit the remaining texts as the final checkpoint
+    if pending_texts:
+        checkpoint()
+    else:
+        lexical_index.flush()
+        vector_manager.save_index()
+        lexical_index.maybe_merge()
+    if dedup_threshold is not None:
+        print(f"Skipped {duplicate_count} near-duplicate texts")
     print("Text processing and vectorization complete")
 
+def watch(input_dir: str, loader_args: Dict, audio_workers: int = 1, poll_interval: float = 2.0,
+          settle_seconds: float = 2.0, force_polling: bool = False, budget: Optional[MemoryBudget] = None,
+          retry_seconds: float = 30.0, **text_args):
+    """Ingest and vectorize files as they arrive in `input_dir` until interrupted
+
+    Loaders, Whisper and the embedding model stay loaded between files. New or
+    changed files are detected with inotify (or by polling every
+    `poll_interval` seconds where inotify is unavailable) and handed over once
+    their size and mtime have not changed for `settle_seconds`. The (size,
+    mtime) of every handled file is kept in DATA_DIR/watch_state.json, so a
+    restarted watcher only picks up files that arrived while it was down.
+    `text_args` are passed to `process_texts`, and the memory `budget` to
+    both stages.
+
+    Files that fail to load are retried after `retry_seconds`, doubling up
+    to an hour. A failed vectorization pass (e.g. a lost database connection)
+    is logged and run again on the next cycle.
+
+    The pipeline's own files (VECTOR_DIR, the caches and the state file) are
+    never ingested, so `input_dir` may contain them.
+    """
+    embedding_backend = text_args.pop('embedding_backend', None)
+    embedding_model = text_args.pop('embedding_model', None)
+    state_path = os.path.join(DATA_DIR, 'watch_state.json')
+    # data/cache holds the LLM response and logo caches of generate_document.py
+    excluded = [VECTOR_DIR, state_path, os.path.join(DATA_DIR, 'cache'), os.path.join('data', 'cache')]
+    if loader_args.get('audio_cache_dir'):
+        excluded.append(loader_args['audio_cache_dir'])
+    if is_excluded(input_dir, excluded):
+        raise ValueError(f"{input_dir} holds the pipeline's own index or cache files and cannot be watched")
+    
+    db_manager = DatabaseManager()
+    loaders = FileLoaders(db_manager, budget=budget, **loader_args)
+    loaders.preload_audio(max(1, audio_workers))
+    resident = {
+        'db_manager': db_manager,
+        'text_processor': TextPreprocessor(),
+        'vector_manager': open_vector_manager(embedding_backend, embedding_model),
+        'lexical_index': LexicalIndex(os.path.join(VECTOR_DIR, 'lexical_index')),
+    }
+
+    os.makedirs(DATA_DIR, exist_ok=True)
+    handled = {}
+    if os.path.exists(state_path):
+        with open(state_path, 'r', encoding='utf-8') as f:
+            handled = json.load(f)
+
+    watcher = create_watcher([input_dir], poll_interval, force_polling, excluded)
+    debouncer = Debouncer(settle_seconds)
+    debouncer.add(path for path in walk_files([input_dir], excluded)
+                  if list(file_signature(path) or ()) != handled.get(path))
+    print(f"Watching {input_dir} with {type(watcher).__name__}")
+    retries = {}  # path -> (failed attempts, monotonic time of the next attempt)
+    vectorize = False
+    try:
+        while True:
+            debouncer.add(watcher.poll(0.5 if len(debouncer) or vectorize else poll_interval))
+            now = time.monotonic()
+            for path, (attempts, retry_at) in list(retries.items()):
+                if retry_at <= now:
+                    # Handed to the debouncer once; rescheduled if it fails again
+                    retries[path] = (attempts, float('inf'))
+                    debouncer.add([path])
+                elif not os.path.exists(path):
+                    del retries[path]
+            ready = {path: signature for path, signature in debouncer.ready().items()
+                     if list(signature) != handled.get(path)}
+            
+            if ready:
+                results = process_files(list(ready), workers=1, audio_workers=audio_workers, loaders=loaders,
+                                        budget=budget)
+                for file_path, error in results['failed']:
+                    attempts = retries.get(file_path, (0, 0.0))[0] + 1
+                    delay = min(3600.0, retry_seconds * 2 ** (attempts - 1))
+                    retries[file_path] = (attempts, time.monotonic() + delay)
+                    print(f"  {file_path}: {error} (retrying in {delay:.0f}s)")
+                # Failed files are not recorded, so a restart retries them as well
+                for file_path in results['success']:
+                    retries.pop(file_path, None)
+                    handled[file_path] = list(ready[file_path])
+                atomic_write_bytes(state_path, json.dumps(handled).encode('utf-8'))
+                vectorize = vectorize or bool(results['success'])
+            if not vectorize:
+                continue
+            
+            try:
+                process_texts(**text_args, **resident, budget=budget)
+                vectorize = False
+            except Exception as e:
+                print(f"Vectorization failed, retrying on the next cycle: {e}")
+                # Drop vectors and postings buffered by the failed pass; reopening also
+                # discards metadata that ran ahead of the last index commit. The
+                # embedding model stays loaded.
+                resident['vector_manager'] = VectorManager(
+                    embedding_model, VECTOR_DIMENSION, index_dir=os.path.join(VECTOR_DIR, 'index_store'),
+                    backend=resident['vector_manager'].backend
+                )
+                resident['lexical_index'] = LexicalIndex(os.path.join(VECTOR_DIR, 'lexical_index'))
+                time.sleep(poll_interval)
+    except KeyboardInterrupt:
+        print("Stopped watching")
+    finally:
+        watcher.close()
+
 def main():
     parser = argparse.ArgumentParser(description='Data Processing Pipeline')
     parser.add_argument('--input_dir', type=str, help='Directory containing input files')
     parser.add_argument('--text_column', type=str, help='Column name for structured data files')
     parser.add_argument('--text_fields', type=str, nargs='+', help='Field names for JSON files')
     parser.add_argument('--text_tags', type=str, nargs='+', help='Tag names for XML files')
+    parser.add_argument('--whisper_quantize', action='store_true', help='Run Whisper with dynamic int8 quantization (CPU only)')
+    parser.add_argument('--torch_threads', type=int, help='Number of torch threads for Whisper CPU inference')
+    parser.add_argument('--audio_cache_dir',
+                        help='Cache decoded audio in this directory for later runs (e.g. data/cache/audio)')
+    parser.add_argument('--workers', type=int, default=4, help='Processes loading non-audio files in parallel')
+    parser.add_argument('--audio_workers', type=int, default=1, help='Threads transcribing audio, each with its own Whisper model')
+    parser.add_argument('--batch_size', type=int, default=256, help='Number of texts vectorized per batch')
+    parser.add_argument('--checkpoint_every', type=int, default=5000,
+                        help='Flush the index and commit progress to the database every N texts')
+    parser.add_argument('--dedup_threshold', type=float,
+                        help='Skip indexing texts whose cosine similarity to an indexed text is at least this value (e.g. 0.95)')
+    parser.add_argument('--embedding_backend', choices=list(EMBEDDING_BACKENDS),
+                        help='Embedding backend (defaults to EMBEDDING_BACKEND in config, else fasttext)')
+    parser.add_argument('--embedding_model', help='Model path for the embedding backend (defaults to EMBEDDING_MODEL in config)')
+    parser.add_argument('--backfill_text_vectors', action='store_true',
+                        help='Record the vector ids of texts indexed before filtered search was available')
+    parser.add_argument('--export_dir', help='Export indexed texts and their vectors to partitioned files in this directory')
+    parser.add_argument('--export_format', choices=list(EXPORT_FORMATS), default='parquet',
+                        help='File format of --export_dir')
+    parser.add_argument('--import_dir', help='Rebuild an empty vector index from the files of an --export_dir run')
+    parser.add_argument('--watch', action='store_true',
+                        help='Keep running and ingest files as they arrive in --input_dir')
+    parser.add_argument('--poll_interval', type=float, default=2.0,
+                        help='Seconds between directory scans when watching without inotify')
+    parser.add_argument('--settle_seconds', type=float, default=2.0,
+                        help='Seconds a watched file must stay unchanged before it is ingested')
+    parser.add_argument('--force_polling', action='store_true', help='Watch by polling even where inotify is available')
+    parser.add_argument('--max_rss', type=parse_size,
+                        help='Anonymous memory budget for loading and vectorizing (e.g. 4G): intake pauses and batches shrink near it')
+    parser.add_argument('--migrate_content_hash', action='store_true',
+                        help='Add content hashes to an existing text_data table and merge identical texts')
     
     args = parser.parse_args()
+    budget = MemoryBudget(args.max_rss)
+    
+    if args.migrate_content_hash:
+        migrate_content_hashes()
+    
+    if args.backfill_text_vectors:
+        backfill_text_vectors()
+    
+    if args.export_dir or args.import_dir:
+        if args.export_dir:
+            exported = export_texts(open_vector_manager(args.embedding_backend, args.embedding_model, read_only=True),
+                                    DatabaseManager(text_cache_bytes=0), args.export_dir,
+                                    file_format=args.export_format)
+            print(f"Exported {exported} texts to {args.export_dir}")
+        if args.import_dir:
+            import_exported_texts(args.import_dir, args.embedding_backend, args.embedding_model)
+        return
+    
+    if args.watch:
+        if not args.input_dir:
+            parser.error('--watch requires --input_dir')
+        watch(
+            args.input_dir,
+            {'text_column': args.text_column, 'text_fields': args.text_fields, 'text_tags': args.text_tags,
+             'whisper_quantize': args.whisper_quantize, 'torch_threads': args.torch_threads,
+             'audio_cache_dir': args.audio_cache_dir},
+            args.audio_workers, args.poll_interval, args.settle_seconds, args.force_polling, budget,
+            batch_size=args.batch_size, dedup_threshold=args.dedup_threshold, checkpoint_every=args.checkpoint_every,
+            embedding_backend=args.embedding_backend, embedding_model=args.embedding_model
+        )
+        return
     
     if args.input_dir:
         # Get all files in input directory
@@ -116,21 +615,32 @@ def main():
                 file_paths.append(os.path.join(root, file))
         
         # Process files
-        results = process_files(
-            file_paths,
-            args.text_column,
-            args.text_fields,
-            args.text_tags
-        )
+        with budget.stage('load_files'):
+            results = process_files(
+                file_paths,
+                args.text_column,
+                args.text_fields,
+                args.text_tags,
+                args.whisper_quantize,
+                args.torch_threads,
+                args.workers,
+                args.audio_workers,
+                budget=budget,
+                audio_cache_dir=args.audio_cache_dir
+            )
         
         print(f"\nProcessed {len(results['success'])} files successfully")
+        print(results['report'].format())
         if results['failed']:
             print(f"Failed to process {len(results['failed'])} files:")
             for file_path, error in results['failed']:
                 print(f"  {file_path}: {error}")
     
     # Process and vectorize texts
-    process_texts()
+    with budget.stage('vectorize'):
+        process_texts(args.batch_size, args.dedup_threshold, args.checkpoint_every,
+                      args.embedding_backend, args.embedding_model, budget=budget)
+    print(budget.format())
 
 if __name__ == "__main__":
     main()
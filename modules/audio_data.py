@@ -1,14 +1,22 @@
-import whisper
 import os
 import uuid
-from typing import Dict, Any
+from typing import Dict, Any, Optional
 from utils.db_utils import DatabaseManager
+from utils.audio_cache import DecodedAudioCache
+from utils.source_metadata import load_video_metadata
+from utils.whisper_utils import load_whisper_model
 
 class AudioProcessor:
-    def __init__(self, db_manager: DatabaseManager, model_size: str = 'base'):
-        """Initialize with specified Whisper model size"""
-        self.model = whisper.load_model(model_size)
+    def __init__(self, db_manager: DatabaseManager, model_size: str = 'base', quantize: bool = False,
+                 num_threads: Optional[int] = None, audio_cache_dir: Optional[str] = None,
+                 metadata_dir: Optional[str] = 'data/metadata'):
+        """Initialize with specified Whisper model size (optionally int8-quantized for CPU).
+        With `audio_cache_dir`, decoded audio is cached there for later runs.
+        Video metadata saved by YouTubeDownloader is read from `metadata_dir`."""
+        self.model = load_whisper_model(model_size, quantize=quantize, num_threads=num_threads)
+        self.audio_cache = DecodedAudioCache(audio_cache_dir) if audio_cache_dir else None
         self.db_manager = db_manager
+        self.metadata_dir = metadata_dir
 
     def transcribe_audio(self, file_path: str, save_transcript: bool = True) -> Dict[str, Any]:
         """Transcribe audio file using Whisper"""
@@ -20,8 +28,9 @@ class AudioProcessor:
             if not file_path.lower().endswith(('.mp3', '.mp4', '.wav', '.m4a')):
                 raise ValueError("Unsupported audio format")
 
-            # Transcribe audio
-            result = self.model.transcribe(file_path)
+            # Transcribe audio, reusing previously decoded samples when available
+            audio = self.audio_cache.load(file_path) if self.audio_cache else file_path
+            result = self.model.transcribe(audio, fp16=self.model.device.type == 'cuda')
             transcript = result["text"]
 
             if not transcript.strip():
@@ -32,12 +41,15 @@ class AudioProcessor:
                 # Generate unique ID for this transcript
                 text_id = str(uuid.uuid4())
                 
-                # Save to database
-                self.db_manager.save_text_data(
+                # Save to database; an identical transcript already stored keeps its id
+                text_id = self.db_manager.save_text_data(
                     text_id=text_id,
                     source_file=file_path,
                     content=transcript
                 )
+                video_metadata = load_video_metadata(file_path, self.metadata_dir) if self.metadata_dir else None
+                if video_metadata:
+                    self.db_manager.save_source_metadata(text_id, video_metadata)
 
                 return {
                     "status": "success",
@@ -1,11 +1,14 @@
 from pdfminer.high_level import extract_text
 import uuid
-from typing import Dict, Any
+from typing import Dict, Any, Optional
 from utils.db_utils import DatabaseManager
+from utils.source_metadata import load_video_metadata, split_participants_header
 
 class DocumentLoader:
-    def __init__(self, db_manager: DatabaseManager):
+    def __init__(self, db_manager: DatabaseManager, metadata_dir: Optional[str] = 'data/metadata'):
+        """Transcripts are matched by file name to video metadata in `metadata_dir`"""
         self.db_manager = db_manager
+        self.metadata_dir = metadata_dir
 
     def load_pdf(self, file_path: str) -> Dict[str, Any]:
         """Load and process PDF file"""
@@ -17,9 +20,8 @@ class DocumentLoader:
                 return {"status": "error", "message": "No text content found in PDF"}
             
             # Save to database
-            text_id = str(uuid.uuid4())
-            self.db_manager.save_text_data(
-                text_id=text_id,
+            text_id = self.db_manager.save_text_data(
+                text_id=str(uuid.uuid4()),
                 source_file=file_path,
                 content=text
             )
@@ -30,23 +32,26 @@ class DocumentLoader:
             return {"status": "error", "message": str(e)}
 
     def load_txt(self, file_path: str) -> Dict[str, Any]:
-        """Load and process text file"""
+        """Load and process text file (transcripts carry a "Participants:" header)"""
         try:
             with open(file_path, 'r', encoding='utf-8') as f:
-                text = f.read()
+                participants, text = split_participants_header(f.read())
             
             if not text.strip():
                 return {"status": "error", "message": "Empty text file"}
             
             # Save to database
-            text_id = str(uuid.uuid4())
-            self.db_manager.save_text_data(
-                text_id=text_id,
+            text_id = self.db_manager.save_text_data(
+                text_id=str(uuid.uuid4()),
                 source_file=file_path,
                 content=text
             )
+            self.db_manager.save_participants(text_id, participants)
+            video_metadata = load_video_metadata(file_path, self.metadata_dir) if self.metadata_dir else None
+            if video_metadata:
+                self.db_manager.save_source_metadata(text_id, video_metadata)
             
-            return {"status": "success", "text_id": text_id}
+            return {"status": "success", "text_id": text_id, "participants": participants}
         
         except Exception as e:
             return {"status": "error", "message": str(e)}
@@ -1,5 +1,8 @@
 import pandas as pd
-from typing import Union, Dict, Any
+import openpyxl
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+from typing import Union, Dict, Any, Optional
 from utils.db_utils import DatabaseManager
 import uuid
 
@@ -7,44 +10,97 @@ class StructuredDataLoader:
     def __init__(self, db_manager: DatabaseManager):
         self.db_manager = db_manager
 
-    def load_csv(self, file_path: str, text_column: str) -> Dict[str, Any]:
-        """Load and process CSV file"""
+    def load_csv(self, file_path: str, text_column: str, chunk_size: int = 10000) -> Dict[str, Any]:
+        """Load and process CSV file.
+
+        Only the text column is read, `chunk_size` rows at a time, and each
+        chunk is inserted in one batch.
+        """
         try:
-            df = pd.read_csv(file_path)
-            if text_column not in df.columns:
+            if text_column not in pd.read_csv(file_path, nrows=0).columns:
                 raise ValueError(f"Column {text_column} not found in CSV file")
             
-            # Process each text entry
-            for _, row in df.iterrows():
-                text_id = str(uuid.uuid4())
-                self.db_manager.save_text_data(
-                    text_id=text_id,
-                    source_file=file_path,
-                    content=row[text_column]
-                )
+            rows_processed = 0
+            for chunk in pd.read_csv(file_path, usecols=[text_column], chunksize=chunk_size):
+                rows = [(str(uuid.uuid4()), file_path, str(content)) for content in chunk[text_column].dropna()]
+                self.db_manager.save_text_data_batch(rows)
+                rows_processed += len(rows)
             
-            return {"status": "success", "rows_processed": len(df)}
+            return {"status": "success", "rows_processed": rows_processed}
         
         except Exception as e:
             return {"status": "error", "message": str(e)}
 
-    def load_xlsx(self, file_path: str, text_column: str, sheet_name: Union[str, int] = 0) -> Dict[str, Any]:
-        """Load and process Excel file"""
+    def load_xlsx(self, file_path: str, text_column: str, sheet_name: Optional[Union[str, int]] = None,
+                  batch_size: int = 1000, max_workers: int = 4) -> Dict[str, Any]:
+        """Load and process Excel file.
+
+        .xlsx workbooks are streamed with openpyxl in read-only mode: only the
+        text column is read and rows are inserted in batches of `batch_size`,
+        so memory stays bounded by the batch rather than the workbook. Every
+        sheet is loaded unless `sheet_name` (name or index) is given; sheets
+        without `text_column` are skipped. Legacy .xls files go through pandas.
+        """
+        if Path(file_path).suffix.lower() == '.xls':
+            return self._load_xls(file_path, text_column, 0 if sheet_name is None else sheet_name)
         try:
-            df = pd.read_excel(file_path, sheet_name=sheet_name)
+            workbook = openpyxl.load_workbook(file_path, read_only=True, data_only=True)
+            try:
+                sheet_names = workbook.sheetnames
+            finally:
+                workbook.close()
+            if sheet_name is not None:
+                sheet_names = [sheet_names[sheet_name] if isinstance(sheet_name, int) else sheet_name]
+
+            # Each worker opens its own read-only workbook: openpyxl's streaming
+            # readers are not safe to share between threads
+            workers = max(1, min(max_workers, len(sheet_names)))
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                counts = list(executor.map(
+                    lambda name: self._load_sheet(file_path, name, text_column, batch_size), sheet_names
+                ))
+
+            sheets = {name: count for name, count in zip(sheet_names, counts) if count is not None}
+            if not sheets:
+                raise ValueError(f"Column {text_column} not found in Excel file")
+            return {"status": "success", "rows_processed": sum(sheets.values()), "sheets": sheets}
+
+        except Exception as e:
+            return {"status": "error", "message": str(e)}
+
+    def _load_sheet(self, file_path: str, sheet_name: str, text_column: str, batch_size: int) -> Optional[int]:
+        """Stream one sheet's text column into the database; None if the sheet lacks the column"""
+        workbook = openpyxl.load_workbook(file_path, read_only=True, data_only=True)
+        try:
+            worksheet = workbook[sheet_name]
+            header = next(worksheet.iter_rows(min_row=1, max_row=1, values_only=True), ())
+            if text_column not in header:
+                return None
+            column = header.index(text_column) + 1
+
+            rows_processed, batch = 0, []
+            for (value,) in worksheet.iter_rows(min_row=2, min_col=column, max_col=column, values_only=True):
+                if value is None or (isinstance(value, str) and not value.strip()):
+                    continue
+                batch.append((str(uuid.uuid4()), file_path, str(value)))
+                if len(batch) >= batch_size:
+                    rows_processed += len(self.db_manager.save_text_data_batch(batch))
+                    batch = []
+            rows_processed += len(self.db_manager.save_text_data_batch(batch))
+            return rows_processed
+        finally:
+            workbook.close()
+
+    def _load_xls(self, file_path: str, text_column: str, sheet_name: Union[str, int]) -> Dict[str, Any]:
+        """Load a legacy .xls sheet, which openpyxl cannot read"""
+        try:
+            df = pd.read_excel(file_path, sheet_name=sheet_name, usecols=lambda column: column == text_column)
             if text_column not in df.columns:
                 raise ValueError(f"Column {text_column} not found in Excel file")
-            
-            # Process each text entry
-            for _, row in df.iterrows():
-                text_id = str(uuid.uuid4())
-                self.db_manager.save_text_data(
-                    text_id=text_id,
-                    source_file=file_path,
-                    content=row[text_column]
-                )
-            
-            return {"status": "success", "rows_processed": len(df)}
-        
+
+            rows = [(str(uuid.uuid4()), file_path, str(content)) for content in df[text_column].dropna()]
+            self.db_manager.save_text_data_batch(rows)
+            return {"status": "success", "rows_processed": len(rows)}
+
         except Exception as e:
             return {"status": "error", "message": str(e)}
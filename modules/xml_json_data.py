@@ -8,7 +8,16 @@ class XMLJSONLoader:
     def __init__(self, db_manager: DatabaseManager):
         self.db_manager = db_manager
 
-    def load_json(self, file_path: str, text_fields: Union[str, list]) -> Dict[str, Any]:
+    def _save_texts(self, file_path: str, texts: list, batch_size: int) -> list:
+        """Insert texts `batch_size` at a time and return their text ids"""
+        text_ids = []
+        for start in range(0, len(texts), batch_size):
+            text_ids.extend(self.db_manager.save_text_data_batch(
+                [(str(uuid.uuid4()), file_path, text) for text in texts[start:start + batch_size]]
+            ))
+        return text_ids
+
+    def load_json(self, file_path: str, text_fields: Union[str, list], batch_size: int = 1000) -> Dict[str, Any]:
         """Load and process JSON file"""
         try:
             with open(file_path, 'r', encoding='utf-8') as f:
@@ -37,56 +46,46 @@ class XMLJSONLoader:
             if not processed_texts:
                 return {"status": "error", "message": f"No text found in fields: {text_fields}"}
 
-            # Save each text to database
-            text_ids = []
-            for text in processed_texts:
-                text_id = str(uuid.uuid4())
-                self.db_manager.save_text_data(
-                    text_id=text_id,
-                    source_file=file_path,
-                    content=text
-                )
-                text_ids.append(text_id)
+            # Release the parsed document, then save the texts to database in batches
+            del data
+            text_ids = self._save_texts(file_path, processed_texts, batch_size)
 
             return {"status": "success", "text_ids": text_ids}
 
         except Exception as e:
             return {"status": "error", "message": str(e)}
 
-    def load_xml(self, file_path: str, text_tags: Union[str, list]) -> Dict[str, Any]:
-        """Load and process XML file"""
-        try:
-            tree = ET.parse(file_path)
-            root = tree.getroot()
+    def load_xml(self, file_path: str, text_tags: Union[str, list], batch_size: int = 1000) -> Dict[str, Any]:
+        """Load and process XML file.
 
+        The document is parsed incrementally and every element is cleared once
+        read, so the full tree is never held in memory.
+        """
+        try:
             if isinstance(text_tags, str):
                 text_tags = [text_tags]
 
+            # Texts are kept in document order: a slot is reserved when a text
+            # tag opens and filled when it closes
             processed_texts = []
-            
-            def extract_text_from_element(element):
+            open_slots = []
+            for event, element in ET.iterparse(file_path, events=('start', 'end')):
+                if event == 'start':
+                    if element.tag in text_tags:
+                        open_slots.append(len(processed_texts))
+                        processed_texts.append(None)
+                    continue
                 if element.tag in text_tags:
                     text = element.text
-                    if text and text.strip():
-                        processed_texts.append(text.strip())
-                for child in element:
-                    extract_text_from_element(child)
-
-            extract_text_from_element(root)
+                    processed_texts[open_slots.pop()] = text.strip() if text and text.strip() else None
+                element.clear()
+            processed_texts = [text for text in processed_texts if text is not None]
 
             if not processed_texts:
                 return {"status": "error", "message": f"No text found in tags: {text_tags}"}
 
-            # Save each text to database
-            text_ids = []
-            for text in processed_texts:
-                text_id = str(uuid.uuid4())
-                self.db_manager.save_text_data(
-                    text_id=text_id,
-                    source_file=file_path,
-                    content=text
-                )
-                text_ids.append(text_id)
+            # Save the texts to database in batches
+            text_ids = self._save_texts(file_path, processed_texts, batch_size)
 
             return {"status": "success", "text_ids": text_ids}
 
@@ -0,0 +1,381 @@
+import os
+import json
+import time
+import queue
+import argparse
+import threading
+import numpy as np
+from collections import deque
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from socketserver import ThreadingMixIn, UnixStreamServer
+from typing import Dict, List, Optional
+from urllib.parse import parse_qs, urlparse
+
+from config import VECTOR_DIMENSION, VECTOR_DIR
+from utils.embedding_backends import EMBEDDING_BACKENDS, configured_backend
+from utils.db_utils import DatabaseManager
+from utils.hybrid_search import FILTER_KEYS, SEARCH_MODES, filtered_search, reciprocal_rank_fusion
+from utils.lexical_index import LexicalIndex
+from utils.text_utils import TextPreprocessor
+from utils.vector_utils import VectorManager
+
+
+def _manifest_version(path: str) -> Optional[int]:
+    try:
+        return os.stat(path).st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+
+class LatencyTracker:
+    """Keeps the most recent request latencies and reports percentiles"""
+
+    def __init__(self, max_samples: int = 10000):
+        self.samples = deque(maxlen=max_samples)
+        self.batch_sizes = deque(maxlen=max_samples)
+        self.total_requests = 0
+        self.lock = threading.Lock()
+
+    def record(self, latency_ms: float):
+        with self.lock:
+            self.samples.append(latency_ms)
+            self.total_requests += 1
+
+    def record_batch(self, size: int):
+        with self.lock:
+            self.batch_sizes.append(size)
+
+    def summary(self) -> Dict:
+        with self.lock:
+            samples = np.array(self.samples, dtype='float64')
+            batch_sizes = np.array(self.batch_sizes, dtype='float64')
+            total = self.total_requests
+        summary = {'total_requests': total, 'window': int(len(samples))}
+        if len(samples):
+            for p in (50, 90, 95, 99):
+                summary[f"p{p}_ms"] = round(float(np.percentile(samples, p)), 3)
+            summary['max_ms'] = round(float(samples.max()), 3)
+        if len(batch_sizes):
+            summary['mean_batch_size'] = round(float(batch_sizes.mean()), 2)
+        return summary
+
+
+class MicroBatchSearcher:
+    """Collects concurrent queries for a short window and answers them with
+    one embedding pass and one index search (filtered queries search only
+    the vectors their filter allows). Every `refresh_interval` seconds the
+    on-disk indexes are reopened if another process committed to them."""
+
+    def __init__(self, vector_manager: VectorManager, text_processor: TextPreprocessor,
+                 batch_window_ms: float = 5.0, max_batch_size: int = 64,
+                 lexical_index: Optional[LexicalIndex] = None, candidates: int = 50,
+                 db_manager: Optional[DatabaseManager] = None, refresh_interval: Optional[float] = 2.0,
+                 max_k: int = 1000):
+        self.vector_manager = vector_manager
+        self.db_manager = db_manager
+        self.text_processor = text_processor
+        self.lexical_index = lexical_index
+        self.candidates = candidates
+        self.max_k = max_k
+        self.batch_window = batch_window_ms / 1000.0
+        self.max_batch_size = max_batch_size
+        self.refresh_interval = refresh_interval
+        self._next_refresh = time.monotonic() + (refresh_interval or 0.0)
+        self._lexical_version = _manifest_version(lexical_index.manifest_path) if lexical_index else None
+        self.latency = LatencyTracker()
+        self._queue = queue.Queue()
+        self._stopped = threading.Event()
+        self._worker = threading.Thread(target=self._run, name='micro-batcher', daemon=True)
+        self._worker.start()
+
+    def search(self, query: str, k: int = 5, mode: str = 'dense', timeout: Optional[float] = 30.0,
+               filters: Optional[Dict] = None, include_text: bool = False) -> List[Dict]:
+        """Answer a query; dense lookups block until their batch has been searched.
+        `filters` (participants, uploader, date_from, date_to) restrict the search
+        to the matching texts (see utils.hybrid_search.filtered_search). With
+        `include_text`, every hit carries its text."""
+        start = time.perf_counter()
+        try:
+            if k > self.max_k:
+                raise ValueError(f"k must be at most {self.max_k}")
+            if mode not in SEARCH_MODES:
+                raise ValueError(f"Unknown search mode: {mode}. Use one of {SEARCH_MODES}")
+            if mode != 'dense' and self.lexical_index is None:
+                raise ValueError("Lexical search is not enabled on this service")
+            if include_text and self.db_manager is None:
+                raise ValueError("Returning texts requires a database connection")
+            results = filtered_search(
+                lambda k, allowed_vector_ids, allowed_text_ids:
+                    self._search(query, k, mode, timeout, allowed_vector_ids, allowed_text_ids),
+                self.db_manager, filters, k, self.vector_manager.store.ntotal
+            )
+            if include_text:
+                self._attach_texts(results)
+            return results
+        finally:
+            self.latency.record((time.perf_counter() - start) * 1000.0)
+
+    def _attach_texts(self, results: List[Dict]):
+        """Add the content of every hit, fetched in one query (or from the row cache)"""
+        rows = self.db_manager.get_texts_by_ids([hit['text_id'] for hit in results if hit.get('text_id')])
+        for hit in results:
+            row = rows.get(hit.get('text_id'))
+            if row is not None:
+                hit['content'] = row.content
+
+    def _search(self, query: str, k: int, mode: str, timeout: Optional[float],
+                allowed_vector_ids: Optional[np.ndarray], allowed_text_ids: Optional[set]) -> List[Dict]:
+        if mode == 'dense':
+            return self._dense_search(query, k, timeout, allowed_vector_ids)
+
+        depth = max(k, self.candidates)
+        processed_query = self.text_processor.preprocess_text(query)
+        rankings = [[text_id for text_id, _ in self.lexical_index.search(processed_query, depth, allowed_text_ids)]]
+        if mode == 'hybrid':
+            dense_ids = []
+            for hit in self._dense_search(query, depth, timeout, allowed_vector_ids):
+                if hit.get('text_id') and hit['text_id'] not in dense_ids:
+                    dense_ids.append(hit['text_id'])
+            rankings.insert(0, dense_ids)
+        return [{'text_id': text_id, 'score': score}
+                for text_id, score in reciprocal_rank_fusion(rankings)[:k]]
+
+    def _dense_search(self, query: str, k: int, timeout: Optional[float],
+                      allowed_ids: Optional[np.ndarray] = None) -> List[Dict]:
+        future = Future()
+        self._queue.put((query, k, allowed_ids, future))
+        return future.result(timeout=timeout)
+
+    def stats(self) -> Dict:
+        """Latency summary, plus the text row cache counters when texts are served"""
+        stats = self.latency.summary()
+        cache = self.db_manager.text_cache if self.db_manager is not None else None
+        if cache is not None:
+            stats['text_cache'] = {'rows': len(cache), 'bytes': cache.size, 'hits': cache.hits, 'misses': cache.misses}
+        return stats
+
+    def stop(self):
+        self._stopped.set()
+        self._worker.join()
+
+    def _collect_batch(self) -> list:
+        try:
+            batch = [self._queue.get(timeout=0.1)]
+        except queue.Empty:
+            return []
+        deadline = time.perf_counter() + self.batch_window
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _refresh(self):
+        """Reopen the vector and lexical indexes after new texts were committed.
+
+        Texts are written by other processes (`main.py`), whose updates never
+        reach this process's row cache, so the cache is cleared whenever an
+        index changed: every write to text_data is followed by an index commit.
+        """
+        self._next_refresh = time.monotonic() + self.refresh_interval
+        changed = False
+        try:
+            changed = self.vector_manager.refresh()
+            if self.lexical_index is not None:
+                version = _manifest_version(self.lexical_index.manifest_path)
+                if version != self._lexical_version:
+                    lexical_index = self.lexical_index
+                    self.lexical_index = LexicalIndex(lexical_index.index_dir, lexical_index.k1, lexical_index.b)
+                    self._lexical_version = version
+                    changed = True
+        except (OSError, ValueError):
+            # Caught mid-commit; the current indexes stay in use until the next refresh
+            pass
+        cache = self.db_manager.text_cache if self.db_manager is not None else None
+        if changed and cache is not None:
+            cache.invalidate()
+
+    def _run(self):
+        while not self._stopped.is_set():
+            if self.refresh_interval is not None and time.monotonic() >= self._next_refresh:
+                self._refresh()
+            batch = self._collect_batch()
+            if not batch:
+                continue
+            try:
+                self._search_batch(batch)
+            except Exception as e:
+                for *_, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+
+    def _search_batch(self, batch: list):
+        self.latency.record_batch(len(batch))
+        queries = [self.text_processor.preprocess_text(query) for query, _, _, _ in batch]
+        query_vectors = self.vector_manager.batch_to_vectors(queries)
+        max_k = max(k for _, k, _, _ in batch)
+
+        # Unfiltered queries share one index pass; filtered ones each search their own subset
+        distances = np.full((len(batch), max_k), np.inf, dtype='float32')
+        vector_ids = np.full((len(batch), max_k), -1, dtype='int64')
+        unfiltered = [row for row, (_, _, allowed_ids, _) in enumerate(batch) if allowed_ids is None]
+        if unfiltered:
+            distances[unfiltered], vector_ids[unfiltered] = self.vector_manager.search_batch(
+                query_vectors[unfiltered], max_k
+            )
+        for row, (_, k, allowed_ids, _) in enumerate(batch):
+            if allowed_ids is not None:
+                distances[row, :k], vector_ids[row, :k] = self.vector_manager.search_batch(
+                    query_vectors[row], k, allowed_ids
+                )
+
+        # One metadata lookup for every hit in the batch
+        metadata = self.vector_manager.lookup_metadata(vector_ids.ravel())
+        metadata = [metadata[i * max_k:(i + 1) * max_k] for i in range(len(batch))]
+
+        for row, (_, k, _, future) in enumerate(batch):
+            hits = []
+            for distance, vector_id, meta in zip(distances[row, :k], vector_ids[row, :k], metadata[row][:k]):
+                if vector_id < 0:
+                    continue
+                hit = {'vector_id': int(vector_id), 'distance': float(distance)}
+                if meta:
+                    hit.update(text_id=meta['text_id'], source_file=meta['source_file'])
+                hits.append(hit)
+            future.set_result(hits)
+
+
+class SearchRequestHandler(BaseHTTPRequestHandler):
+    """GET /search?q=...&k=5&mode=dense[&participant=...&uploader=...&date_from=...&date_to=...][&text=1],
+    POST /search {"query": ..., "k": ..., "mode": ..., "filters": {...}, "include_text": ...}, GET /stats, GET /health"""
+
+    searcher: MicroBatchSearcher = None
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path == '/search':
+            params = parse_qs(url.query)
+            filters = {key: params[key][0] for key in FILTER_KEYS if key in params}
+            if 'participant' in params:
+                filters['participants'] = params['participant']
+            self._handle_search(params.get('q', [''])[0], params.get('k', ['5'])[0], params.get('mode', ['dense'])[0],
+                                filters, params.get('text', ['0'])[0] in ('1', 'true'))
+        elif url.path == '/stats':
+            self._send_json(200, self.searcher.stats())
+        elif url.path == '/health':
+            self._send_json(200, {'status': 'ok'})
+        else:
+            self._send_json(404, {'status': 'error', 'message': f"Unknown path: {url.path}"})
+
+    def do_POST(self):
+        if urlparse(self.path).path != '/search':
+            self._send_json(404, {'status': 'error', 'message': f"Unknown path: {self.path}"})
+            return
+        try:
+            length = int(self.headers.get('Content-Length', 0))
+            body = json.loads(self.rfile.read(length) or b'{}')
+            if not isinstance(body, dict):
+                raise ValueError("The request body must be a JSON object")
+        except ValueError as e:
+            self._send_json(400, {'status': 'error', 'message': str(e)})
+            return
+        self._handle_search(body.get('query', ''), body.get('k', 5), body.get('mode', 'dense'), body.get('filters'),
+                            bool(body.get('include_text')))
+
+    def _handle_search(self, query: str, k, mode: str, filters: Optional[Dict] = None, include_text: bool = False):
+        try:
+            if not isinstance(query, str) or not isinstance(mode, str):
+                raise ValueError("query and mode must be strings")
+            try:
+                k = int(k)
+            except TypeError:
+                raise ValueError(f"k must be an integer, got {k!r}")
+            if not query.strip() or k <= 0:
+                raise ValueError("A non-empty query and a positive k are required")
+            results = self.searcher.search(query, k, mode, filters=filters, include_text=include_text)
+            self._send_json(200, {'status': 'success', 'results': results})
+        except ValueError as e:
+            self._send_json(400, {'status': 'error', 'message': str(e)})
+        except Exception as e:
+            self._send_json(500, {'status': 'error', 'message': str(e)})
+
+    def _send_json(self, status: int, payload: Dict):
+        body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def address_string(self):
+        # Unix socket clients have no (host, port) address
+        return self.client_address[0] if isinstance(self.client_address, tuple) else 'unix'
+
+    def log_message(self, format, *args):
+        pass
+
+
+class ThreadingUnixHTTPServer(ThreadingMixIn, UnixStreamServer):
+    daemon_threads = True
+
+
+def create_server(searcher: MicroBatchSearcher, host: str = '127.0.0.1', port: int = 8765,
+                  socket_path: Optional[str] = None):
+    """Create an HTTP server on localhost or on a Unix socket"""
+    handler = type('BoundSearchRequestHandler', (SearchRequestHandler,), {'searcher': searcher})
+    if socket_path:
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
+        return ThreadingUnixHTTPServer(socket_path, handler)
+    return ThreadingHTTPServer((host, port), handler)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Resident search service over the vector index')
+    parser.add_argument('--host', default='127.0.0.1', help='Host to bind the HTTP server to')
+    parser.add_argument('--port', type=int, default=8765, help='Port to bind the HTTP server to')
+    parser.add_argument('--socket', help='Serve on this Unix socket path instead of TCP')
+    parser.add_argument('--batch_window_ms', type=float, default=5.0, help='Time window for micro-batching queries')
+    parser.add_argument('--max_batch_size', type=int, default=64, help='Maximum number of queries per batch')
+    parser.add_argument('--max_k', type=int, default=1000, help='Largest k a request may ask for')
+    parser.add_argument('--lexical', action='store_true', help='Enable BM25 lexical and hybrid search modes')
+    parser.add_argument('--no_filters', action='store_true',
+                        help='Do not connect to the database (disables participant/source filters and text=1)')
+    parser.add_argument('--text_cache_mb', type=float, default=64,
+                        help='Size of the LRU cache of text rows returned with text=1 (0 disables it)')
+    parser.add_argument('--refresh_interval', type=float, default=2.0,
+                        help='Seconds between checks for newly indexed texts (0 disables)')
+    parser.add_argument('--embedding_backend', choices=list(EMBEDDING_BACKENDS),
+                        help='Embedding backend (defaults to EMBEDDING_BACKEND in config, else fasttext)')
+    parser.add_argument('--embedding_model', help='Model path for the embedding backend (defaults to EMBEDDING_MODEL in config)')
+    args = parser.parse_args()
+
+    embedding_backend, embedding_model = configured_backend(args.embedding_backend, args.embedding_model)
+    vector_manager = VectorManager(
+        embedding_model, VECTOR_DIMENSION, index_dir=os.path.join(VECTOR_DIR, 'index_store'), backend=embedding_backend,
+        read_only=True
+    )
+    lexical_index = LexicalIndex(os.path.join(VECTOR_DIR, 'lexical_index')) if args.lexical else None
+    searcher = MicroBatchSearcher(
+        vector_manager, TextPreprocessor(), args.batch_window_ms, args.max_batch_size, lexical_index=lexical_index,
+        db_manager=None if args.no_filters else DatabaseManager(int(args.text_cache_mb * 2 ** 20)), refresh_interval=args.refresh_interval or None,
+        max_k=args.max_k
+    )
+    server = create_server(searcher, args.host, args.port, args.socket)
+    print(f"Search service listening on {args.socket or f'http://{args.host}:{args.port}'}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        searcher.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+import os
+import hashlib
+import threading
+import numpy as np
+import whisper
+from pathlib import Path
+from typing import Dict, Tuple
+
+
+class DecodedAudioCache:
+    """Cache of 16 kHz mono PCM decoded by ffmpeg, stored as .npy files keyed
+    by the content hash of the source file.
+
+    Cached audio is returned memory-mapped (copy-on-write, so Whisper can wrap
+    it in a tensor without copying the file into RAM first). With
+    dtype='int16' the cache takes half the disk space and is converted back to
+    float32 on load.
+    """
+
+    def __init__(self, cache_dir: str = 'data/cache/audio', dtype: str = 'float32'):
+        if dtype not in ('float32', 'int16'):
+            raise ValueError("dtype must be 'float32' or 'int16'")
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.dtype = dtype
+        self._hashes: Dict[Tuple[str, int, int], str] = {}
+        self._lock = threading.Lock()
+
+    def content_hash(self, file_path: str) -> str:
+        """SHA-256 of the file content, memoized per (path, size, mtime)"""
+        stat = os.stat(file_path)
+        memo_key = (os.path.abspath(file_path), stat.st_size, stat.st_mtime_ns)
+        with self._lock:
+            if memo_key in self._hashes:
+                return self._hashes[memo_key]
+        digest = hashlib.sha256()
+        with open(file_path, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                digest.update(block)
+        with self._lock:
+            self._hashes[memo_key] = digest.hexdigest()
+        return self._hashes[memo_key]
+
+    def cache_path(self, file_path: str) -> Path:
+        key = self.content_hash(file_path)
+        return self.cache_dir / key[:2] / f"{key}.{self.dtype}.npy"
+
+    def load(self, file_path: str) -> np.ndarray:
+        """Decoded float32 samples of `file_path`, decoding with ffmpeg only on a cache miss"""
+        path = self.cache_path(file_path)
+        if not path.exists():
+            audio = whisper.audio.load_audio(file_path)
+            if self.dtype == 'int16':
+                stored = (np.clip(audio, -1.0, 1.0) * 32767).astype('int16')
+            else:
+                stored = audio
+            path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = path.with_name(f"{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+            with open(tmp_path, 'wb') as f:
+                np.save(f, stored)
+            os.replace(tmp_path, path)
+            if self.dtype == 'float32':
+                return audio
+
+        if self.dtype == 'int16':
+            return np.load(path, mmap_mode='r').astype('float32') / 32767.0
+        return np.load(path, mmap_mode='c')
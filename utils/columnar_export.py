@@ -0,0 +1,166 @@
+import os
+import glob
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+from typing import Dict, Iterator, Optional, Tuple
+
+from utils.lexical_index import LexicalIndex
+from utils.vector_utils import VectorManager
+
+EXPORT_FORMATS = {'parquet': '.parquet', 'arrow': '.arrow'}
+
+
+def export_schema(vector_dim: int, metadata: Optional[Dict[str, str]] = None) -> pa.Schema:
+    """One row per indexed vector, with its text and the embedding as a
+    fixed-size float32 list"""
+    return pa.schema([
+        ('vector_id', pa.int64()),
+        ('text_id', pa.string()),
+        ('source_file', pa.string()),
+        ('offset_start', pa.int64()),
+        ('offset_end', pa.int64()),
+        ('processed_content', pa.large_string()),
+        ('embedding', pa.list_(pa.float32(), vector_dim)),
+    ], metadata=metadata)
+
+
+def embedding_array(vectors: np.ndarray) -> pa.FixedSizeListArray:
+    """Wrap an (n, dim) float32 array as a fixed-size list column without copying it"""
+    vectors = np.ascontiguousarray(vectors, dtype='float32')
+    return pa.FixedSizeListArray.from_arrays(pa.array(vectors.reshape(-1)), vectors.shape[1])
+
+
+def embedding_matrix(column: pa.FixedSizeListArray) -> np.ndarray:
+    """(n, dim) float32 view of a fixed-size list column"""
+    return column.flatten().to_numpy(zero_copy_only=True).reshape(-1, column.type.list_size)
+
+
+def _open_writer(path: str, schema: pa.Schema, file_format: str):
+    if file_format == 'parquet':
+        return pq.ParquetWriter(path, schema, compression='zstd')
+    return pa.ipc.new_file(path, schema)
+
+
+def _read_batches(path: str, batch_size: int) -> Tuple[Dict[bytes, bytes], Iterator[pa.RecordBatch]]:
+    """Schema metadata and record batches of an exported file. Arrow files are
+    memory-mapped, so their embedding columns are read without copying."""
+    if path.endswith(EXPORT_FORMATS['parquet']):
+        parquet = pq.ParquetFile(path)
+        return parquet.schema_arrow.metadata or {}, parquet.iter_batches(batch_size)
+    reader = pa.ipc.open_file(pa.memory_map(path, 'r'))
+    return reader.schema.metadata or {}, (reader.get_batch(i) for i in range(reader.num_record_batches))
+
+
+def export_texts(vector_manager: VectorManager, db_manager, output_dir: str, batch_size: int = 50000,
+                 file_format: str = 'parquet') -> int:
+    """Write every live vector with its text id, source file, offsets and
+    processed content to `output_dir`, one `part-<n>` file per index shard.
+
+    Vectors are read from the memory-mapped shards and texts are fetched with
+    one IN query per chunk, so memory is bounded by `batch_size` rows. Returns
+    the number of rows written.
+    """
+    if file_format not in EXPORT_FORMATS:
+        raise ValueError(f"Unknown export format: {file_format}. Use one of {tuple(EXPORT_FORMATS)}")
+    store = vector_manager.store
+    if store is None:
+        raise ValueError("Export requires VectorManager to be created with an index_dir")
+    os.makedirs(output_dir, exist_ok=True)
+    schema = export_schema(store.vector_dim, {
+        'embedding_backend': vector_manager.backend.name,
+        'embedding_model': vector_manager.backend.model_id,
+        'next_vector_id': str(store.next_id),
+    })
+
+    written = 0
+    parts = 0
+    writer, current_shard = None, None
+    try:
+        for shard, vector_ids, vectors in store.iter_live(batch_size):
+            if shard != current_shard:
+                if writer is not None:
+                    writer.close()
+                path = os.path.join(output_dir, f"part-{parts:05d}{EXPORT_FORMATS[file_format]}")
+                writer, current_shard = _open_writer(path, schema, file_format), shard
+                parts += 1
+
+            metadata = vector_manager.lookup_metadata(vector_ids)
+            text_ids = [meta['text_id'] if meta else None for meta in metadata]
+            texts = db_manager.get_texts_by_ids([text_id for text_id in text_ids if text_id])
+            writer.write_batch(pa.RecordBatch.from_arrays([
+                pa.array(vector_ids, pa.int64()),
+                pa.array(text_ids, pa.string()),
+                pa.array([meta['source_file'] if meta else None for meta in metadata], pa.string()),
+                pa.array([meta['offsets'][0] if meta else None for meta in metadata], pa.int64()),
+                pa.array([meta['offsets'][1] if meta else None for meta in metadata], pa.int64()),
+                pa.array([texts[text_id].processed_content if text_id in texts else None for text_id in text_ids],
+                         pa.large_string()),
+                embedding_array(vectors),
+            ], schema=schema))
+            written += len(vector_ids)
+    finally:
+        if writer is not None:
+            writer.close()
+    return written
+
+
+def import_texts(vector_manager: VectorManager, input_dir: str, lexical_index: Optional[LexicalIndex] = None,
+                 batch_size: int = 50000) -> int:
+    """Rebuild an empty vector index, and optionally the lexical index, from
+    the files written by `export_texts`, keeping the vector ids and without
+    computing any embedding. Returns the number of vectors imported."""
+    store = vector_manager.store
+    if store is None:
+        raise ValueError("Import requires VectorManager to be created with an index_dir")
+    if store.shards or store.next_id:
+        raise ValueError(f"Import requires an empty index, {store.index_dir} already has vectors")
+    paths = sorted(path for extension in EXPORT_FORMATS.values()
+                   for path in glob.glob(os.path.join(input_dir, f"part-*{extension}")))
+    if not paths:
+        raise FileNotFoundError(f"No exported files found in {input_dir}")
+
+    def commit():
+        # Metadata and lexical segments first: the index manifest is the commit point
+        vector_manager.save_metadata()
+        if lexical_index is not None:
+            lexical_index.flush()
+        vector_manager.save_index()
+        if lexical_index is not None:
+            lexical_index.maybe_merge()
+
+    imported = 0
+    next_vector_id = 0
+    pending = False
+    for path in paths:
+        metadata, batches = _read_batches(path, batch_size)
+        backend = metadata.get(b'embedding_backend', b'').decode('utf-8')
+        if backend and backend != vector_manager.backend.name:
+            raise ValueError(f"{path} holds {backend} embeddings, the index uses {vector_manager.backend.name}")
+        model = metadata.get(b'embedding_model', b'').decode('utf-8')
+        if model and model != vector_manager.backend.model_id:
+            raise ValueError(f"{path} holds embeddings of model {model}, the index uses {vector_manager.backend.model_id}")
+        next_vector_id = max(next_vector_id, int(metadata.get(b'next_vector_id', 0)))
+        for batch in batches:
+            # One shard per batch keeps memory bounded
+            if pending:
+                commit()
+            vector_ids = batch.column('vector_id').to_numpy()
+            text_ids = [text_id or '' for text_id in batch.column('text_id').to_pylist()]
+            vector_manager.add_to_index(embedding_matrix(batch.column('embedding')), vector_ids)
+            vector_manager.add_metadata(
+                vector_ids, text_ids, batch.column('source_file').to_pylist(),
+                np.stack([batch.column('offset_start').fill_null(-1).to_numpy(),
+                          batch.column('offset_end').fill_null(-1).to_numpy()], axis=1)
+            )
+            if lexical_index is not None:
+                for text_id, processed_content in zip(text_ids, batch.column('processed_content').to_pylist()):
+                    if text_id and processed_content is not None:
+                        lexical_index.add(text_id, processed_content)
+            imported += len(vector_ids)
+            pending = True
+
+    # Ids of vectors deleted before the export are not handed out again
+    store.next_id = max(store.next_id, next_vector_id)
+    commit()
+    return imported
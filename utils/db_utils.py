@@ -1,10 +1,95 @@
-from sqlalchemy import create_engine, MetaData, Table, Column, String, Text, DateTime
+import hashlib
+import threading
+from collections import OrderedDict
+from sqlalchemy import create_engine, MetaData, Table, Column, String, Text, Date, DateTime, Float, Integer, BigInteger, and_, bindparam, func, or_, select, inspect, literal, text
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import sessionmaker
 from datetime import datetime
 from config import DB_CONFIG
 
+
+def hash_content(content):
+    """SHA-256 of a text's content, used to store identical texts only once
+    (None for NULL content, which is never merged)"""
+    if content is None:
+        return None
+    return hashlib.sha256(content.encode('utf-8')).hexdigest()
+
+
+class TextRowCache:
+    """Thread-safe LRU cache of text_data rows, bounded by the size of their text.
+
+    Writes made through the owning DatabaseManager invalidate their rows.
+    Writes made by other processes do not: their readers must call
+    `invalidate()` when they learn of them (the search service does so when
+    it sees a new index commit).
+    """
+
+    def __init__(self, max_bytes: int = 64 * 2 ** 20):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        # Bumped on invalidation, so rows read before an update are not cached after it
+        self.generation = 0
+        self._rows = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    @staticmethod
+    def _row_size(row) -> int:
+        return sum(len(value) for value in row if isinstance(value, str))
+
+    def get_many(self, text_ids):
+        """Cached rows among `text_ids`, keyed by id"""
+        found = {}
+        with self._lock:
+            for text_id in text_ids:
+                row = self._rows.get(text_id)
+                if row is not None:
+                    self._rows.move_to_end(text_id)
+                    found[text_id] = row
+            self.hits += len(found)
+            self.misses += len(text_ids) - len(found)
+        return found
+
+    def put_many(self, rows, generation=None):
+        """Cache rows read while the cache was at `generation`"""
+        with self._lock:
+            if generation is not None and generation != self.generation:
+                return
+            for row in rows:
+                size = self._row_size(row)
+                if size > self.max_bytes:
+                    continue
+                if row.id in self._rows:
+                    self.size -= self._row_size(self._rows.pop(row.id))
+                self._rows[row.id] = row
+                self.size += size
+            while self.size > self.max_bytes:
+                _, evicted = self._rows.popitem(last=False)
+                self.size -= self._row_size(evicted)
+
+    def invalidate(self, text_ids=None):
+        """Drop the given rows, or every row when `text_ids` is None"""
+        with self._lock:
+            self.generation += 1
+            if text_ids is None:
+                self._rows.clear()
+                self.size = 0
+                return
+            for text_id in text_ids:
+                row = self._rows.pop(text_id, None)
+                if row is not None:
+                    self.size -= self._row_size(row)
+
+
 class DatabaseManager:
-    def __init__(self):
+    def __init__(self, text_cache_bytes=64 * 2 ** 20):
+        """`text_cache_bytes` bounds the LRU cache behind `get_texts_by_ids` (0 disables it)"""
+        self.text_cache = TextRowCache(text_cache_bytes) if text_cache_bytes else None
         self.connection_string = f"mysql+pymysql://{DB_CONFIG['user']}:{DB_CONFIG['password']}@{DB_CONFIG['host']}/{DB_CONFIG['database']}"
         self.engine = create_engine(self.connection_string)
         self.metadata = MetaData()
@@ -19,10 +104,19 @@ class DatabaseManager:
             Column('source_file', String(255)),
             Column('content', Text),
             Column('processed_content', Text),
+            Column('content_hash', String(64), unique=True, index=True),
             Column('created_at', DateTime, default=datetime.utcnow),
             Column('updated_at', DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
         )
 
+        # Every source file a text was found in (text_data.source_file is the first one)
+        self.text_sources = Table(
+            'text_sources', self.metadata,
+            Column('text_id', String(50), primary_key=True),
+            Column('source_file', String(255), primary_key=True),
+            Column('created_at', DateTime, default=datetime.utcnow)
+        )
+
         # Table for vector embeddings
         self.embeddings = Table(
             'embeddings', self.metadata,
@@ -32,24 +126,416 @@ class DatabaseManager:
             Column('created_at', DateTime, default=datetime.utcnow)
         )
 
+        # Near-duplicate texts that were not indexed, and the text they duplicate
+        self.text_duplicates = Table(
+            'text_duplicates', self.metadata,
+            Column('text_id', String(50), primary_key=True),
+            Column('canonical_id', String(50), index=True),
+            Column('similarity', Float),
+            Column('created_at', DateTime, default=datetime.utcnow)
+        )
+
+        # Vector ids of every indexed text, so metadata filters resolve to index ids in SQL
+        self.text_vectors = Table(
+            'text_vectors', self.metadata,
+            Column('vector_id', BigInteger, primary_key=True, autoincrement=False),
+            Column('text_id', String(50), index=True)
+        )
+
+        # People taking part in a text (e.g. NER on a transcript)
+        self.text_participants = Table(
+            'text_participants', self.metadata,
+            Column('text_id', String(50), primary_key=True),
+            Column('participant', String(255), primary_key=True, index=True)
+        )
+
+        # Metadata of the video a text was transcribed from
+        self.source_metadata = Table(
+            'source_metadata', self.metadata,
+            Column('text_id', String(50), primary_key=True),
+            Column('title', String(255)),
+            Column('uploader', String(255), index=True),
+            Column('upload_date', Date, index=True),
+            Column('duration', Integer),
+            Column('url', Text),
+            Column('created_at', DateTime, default=datetime.utcnow)
+        )
+
+        # Committed positions of the vectorization stage, one row per checkpoint
+        self.vectorization_checkpoints = Table(
+            'vectorization_checkpoints', self.metadata,
+            Column('id', Integer, primary_key=True, autoincrement=False),
+            Column('next_vector_id', BigInteger),
+            Column('texts_committed', Integer),
+            Column('last_text_id', String(50)),
+            Column('created_at', DateTime, default=datetime.utcnow)
+        )
+
         # Create tables if they don't exist
         self.metadata.create_all(self.engine)
 
+    def _insert_ignore(self, table):
+        """INSERT that skips rows conflicting with an existing key"""
+        return table.insert().prefix_with('IGNORE', dialect='mysql').prefix_with('OR IGNORE', dialect='sqlite')
+
+    def _upsert_texts(self, rows, attempts=3):
+        """Insert (text_id, source_file, content, processed_content) rows keyed by
+        content hash and link every source file to the stored text.
+
+        Returns the canonical text id of each row: its own id when the content
+        is new, otherwise the id of the text already holding that content.
+        """
+        hashes = [hash_content(content) for _, _, content, _ in rows]
+        for attempt in range(attempts):
+            session = self.Session()
+            try:
+                canonical = dict(session.execute(
+                    select(self.text_data.c.content_hash, self.text_data.c.id)
+                    .where(self.text_data.c.content_hash.in_({h for h in hashes if h is not None}))
+                ).all())
+                canonical_ids = []
+                new_rows = []
+                for (text_id, source_file, content, processed_content), content_hash in zip(rows, hashes):
+                    if content_hash is None or content_hash not in canonical:
+                        if content_hash is not None:
+                            canonical[content_hash] = text_id
+                        canonical_ids.append(text_id)
+                        new_rows.append({
+                            'id': text_id,
+                            'source_file': source_file,
+                            'content': content,
+                            'processed_content': processed_content,
+                            'content_hash': content_hash
+                        })
+                    else:
+                        canonical_ids.append(canonical[content_hash])
+                if new_rows:
+                    session.execute(self.text_data.insert(), new_rows)
+                links = {(canonical_id, row[1]) for row, canonical_id in zip(rows, canonical_ids) if row[1]}
+                if links:
+                    session.execute(
+                        self._insert_ignore(self.text_sources),
+                        [{'text_id': text_id, 'source_file': source_file} for text_id, source_file in links]
+                    )
+                session.commit()
+                return canonical_ids
+            except IntegrityError:
+                # Another loader inserted the same content concurrently; its row now wins
+                session.rollback()
+                if attempt == attempts - 1:
+                    raise
+            except Exception:
+                session.rollback()
+                raise
+            finally:
+                session.close()
+
     def save_text_data(self, text_id, source_file, content, processed_content=None):
+        """Store a text unless identical content already exists, and return the
+        id of the stored text (`text_id` or the existing text's id)"""
+        return self._upsert_texts([(text_id, source_file, content, processed_content)])[0]
+
+    def save_text_data_batch(self, rows):
+        """Store many (text_id, source_file, content) rows in one transaction and
+        return their canonical text ids"""
+        if not rows:
+            return []
+        return self._upsert_texts([(text_id, source_file, content, None) for text_id, source_file, content in rows])
+
+    def migrate_content_hashes(self, batch_size=1000):
+        """Bring a text_data table created before content hashing up to date.
+
+        Adds and backfills `content_hash`, links every row to its source file,
+        merges rows with identical content into the oldest one and creates the
+        unique index. Rows with NULL content keep a NULL hash and are not merged. Merged rows are recorded in text_duplicates (similarity
+        1.0) and deleted; their ids are returned so their vectors can be dropped.
+        """
+        inspector = inspect(self.engine)
+        with self.engine.begin() as conn:
+            if 'content_hash' not in {column['name'] for column in inspector.get_columns('text_data')}:
+                conn.execute(text('ALTER TABLE text_data ADD COLUMN content_hash VARCHAR(64)'))
+
+        # Backfill hashes in batches
+        while True:
+            with self.engine.begin() as conn:
+                batch = conn.execute(
+                    select(self.text_data.c.id, self.text_data.c.content)
+                    .where(self.text_data.c.content_hash.is_(None))
+                    .where(self.text_data.c.content.is_not(None))
+                    .limit(batch_size)
+                ).all()
+                if not batch:
+                    break
+                conn.execute(
+                    self.text_data.update()
+                    .where(self.text_data.c.id == bindparam('text_id'))
+                    .values(content_hash=bindparam('hash')),
+                    [{'text_id': text_id, 'hash': hash_content(content)} for text_id, content in batch]
+                )
+
+        with self.engine.begin() as conn:
+            conn.execute(self._insert_ignore(self.text_sources).from_select(
+                ['text_id', 'source_file'],
+                select(self.text_data.c.id, self.text_data.c.source_file)
+                .where(self.text_data.c.source_file.is_not(None))
+            ))
+
+        merged = []
+        with self.engine.connect() as conn:
+            duplicated_hashes = conn.execute(
+                select(self.text_data.c.content_hash)
+                .where(self.text_data.c.content_hash.is_not(None))
+                .group_by(self.text_data.c.content_hash)
+                .having(func.count() > 1)
+            ).scalars().all()
+        for content_hash in duplicated_hashes:
+            with self.engine.begin() as conn:
+                ids = conn.execute(
+                    select(self.text_data.c.id)
+                    .where(self.text_data.c.content_hash == content_hash)
+                    .order_by(self.text_data.c.created_at, self.text_data.c.id)
+                ).scalars().all()
+                canonical_id, duplicate_ids = ids[0], ids[1:]
+                conn.execute(self._insert_ignore(self.text_sources).from_select(
+                    ['text_id', 'source_file'],
+                    select(literal(canonical_id, String(50)), self.text_sources.c.source_file)
+                    .where(self.text_sources.c.text_id.in_(duplicate_ids))
+                ))
+                conn.execute(self.text_sources.delete().where(self.text_sources.c.text_id.in_(duplicate_ids)))
+                conn.execute(
+                    self.text_duplicates.update()
+                    .where(self.text_duplicates.c.canonical_id.in_(duplicate_ids))
+                    .values(canonical_id=canonical_id)
+                )
+                conn.execute(self.text_duplicates.delete().where(self.text_duplicates.c.text_id.in_(duplicate_ids)))
+                conn.execute(
+                    self.text_duplicates.insert(),
+                    [{'text_id': text_id, 'canonical_id': canonical_id, 'similarity': 1.0} for text_id in duplicate_ids]
+                )
+                conn.execute(self.text_vectors.delete().where(self.text_vectors.c.text_id.in_(duplicate_ids)))
+                conn.execute(self.text_data.delete().where(self.text_data.c.id.in_(duplicate_ids)))
+            merged.extend(duplicate_ids)
+
+        if not any(index['name'] == 'ix_text_data_content_hash' for index in inspect(self.engine).get_indexes('text_data')):
+            for index in self.text_data.indexes:
+                if index.name == 'ix_text_data_content_hash':
+                    index.create(self.engine)
+        self._invalidate_texts()
+        return merged
+
+    def update_processed_content(self, text_id, processed_content):
+        session = self.Session()
+        try:
+            session.execute(
+                self.text_data.update()
+                .where(self.text_data.c.id == text_id)
+                .values(processed_content=processed_content)
+            )
+            session.commit()
+        finally:
+            session.close()
+            self._invalidate_texts([text_id])
+
+    def save_duplicate(self, text_id, canonical_id, similarity):
+        """Record `text_id` as a duplicate of `canonical_id`, replacing an earlier record"""
+        session = self.Session()
+        try:
+            session.execute(self.text_duplicates.delete().where(self.text_duplicates.c.text_id == text_id))
+            session.execute(
+                self.text_duplicates.insert().values(
+                    text_id=text_id,
+                    canonical_id=canonical_id,
+                    similarity=similarity
+                )
+            )
+            session.commit()
+        finally:
+            session.close()
+
+    def commit_checkpoint(self, checkpoint_id, processed_texts, duplicates, next_vector_id, vectors=()):
+        """Mark a checkpoint's texts as processed, record its duplicates, the
+        (vector_id, text_id) pairs it indexed and the checkpoint position, all
+        in one transaction"""
+        session = self.Session()
+        try:
+            if processed_texts:
+                session.execute(
+                    self.text_data.update()
+                    .where(self.text_data.c.id == bindparam('text_id'))
+                    .values(processed_content=bindparam('processed')),
+                    [{'text_id': text_id, 'processed': processed} for text_id, processed in processed_texts]
+                )
+                # Re-processed texts replace their previous vectors and duplicate records
+                session.execute(
+                    self.text_vectors.delete()
+                    .where(self.text_vectors.c.text_id.in_([text_id for text_id, _ in processed_texts]))
+                )
+            replaced_duplicates = {text_id for text_id, _ in processed_texts}
+            replaced_duplicates.update(text_id for text_id, _, _ in duplicates)
+            if replaced_duplicates:
+                session.execute(
+                    self.text_duplicates.delete()
+                    .where(self.text_duplicates.c.text_id.in_(replaced_duplicates))
+                )
+            if vectors:
+                session.execute(
+                    self.text_vectors.insert(),
+                    [{'vector_id': vector_id, 'text_id': text_id} for vector_id, text_id in vectors]
+                )
+            if duplicates:
+                session.execute(
+                    self.text_duplicates.insert(),
+                    [{'text_id': text_id, 'canonical_id': canonical_id, 'similarity': similarity}
+                     for text_id, canonical_id, similarity in duplicates]
+                )
+            session.execute(
+                self.vectorization_checkpoints.insert().values(
+                    id=checkpoint_id,
+                    next_vector_id=next_vector_id,
+                    texts_committed=len(processed_texts),
+                    last_text_id=processed_texts[-1][0] if processed_texts else None
+                )
+            )
+            session.commit()
+        except Exception:
+            session.rollback()
+            raise
+        finally:
+            session.close()
+            self._invalidate_texts([text_id for text_id, _ in processed_texts])
+
+    def get_last_checkpoint_id(self):
+        session = self.Session()
+        try:
+            return session.execute(
+                select(func.max(self.vectorization_checkpoints.c.id))
+            ).scalar() or 0
+        finally:
+            session.close()
+
+    def save_text_vectors(self, vectors):
+        """Record (vector_id, text_id) pairs, skipping ones already recorded"""
+        if not vectors:
+            return
+        session = self.Session()
+        try:
+            session.execute(
+                self._insert_ignore(self.text_vectors),
+                [{'vector_id': vector_id, 'text_id': text_id} for vector_id, text_id in vectors]
+            )
+            session.commit()
+        finally:
+            session.close()
+
+    def indexed_text_ids(self, text_ids, batch_size=1000):
+        """The ids among `text_ids` of texts that have vectors in the index"""
+        text_ids = list(text_ids)
+        indexed = set()
+        session = self.Session()
+        try:
+            for start in range(0, len(text_ids), batch_size):
+                indexed.update(session.execute(
+                    select(self.text_vectors.c.text_id).distinct()
+                    .where(self.text_vectors.c.text_id.in_(text_ids[start:start + batch_size]))
+                ).scalars().all())
+            return indexed
+        finally:
+            session.close()
+
+    def save_participants(self, text_id, participants):
+        """Link the people taking part in a text to it"""
+        participants = {participant.strip()[:255] for participant in participants if participant and participant.strip()}
+        if not participants:
+            return
+        session = self.Session()
+        try:
+            session.execute(
+                self._insert_ignore(self.text_participants),
+                [{'text_id': text_id, 'participant': participant} for participant in participants]
+            )
+            session.commit()
+        finally:
+            session.close()
+
+    def save_source_metadata(self, text_id, metadata):
+        """Store the video metadata (as saved by YouTubeDownloader) of a text"""
+        try:
+            upload_date = datetime.strptime(str(metadata.get('upload_date')), '%Y%m%d').date()
+        except ValueError:
+            upload_date = None
         session = self.Session()
         try:
+            session.execute(self.source_metadata.delete().where(self.source_metadata.c.text_id == text_id))
             session.execute(
-                self.text_data.insert().values(
-                    id=text_id,
-                    source_file=source_file,
-                    content=content,
-                    processed_content=processed_content
+                self.source_metadata.insert().values(
+                    text_id=text_id,
+                    title=(metadata.get('title') or '')[:255],
+                    uploader=(metadata.get('uploader') or '')[:255],
+                    upload_date=upload_date,
+                    duration=metadata.get('duration'),
+                    url=metadata.get('url')
                 )
             )
             session.commit()
         finally:
             session.close()
 
+    def _filter_conditions(self, text_id_column, participants=None, uploader=None, date_from=None, date_to=None):
+        """WHERE clauses restricting `text_id_column` to texts matching every given filter"""
+        conditions = []
+        if participants:
+            conditions.append(text_id_column.in_(
+                select(self.text_participants.c.text_id)
+                .where(self.text_participants.c.participant.in_(list(participants)))
+            ))
+        if uploader or date_from or date_to:
+            sources = select(self.source_metadata.c.text_id)
+            if uploader:
+                sources = sources.where(self.source_metadata.c.uploader == uploader)
+            if date_from:
+                sources = sources.where(self.source_metadata.c.upload_date >= date_from)
+            if date_to:
+                sources = sources.where(self.source_metadata.c.upload_date <= date_to)
+            conditions.append(text_id_column.in_(sources))
+        return conditions
+
+    def get_filtered_vectors(self, **filters):
+        """(vector_id, text_id) pairs of the indexed texts matching every given
+        filter: any of `participants`, the `uploader`, and an upload date range"""
+        query = select(self.text_vectors.c.vector_id, self.text_vectors.c.text_id).where(
+            *self._filter_conditions(self.text_vectors.c.text_id, **filters)
+        )
+        session = self.Session()
+        try:
+            return [tuple(row) for row in session.execute(query).all()]
+        finally:
+            session.close()
+
+    def count_filtered_vectors(self, **filters):
+        """Number of indexed vectors matching the filters of `get_filtered_vectors`"""
+        query = select(func.count()).select_from(self.text_vectors).where(
+            *self._filter_conditions(self.text_vectors.c.text_id, **filters)
+        )
+        session = self.Session()
+        try:
+            return session.execute(query).scalar()
+        finally:
+            session.close()
+
+    def filter_text_ids(self, text_ids, **filters):
+        """The ids among `text_ids` of texts matching the filters of `get_filtered_vectors`"""
+        text_ids = list(text_ids)
+        if not text_ids:
+            return set()
+        query = select(self.text_data.c.id).where(
+            self.text_data.c.id.in_(text_ids), *self._filter_conditions(self.text_data.c.id, **filters)
+        )
+        session = self.Session()
+        try:
+            return set(session.execute(query).scalars().all())
+        finally:
+            session.close()
+
     def save_embedding(self, embedding_id, text_id, vector_path):
         session = self.Session()
         try:
@@ -64,12 +550,70 @@ class DatabaseManager:
         finally:
             session.close()
 
-    def get_unprocessed_texts(self):
+    def get_texts_by_ids(self, text_ids, batch_size=1000):
+        """text_data rows keyed by id. Rows missing from the LRU cache are
+        fetched with one IN query per `batch_size` ids."""
+        text_ids = list(dict.fromkeys(text_ids))
+        rows = self.text_cache.get_many(text_ids) if self.text_cache is not None else {}
+        missing = [text_id for text_id in text_ids if text_id not in rows]
+        if not missing:
+            return rows
+        generation = self.text_cache.generation if self.text_cache is not None else None
         session = self.Session()
         try:
-            result = session.execute(
-                self.text_data.select().where(self.text_data.c.processed_content.is_(None))
-            )
-            return result.fetchall()
+            for start in range(0, len(missing), batch_size):
+                fetched = session.execute(
+                    self.text_data.select().where(self.text_data.c.id.in_(missing[start:start + batch_size]))
+                ).all()
+                rows.update((row.id, row) for row in fetched)
+                if self.text_cache is not None:
+                    # Rows not processed yet are about to change
+                    self.text_cache.put_many([row for row in fetched if row.processed_content is not None], generation)
+            return rows
+        finally:
+            session.close()
+
+    def _invalidate_texts(self, text_ids=None):
+        if self.text_cache is not None:
+            self.text_cache.invalidate(text_ids)
+
+    def count_unprocessed_texts(self):
+        session = self.Session()
+        try:
+            return session.execute(
+                select(func.count()).select_from(self.text_data).where(self.text_data.c.processed_content.is_(None))
+            ).scalar()
         finally:
             session.close()
+
+    def iter_unprocessed_texts(self, page_size=2000):
+        """Yield unprocessed texts in (created_at, id) order, one page at a time.
+
+        Pages are read with keyset pagination, each in its own short query, so
+        neither the backlog nor a long-lived cursor is held. `page_size` may be
+        a callable returning the size of the next page.
+        """
+        created_at, text_id = self.text_data.c.created_at, self.text_data.c.id
+        last = None
+        while True:
+            query = (
+                self.text_data.select()
+                .where(self.text_data.c.processed_content.is_(None))
+                .order_by(created_at, text_id)
+                .limit(page_size() if callable(page_size) else page_size)
+            )
+            if last is not None:
+                query = query.where(or_(created_at > last.created_at,
+                                        and_(created_at == last.created_at, text_id > last.id)))
+            session = self.Session()
+            try:
+                page = session.execute(query).fetchall()
+            finally:
+                session.close()
+            if not page:
+                return
+            yield page
+            last = page[-1]
+
+    def get_unprocessed_texts(self):
+        return [text for page in self.iter_unprocessed_texts() for text in page]
@@ -0,0 +1,178 @@
+import os
+import json
+import time
+import hashlib
+import numpy as np
+from abc import ABC, abstractmethod
+from typing import Dict, Optional, Sequence, Tuple
+
+from utils.file_utils import atomic_save_array, atomic_write_bytes
+from utils.memory_budget import current_rss
+
+HASHING_SVD_CONFIG_FILE = 'config.json'
+HASHING_SVD_PROJECTION_FILE = 'projection.npy'
+FINGERPRINT_BYTES = 2 ** 20
+
+
+def model_fingerprint(path: str, label: Optional[str] = None) -> str:
+    """`<label>:<hash>` identifying a model file by its size and its first and
+    last MiB, cheap enough to compute every time a model is loaded. The label
+    defaults to the file name."""
+    digest = hashlib.sha256()
+    size = os.path.getsize(path)
+    digest.update(str(size).encode('utf-8'))
+    with open(path, 'rb') as f:
+        digest.update(f.read(FINGERPRINT_BYTES))
+        f.seek(max(0, size - FINGERPRINT_BYTES))
+        digest.update(f.read(FINGERPRINT_BYTES))
+    return f"{label or os.path.basename(path)}:{digest.hexdigest()[:16]}"
+
+
+class EmbeddingBackend(ABC):
+    """Turns a batch of preprocessed texts into float32 vectors of size `dim`.
+    `model_id` identifies the loaded model, so an index is never extended
+    with vectors from another embedding space."""
+
+    name = None
+    dim: int
+    model_id: str
+
+    @abstractmethod
+    def embed(self, texts: Sequence[str]) -> np.ndarray:
+        """Vectors of a batch of texts, as an (n, dim) float32 array"""
+
+    @abstractmethod
+    def memory_bytes(self) -> int:
+        """Memory held by the loaded model"""
+
+    def benchmark(self, texts: Sequence[str], batch_size: int = 256) -> Dict:
+        """Dimension, memory footprint and throughput of this backend on `texts`"""
+        start = time.perf_counter()
+        for i in range(0, len(texts), batch_size):
+            self.embed(texts[i:i + batch_size])
+        seconds = time.perf_counter() - start
+        return {
+            'backend': self.name,
+            'dim': self.dim,
+            'memory_mb': self.memory_bytes() / 2 ** 20,
+            'embeddings_per_sec': len(texts) / seconds if seconds > 0 else float('inf'),
+        }
+
+
+class FastTextBackend(EmbeddingBackend):
+    """Sentence vectors of a full fastText model (.bin)"""
+
+    name = 'fasttext'
+
+    def __init__(self, model_path: str):
+        import fasttext
+        rss_before = current_rss()
+        self.model = fasttext.load_model(model_path)
+        rss_after = current_rss()
+        self.dim = self.model.get_dimension()
+        self.model_id = model_fingerprint(model_path)
+        # fastText reads the whole model into memory, so the RSS growth is its footprint
+        if rss_before is not None and rss_after is not None and rss_after > rss_before:
+            self._memory_bytes = rss_after - rss_before
+        else:
+            self._memory_bytes = os.path.getsize(model_path)
+
+    def embed(self, texts: Sequence[str]) -> np.ndarray:
+        vectors = [self.model.get_sentence_vector(text) for text in texts]
+        return np.array(vectors, dtype='float32').reshape(-1, self.dim)
+
+    def memory_bytes(self) -> int:
+        return self._memory_bytes
+
+
+class QuantizedFastTextBackend(FastTextBackend):
+    """Sentence vectors of a product-quantized fastText model (.ftz).
+
+    fastText only quantizes supervised models, so the .ftz must come from a
+    model trained with `fasttext supervised` and compressed with
+    `fasttext quantize`.
+    """
+
+    name = 'fasttext_quantized'
+
+    def __init__(self, model_path: str):
+        if not model_path.endswith('.ftz'):
+            raise ValueError(f"Expected a quantized fastText model (.ftz), got {model_path}")
+        super().__init__(model_path)
+
+
+class HashingSVDBackend(EmbeddingBackend):
+    """Hashed word n-grams projected to `dim` dimensions with a truncated SVD.
+
+    The model is a directory holding the vectorizer settings and the
+    (n_features, dim) projection matrix, which is memory-mapped on load, so
+    several processes share one copy in the page cache. Fit it on a sample of
+    the corpus with `HashingSVDBackend.fit`.
+    """
+
+    name = 'hashing_svd'
+
+    def __init__(self, model_dir: str, mmap: bool = True):
+        from sklearn.feature_extraction.text import HashingVectorizer
+        with open(os.path.join(model_dir, HASHING_SVD_CONFIG_FILE), 'r', encoding='utf-8') as f:
+            config = json.load(f)
+        self.projection = np.load(os.path.join(model_dir, HASHING_SVD_PROJECTION_FILE),
+                                  mmap_mode='r' if mmap else None)
+        self.dim = self.projection.shape[1]
+        self.model_id = model_fingerprint(os.path.join(model_dir, HASHING_SVD_PROJECTION_FILE),
+                                          os.path.basename(os.path.normpath(model_dir)))
+        self.vectorizer = HashingVectorizer(**self._vectorizer_params(config['n_features'], config['ngram_range']))
+
+    @staticmethod
+    def _vectorizer_params(n_features: int, ngram_range: Tuple[int, int]) -> Dict:
+        return {
+            'n_features': n_features,
+            'ngram_range': tuple(ngram_range),
+            'alternate_sign': False,
+            'norm': 'l2',
+        }
+
+    @classmethod
+    def fit(cls, texts: Sequence[str], model_dir: str, dim: int = 300, n_features: int = 2 ** 16,
+            ngram_range: Tuple[int, int] = (1, 2), random_state: int = 0) -> 'HashingSVDBackend':
+        """Fit the SVD projection on `texts` and save the model to `model_dir`"""
+        from sklearn.decomposition import TruncatedSVD
+        from sklearn.feature_extraction.text import HashingVectorizer
+        vectorizer = HashingVectorizer(**cls._vectorizer_params(n_features, ngram_range))
+        svd = TruncatedSVD(n_components=dim, random_state=random_state)
+        svd.fit(vectorizer.transform(texts))
+
+        os.makedirs(model_dir, exist_ok=True)
+        atomic_save_array(os.path.join(model_dir, HASHING_SVD_PROJECTION_FILE),
+                           np.ascontiguousarray(svd.components_.T, dtype='float32'))
+        config = {'n_features': n_features, 'ngram_range': list(ngram_range), 'dim': dim}
+        atomic_write_bytes(os.path.join(model_dir, HASHING_SVD_CONFIG_FILE), json.dumps(config).encode('utf-8'))
+        return cls(model_dir)
+
+    def embed(self, texts: Sequence[str]) -> np.ndarray:
+        return np.asarray(self.vectorizer.transform(texts) @ self.projection, dtype='float32')
+
+    def memory_bytes(self) -> int:
+        return self.projection.nbytes
+
+
+EMBEDDING_BACKENDS = {
+    backend.name: backend for backend in (FastTextBackend, QuantizedFastTextBackend, HashingSVDBackend)
+}
+
+
+def create_backend(name: str, model_path: str) -> EmbeddingBackend:
+    """Load the embedding backend registered under `name`"""
+    if name not in EMBEDDING_BACKENDS:
+        raise ValueError(f"Unknown embedding backend {name!r}, expected one of {', '.join(EMBEDDING_BACKENDS)}")
+    return EMBEDDING_BACKENDS[name](model_path)
+
+
+def configured_backend(name: Optional[str] = None, model_path: Optional[str] = None) -> Tuple[str, str]:
+    """Backend name and model path: explicit values win over EMBEDDING_BACKEND /
+    EMBEDDING_MODEL in config, which default to the full fastText model"""
+    import config
+    return (
+        name or getattr(config, 'EMBEDDING_BACKEND', 'fasttext'),
+        model_path or getattr(config, 'EMBEDDING_MODEL', config.FASTTEXT_MODEL),
+    )
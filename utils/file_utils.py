@@ -0,0 +1,49 @@
+import os
+import time
+import numpy as np
+from typing import Callable, Collection, Dict, List, Tuple
+
+# Readers of an older generation open files lazily, so unreferenced files are kept this long
+STALE_FILE_GRACE_SECONDS = 300
+
+
+def atomic_write_bytes(path: str, data: bytes):
+    """Write a file so readers only ever see the old or the new content"""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def atomic_save_array(path: str, array: np.ndarray):
+    """Save a numpy array to `path` through a temporary file"""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'wb') as f:
+        np.save(f, array)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def retire_stale_files(directory: str, is_candidate: Callable[[str], bool], live: Collection[str],
+                       retired: Dict[str, float]) -> Tuple[Dict[str, float], List[str]]:
+    """Record when candidate files of `directory` stopped being `live`.
+
+    `retired` maps a file to the time it was first seen unreferenced. Returns
+    the updated map, to be stored in the next manifest, and the files
+    unreferenced for STALE_FILE_GRACE_SECONDS, to be deleted once that
+    manifest is committed.
+    """
+    now = time.time()
+    still_retired, expired = {}, []
+    for filename in os.listdir(directory):
+        if not is_candidate(filename) or filename in live:
+            continue
+        since = retired.get(filename, now)
+        if now - since >= STALE_FILE_GRACE_SECONDS:
+            expired.append(filename)
+        else:
+            still_retired[filename] = since
+    return still_retired, expired
@@ -0,0 +1,200 @@
+import os
+import time
+import ctypes
+import select
+import struct
+import ctypes.util
+from typing import Dict, Iterator, Optional, Sequence, Set, Tuple
+
+# inotify(7) event flags
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+WATCH_MASK = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE
+EVENT_HEADER = struct.Struct('iIII')
+
+# Files still being written by downloaders and editors
+PARTIAL_SUFFIXES = ('.part', '.tmp', '.ytdl', '.crdownload', '.swp')
+
+
+def is_partial(path: str) -> bool:
+    name = os.path.basename(path)
+    return name.startswith('.') or name.endswith(PARTIAL_SUFFIXES)
+
+
+def file_signature(path: str) -> Optional[Tuple[int, int]]:
+    """(size, mtime_ns) of a file, or None if it is gone"""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_size, stat.st_mtime_ns
+
+
+def is_excluded(path: str, excluded: Sequence[str]) -> bool:
+    """Whether `path` is one of the `excluded` paths or inside one of them"""
+    path = os.path.abspath(path)
+    return any(path == other or path.startswith(other.rstrip(os.sep) + os.sep)
+               for other in map(os.path.abspath, excluded))
+
+
+def walk_files(roots: Sequence[str], excluded: Sequence[str] = ()) -> Iterator[str]:
+    """Files under `roots`, skipping partial files and the `excluded` paths"""
+    for root in roots:
+        for directory, subdirectories, files in os.walk(root):
+            subdirectories[:] = [name for name in subdirectories
+                                 if not is_excluded(os.path.join(directory, name), excluded)]
+            for name in files:
+                path = os.path.join(directory, name)
+                if not is_partial(path) and not is_excluded(path, excluded):
+                    yield path
+
+
+class InotifyWatcher:
+    """Recursive directory watcher on Linux inotify, through ctypes.
+    Directories in `excluded` are not watched."""
+
+    def __init__(self, roots: Sequence[str], excluded: Sequence[str] = ()):
+        self.roots = list(roots)
+        self.excluded = list(excluded)
+        self._libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        self._fd = self._libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self._fd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_init1 failed')
+        self._directories: Dict[int, str] = {}
+        for root in self.roots:
+            self._watch_tree(root)
+
+    def _watch_tree(self, root: str) -> Set[str]:
+        """Watch `root` and its subdirectories; return files already inside
+        (they may have been written before the watch was in place)"""
+        found = set()
+        if is_excluded(root, self.excluded):
+            return found
+        for directory, subdirectories, files in os.walk(root):
+            subdirectories[:] = [name for name in subdirectories
+                                 if not is_excluded(os.path.join(directory, name), self.excluded)]
+            wd = self._libc.inotify_add_watch(self._fd, os.fsencode(directory), WATCH_MASK)
+            if wd < 0:
+                raise OSError(ctypes.get_errno(), f"inotify_add_watch failed for {directory}")
+            self._directories[wd] = directory
+            found.update(os.path.join(directory, name) for name in files)
+        return found
+
+    def poll(self, timeout: float) -> Set[str]:
+        """Paths created or written within `timeout` seconds"""
+        changed: Set[str] = set()
+        readable, _, _ = select.select([self._fd], [], [], timeout)
+        while readable:
+            try:
+                data = os.read(self._fd, 64 * 1024)
+            except BlockingIOError:
+                break
+            offset = 0
+            while offset < len(data):
+                wd, mask, _, length = EVENT_HEADER.unpack_from(data, offset)
+                name = data[offset + EVENT_HEADER.size:offset + EVENT_HEADER.size + length].rstrip(b'\0')
+                offset += EVENT_HEADER.size + length
+                if mask & IN_Q_OVERFLOW:
+                    # Events were dropped: report every file so nothing is missed
+                    changed.update(walk_files(self.roots, self.excluded))
+                    continue
+                if mask & IN_IGNORED:
+                    self._directories.pop(wd, None)
+                    continue
+                directory = self._directories.get(wd)
+                if directory is None or not name:
+                    continue
+                path = os.path.join(directory, os.fsdecode(name))
+                if mask & IN_ISDIR:
+                    if mask & (IN_CREATE | IN_MOVED_TO):
+                        changed.update(self._watch_tree(path))
+                else:
+                    changed.add(path)
+            readable, _, _ = select.select([self._fd], [], [], 0)
+        return {path for path in changed if not is_partial(path) and not is_excluded(path, self.excluded)}
+
+    def close(self):
+        os.close(self._fd)
+
+
+class PollingWatcher:
+    """Fallback watcher comparing (size, mtime) of every file between scans"""
+
+    def __init__(self, roots: Sequence[str], interval: float = 2.0, excluded: Sequence[str] = ()):
+        self.roots = list(roots)
+        self.interval = interval
+        self.excluded = list(excluded)
+        self._signatures = self._scan()
+        self._last_scan = time.monotonic()
+
+    def _scan(self) -> Dict[str, Tuple[int, int]]:
+        signatures = {}
+        for path in walk_files(self.roots, self.excluded):
+            signature = file_signature(path)
+            if signature is not None:
+                signatures[path] = signature
+        return signatures
+
+    def poll(self, timeout: float) -> Set[str]:
+        time.sleep(max(0.0, min(timeout, self._last_scan + self.interval - time.monotonic())))
+        if time.monotonic() - self._last_scan < self.interval:
+            return set()
+        signatures = self._scan()
+        self._last_scan = time.monotonic()
+        changed = {path for path, signature in signatures.items() if self._signatures.get(path) != signature}
+        self._signatures = signatures
+        return changed
+
+    def close(self):
+        pass
+
+
+def create_watcher(roots: Sequence[str], poll_interval: float = 2.0, force_polling: bool = False,
+                   excluded: Sequence[str] = ()):
+    """inotify watcher when the platform supports it, else a polling watcher"""
+    if not force_polling:
+        try:
+            return InotifyWatcher(roots, excluded)
+        except (OSError, AttributeError, TypeError):
+            # No inotify (not Linux, watch limit reached, ...)
+            pass
+    return PollingWatcher(roots, poll_interval, excluded)
+
+
+class Debouncer:
+    """Holds changed files until their size and mtime have been stable for
+    `settle_seconds`, so partially written files are not ingested"""
+
+    def __init__(self, settle_seconds: float = 2.0):
+        self.settle_seconds = settle_seconds
+        self._pending: Dict[str, Tuple[Optional[Tuple[int, int]], float]] = {}
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+    def add(self, paths):
+        now = time.monotonic()
+        for path in paths:
+            self._pending[path] = (file_signature(path), now)
+
+    def ready(self) -> Dict[str, Tuple[int, int]]:
+        """Files that stopped changing, with their signature"""
+        now = time.monotonic()
+        ready = {}
+        for path, (signature, since) in list(self._pending.items()):
+            current = file_signature(path)
+            if current is None:
+                del self._pending[path]
+            elif current != signature:
+                self._pending[path] = (current, now)
+            elif now - since >= self.settle_seconds:
+                ready[path] = current
+                del self._pending[path]
+        return ready
@@ -0,0 +1,131 @@
+import numpy as np
+from datetime import date
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+from utils.lexical_index import LexicalIndex
+from utils.text_utils import TextPreprocessor
+from utils.vector_utils import VectorManager
+
+SEARCH_MODES = ('dense', 'lexical', 'hybrid')
+FILTER_KEYS = ('participants', 'uploader', 'date_from', 'date_to')
+# Filters matching more of the index than this are applied to the hits of an unfiltered search
+BROAD_FILTER_FRACTION = 0.1
+
+
+def reciprocal_rank_fusion(rankings: Sequence[Sequence[str]], k: int = 60) -> List[Tuple[str, float]]:
+    """Fuse several ranked lists of text ids with reciprocal rank fusion"""
+    scores: Dict[str, float] = {}
+    for ranking in rankings:
+        for rank, text_id in enumerate(ranking):
+            scores[text_id] = scores.get(text_id, 0.0) + 1.0 / (k + rank + 1)
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)
+
+
+def dense_text_ids(vector_manager: VectorManager, vector_ids: np.ndarray) -> List[str]:
+    """Map a row of search result vector ids to text ids, keeping rank order"""
+    text_ids = []
+    for meta in vector_manager.lookup_metadata([vector_id for vector_id in vector_ids if vector_id >= 0]):
+        if meta and meta['text_id'] not in text_ids:
+            text_ids.append(meta['text_id'])
+    return text_ids
+
+
+def normalize_filters(filters) -> Dict:
+    """Validate metadata filters (participants, uploader, date_from, date_to)
+    and drop empty ones. Raises ValueError on anything malformed."""
+    if filters is None:
+        return {}
+    if not isinstance(filters, dict):
+        raise ValueError("filters must be an object")
+    filters = {key: value for key, value in filters.items() if value}
+    unknown = set(filters) - set(FILTER_KEYS)
+    if unknown:
+        raise ValueError(f"Unknown filters: {', '.join(sorted(unknown))}. Use {FILTER_KEYS}")
+    if isinstance(filters.get('participants'), str):
+        filters['participants'] = [filters['participants']]
+    if 'participants' in filters and not (isinstance(filters['participants'], list)
+                                          and all(isinstance(p, str) for p in filters['participants'])):
+        raise ValueError("participants must be a string or a list of strings")
+    if 'uploader' in filters and not isinstance(filters['uploader'], str):
+        raise ValueError("uploader must be a string")
+    for key in ('date_from', 'date_to'):
+        if key in filters and not isinstance(filters[key], date):
+            try:
+                filters[key] = date.fromisoformat(filters[key])
+            except (TypeError, ValueError):
+                raise ValueError(f"{key} must be a date in YYYY-MM-DD format, got {filters[key]!r}")
+    return filters
+
+
+def filtered_search(search: Callable[[int, Optional[np.ndarray], Optional[set]], List[Dict]], db_manager,
+                    filters: Optional[Dict], k: int, index_size: int,
+                    broad_fraction: float = BROAD_FILTER_FRACTION) -> List[Dict]:
+    """Run `search(k, allowed_vector_ids, allowed_text_ids)`, which returns
+    ranked hits with a `text_id`, under metadata filters.
+
+    The vectors a filter matches are counted first. A selective filter is
+    resolved to the vector and text ids it allows, and only those are
+    searched. A filter matching more than `broad_fraction` of the index would
+    cost more to resolve than to skip: the index is searched unfiltered, deep
+    enough that about twice k matching hits are expected, and the hits are
+    checked against the filter in one query. If fewer than k of them match,
+    the filtered search runs after all.
+    """
+    filters = normalize_filters(filters)
+    if not filters:
+        return search(k, None, None)
+    if db_manager is None:
+        raise ValueError("Filtered search requires a database connection")
+    matching = db_manager.count_filtered_vectors(**filters)
+    if not matching:
+        return []
+
+    fraction = matching / max(index_size, 1)
+    if fraction > broad_fraction:
+        depth = int(np.ceil(2 * k / min(fraction, 1.0)))
+        hits = search(depth, None, None)
+        allowed = db_manager.filter_text_ids({hit['text_id'] for hit in hits if hit.get('text_id')}, **filters)
+        kept = [hit for hit in hits if hit.get('text_id') in allowed]
+        if len(kept) >= k or len(hits) < depth:
+            return kept[:k]
+
+    pairs = db_manager.get_filtered_vectors(**filters)
+    return search(k, np.array([vector_id for vector_id, _ in pairs], dtype='int64'), {text_id for _, text_id in pairs})
+
+
+class HybridSearcher:
+    """Combines FastText/FAISS dense retrieval with BM25 lexical retrieval"""
+
+    def __init__(self, vector_manager: VectorManager, lexical_index: LexicalIndex,
+                 text_processor: Optional[TextPreprocessor] = None, rrf_k: int = 60, db_manager=None):
+        """`db_manager` resolves metadata filters to the vector and text ids they allow"""
+        self.vector_manager = vector_manager
+        self.db_manager = db_manager
+        self.lexical_index = lexical_index
+        self.text_processor = text_processor or TextPreprocessor()
+        self.rrf_k = rrf_k
+
+    def search(self, query: str, k: int = 5, mode: str = 'hybrid', candidates: int = 50,
+               filters: Optional[Dict] = None) -> List[Dict]:
+        """Search in `dense`, `lexical` or `hybrid` mode and return ranked text ids.
+
+        `filters` restrict both retrievers to the matching texts (see `filtered_search`).
+        """
+        if mode not in SEARCH_MODES:
+            raise ValueError(f"Unknown search mode: {mode}. Use one of {SEARCH_MODES}")
+        processed_query = self.text_processor.preprocess_text(query)
+
+        def search(k, allowed_vector_ids, allowed_text_ids):
+            depth = max(k, candidates)
+            rankings = []
+            if mode in ('dense', 'hybrid'):
+                query_vector = self.vector_manager.text_to_vector(processed_query)
+                _, vector_ids = self.vector_manager.search(query_vector, depth, allowed_vector_ids)
+                rankings.append(dense_text_ids(self.vector_manager, vector_ids))
+            if mode in ('lexical', 'hybrid'):
+                rankings.append([text_id for text_id, _ in
+                                 self.lexical_index.search(processed_query, depth, allowed_text_ids)])
+            fused = reciprocal_rank_fusion(rankings, self.rrf_k)[:k]
+            return [{'text_id': text_id, 'score': score} for text_id, score in fused]
+
+        return filtered_search(search, self.db_manager, filters, k, self.vector_manager.store.ntotal)
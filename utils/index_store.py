@@ -0,0 +1,451 @@
+import os
+import json
+import numpy as np
+import faiss
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from utils.file_utils import atomic_save_array, atomic_write_bytes, retire_stale_files
+
+MANIFEST_FILE = 'manifest.json'
+
+
+def _inverse_norms(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=1).astype('float32')
+    return np.divide(1.0, norms, out=np.zeros_like(norms), where=norms > 0)
+
+
+class IndexStore:
+    """Append-only, sharded on-disk vector index.
+
+    Each flush writes the buffered vectors as a new shard (`<name>.vectors.npy`,
+    the sorted int64 vector ids in `<name>.ids.npy` and the inverse L2 norms
+    used by cosine search in `<name>.inv_norms.npy`) and then atomically
+    replaces `manifest.json`. Deleted ids are kept as tombstones until
+    `compact` rewrites the shards, which `flush` does on its own once more
+    than `max_shards` shards or a `max_dead_fraction` of tombstones have
+    piled up. Shards are opened memory-mapped, so opening
+    a store costs only the manifest read and pages are faulted in on search.
+    Files dropped from the manifest are deleted by a later commit, once they
+    have been unreferenced for STALE_FILE_GRACE_SECONDS.
+    """
+
+    def __init__(self, index_dir: str, vector_dim: int = 300, mmap: bool = True, max_shards: int = 16,
+                 max_dead_fraction: float = 0.2):
+        self.index_dir = index_dir
+        self.vector_dim = vector_dim
+        self.mmap = mmap
+        self.max_shards = max_shards
+        self.max_dead_fraction = max_dead_fraction
+        os.makedirs(index_dir, exist_ok=True)
+
+        self.generation = 0
+        self.next_id = 0
+        self.shards: List[Dict] = []
+        self.tombstones = np.empty(0, dtype='int64')
+        self.checkpoint: Optional[Dict] = None
+        # Embedding backend and model the vectors were computed with (see VectorManager)
+        self.embedding_backend: Optional[str] = None
+        self.embedding_model: Optional[str] = None
+        self.retired: Dict[str, float] = {}
+        self._pending_vectors: List[np.ndarray] = []
+        self._pending_ids: List[np.ndarray] = []
+        self._tombstones_dirty = False
+        self._shard_cache: Dict[str, Tuple[np.ndarray, np.ndarray]] = {}
+        self._dead_cache: Dict[str, Optional[np.ndarray]] = {}
+        self._inv_norms_cache: Dict[str, np.ndarray] = {}
+        self._sorted_shards: Dict[str, bool] = {}
+        self._load_manifest()
+
+    @property
+    def manifest_path(self) -> str:
+        return os.path.join(self.index_dir, MANIFEST_FILE)
+
+    def _load_manifest(self):
+        if not os.path.exists(self.manifest_path):
+            return
+        with open(self.manifest_path, 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+        if manifest['vector_dim'] != self.vector_dim:
+            raise ValueError(f"Vector dimension mismatch. Index has {manifest['vector_dim']}, expected {self.vector_dim}")
+        self.generation = manifest['generation']
+        self.next_id = manifest['next_id']
+        self.shards = manifest['shards']
+        if manifest.get('tombstones'):
+            self.tombstones = np.load(os.path.join(self.index_dir, manifest['tombstones']))
+        self.checkpoint = manifest.get('checkpoint')
+        self.embedding_backend = manifest.get('embedding_backend')
+        self.embedding_model = manifest.get('embedding_model')
+        self.retired = manifest.get('retired', {})
+
+    def _write_manifest(self):
+        """Commit the current shard list and tombstones as a new generation"""
+        self.generation += 1
+        tombstones_file = None
+        if len(self.tombstones):
+            tombstones_file = f"tombstones_{self.generation:08d}.npy"
+            atomic_save_array(os.path.join(self.index_dir, tombstones_file), self.tombstones)
+        expired = self._retire_stale_files(tombstones_file)
+        manifest = {
+            'vector_dim': self.vector_dim,
+            'embedding_backend': self.embedding_backend,
+            'embedding_model': self.embedding_model,
+            'generation': self.generation,
+            'next_id': self.next_id,
+            'shards': self.shards,
+            'tombstones': tombstones_file,
+            'checkpoint': self.checkpoint,
+            'retired': self.retired,
+        }
+        atomic_write_bytes(self.manifest_path, json.dumps(manifest, indent=2).encode('utf-8'))
+        self._tombstones_dirty = False
+        self._dead_cache.clear()
+        for filename in expired:
+            os.remove(os.path.join(self.index_dir, filename))
+
+    def _retire_stale_files(self, current_tombstones: Optional[str]) -> List[str]:
+        """Record when files stopped being referenced; returns those past the grace period"""
+        live = {current_tombstones, MANIFEST_FILE}
+        for shard in self.shards:
+            live.add(f"{shard['name']}.vectors.npy")
+            live.add(f"{shard['name']}.ids.npy")
+            live.add(f"{shard['name']}.inv_norms.npy")
+        self.retired, expired = retire_stale_files(
+            self.index_dir,
+            lambda filename: filename.endswith('.npy') and filename.startswith(('tombstones_', 'shard_')),
+            live, self.retired
+        )
+        return expired
+
+    def _open_shard(self, shard: Dict) -> Tuple[np.ndarray, np.ndarray]:
+        name = shard['name']
+        if name not in self._shard_cache:
+            mmap_mode = 'r' if self.mmap else None
+            vectors = np.load(os.path.join(self.index_dir, f"{name}.vectors.npy"), mmap_mode=mmap_mode)
+            ids = np.load(os.path.join(self.index_dir, f"{name}.ids.npy"))
+            self._shard_cache[name] = (vectors, ids)
+        return self._shard_cache[name]
+
+    def _inv_norms(self, key: str, vectors: np.ndarray) -> np.ndarray:
+        """Inverse L2 norm of every row of a segment (0 for zero vectors).
+        Shards written before norms were stored get theirs computed once."""
+        if key == 'pending':
+            return _inverse_norms(vectors)
+        if key not in self._inv_norms_cache:
+            path = os.path.join(self.index_dir, f"{key}.inv_norms.npy")
+            if os.path.exists(path):
+                self._inv_norms_cache[key] = np.load(path, mmap_mode='r' if self.mmap else None)
+            else:
+                self._inv_norms_cache[key] = _inverse_norms(vectors)
+        return self._inv_norms_cache[key]
+
+    def _dead_mask(self, key: str, ids: np.ndarray) -> Optional[np.ndarray]:
+        """Boolean mask of tombstoned rows in a segment, or None if all are live"""
+        if not len(self.tombstones):
+            return None
+        if key not in self._dead_cache:
+            mask = np.isin(ids, self.tombstones)
+            self._dead_cache[key] = mask if mask.any() else None
+        return self._dead_cache[key]
+
+    def _segments(self) -> Iterator[Tuple[str, np.ndarray, np.ndarray]]:
+        """Yield (key, vectors, ids) for every committed shard and the pending buffer"""
+        for shard in self.shards:
+            vectors, ids = self._open_shard(shard)
+            yield shard['name'], vectors, ids
+        if self._pending_ids:
+            vectors = np.concatenate(self._pending_vectors)
+            ids = np.concatenate(self._pending_ids)
+            self._pending_vectors, self._pending_ids = [vectors], [ids]
+            self._dead_cache.pop('pending', None)
+            yield 'pending', vectors, ids
+
+    def iter_live(self, batch_size: int = 50000) -> Iterator[Tuple[str, np.ndarray, np.ndarray]]:
+        """Yield (shard name, ids, vectors) for the live committed vectors in id
+        order, at most `batch_size` rows at a time. Chunks without deleted rows
+        are views of the memory-mapped shard."""
+        for shard in sorted(self.shards, key=lambda shard: shard['min_id']):
+            vectors, ids = self._open_shard(shard)
+            dead = self._dead_mask(shard['name'], ids)
+            for start in range(0, len(ids), batch_size):
+                chunk = slice(start, start + batch_size)
+                if dead is None or not dead[chunk].any():
+                    yield shard['name'], ids[chunk], vectors[chunk]
+                else:
+                    live = ~dead[chunk]
+                    yield shard['name'], ids[chunk][live], vectors[chunk][live]
+
+    @property
+    def ntotal(self) -> int:
+        """Number of live vectors, including unflushed ones"""
+        total = sum(shard['count'] for shard in self.shards)
+        total += sum(len(ids) for ids in self._pending_ids)
+        return total - len(self.tombstones)
+
+    def __len__(self) -> int:
+        return self.ntotal
+
+    def add(self, vectors: np.ndarray, ids: Optional[np.ndarray] = None) -> np.ndarray:
+        """Buffer vectors for the next flush and return their vector ids"""
+        vectors = np.ascontiguousarray(vectors, dtype='float32')
+        if vectors.ndim != 2 or vectors.shape[1] != self.vector_dim:
+            raise ValueError(f"Vector dimension mismatch. Expected {self.vector_dim}, got {vectors.shape[-1]}")
+        if ids is None:
+            ids = np.arange(self.next_id, self.next_id + len(vectors), dtype='int64')
+        else:
+            ids = np.asarray(ids, dtype='int64')
+            if len(ids) != len(vectors):
+                raise ValueError("Number of ids does not match number of vectors")
+            if len(ids) and ids.min() < self.next_id:
+                raise ValueError(f"Vector ids must be >= {self.next_id}")
+        if len(ids):
+            self.next_id = int(ids.max()) + 1
+        self._pending_vectors.append(vectors)
+        self._pending_ids.append(ids)
+        return ids
+
+    def remove(self, ids) -> int:
+        """Delete vectors by id; returns the number of ids newly removed"""
+        ids = np.unique(np.asarray(ids, dtype='int64'))
+        if not len(ids):
+            return 0
+        removed = 0
+        # Unflushed vectors can simply be dropped from the buffer
+        if self._pending_ids:
+            pending_vectors = np.concatenate(self._pending_vectors)
+            pending_ids = np.concatenate(self._pending_ids)
+            keep = ~np.isin(pending_ids, ids)
+            removed += int((~keep).sum())
+            self._pending_vectors, self._pending_ids = [pending_vectors[keep]], [pending_ids[keep]]
+            self._dead_cache.pop('pending', None)
+        committed = np.setdiff1d(ids, self.tombstones)
+        committed = committed[self._committed_mask(committed)]
+        if len(committed):
+            self.tombstones = np.union1d(self.tombstones, committed)
+            self._tombstones_dirty = True
+            self._dead_cache.clear()
+            removed += len(committed)
+        return removed
+
+    def _committed_mask(self, ids: np.ndarray) -> np.ndarray:
+        """Mask of ids that are stored in a committed shard"""
+        mask = np.zeros(len(ids), dtype=bool)
+        for shard in self.shards:
+            _, shard_ids = self._open_shard(shard)
+            mask |= np.isin(ids, shard_ids)
+        return mask
+
+    def flush(self, checkpoint: Optional[Dict] = None) -> bool:
+        """Write buffered vectors as a new shard and commit the manifest, then
+        compact if shards or tombstones have piled up (see `maybe_compact`).
+
+        `checkpoint` is stored in the same manifest write, so it is committed
+        atomically with the vectors (used to resume interrupted runs).
+        """
+        if not self._write_pending(checkpoint):
+            return False
+        self.maybe_compact()
+        return True
+
+    def _write_pending(self, checkpoint: Optional[Dict] = None) -> bool:
+        has_pending = any(len(ids) for ids in self._pending_ids)
+        if not has_pending and not self._tombstones_dirty and checkpoint is None:
+            return False
+        if checkpoint is not None:
+            self.checkpoint = checkpoint
+        if has_pending:
+            vectors = np.concatenate(self._pending_vectors)
+            ids = np.concatenate(self._pending_ids)
+            order = np.argsort(ids, kind='stable')
+            vectors, ids = vectors[order], ids[order]
+            name = f"shard_{self.generation + 1:08d}"
+            atomic_save_array(os.path.join(self.index_dir, f"{name}.vectors.npy"), vectors)
+            atomic_save_array(os.path.join(self.index_dir, f"{name}.ids.npy"), ids)
+            atomic_save_array(os.path.join(self.index_dir, f"{name}.inv_norms.npy"), _inverse_norms(vectors))
+            self.shards.append({
+                'name': name,
+                'count': int(len(ids)),
+                'min_id': int(ids[0]),
+                'max_id': int(ids[-1]),
+            })
+        self._pending_vectors, self._pending_ids = [], []
+        self._write_manifest()
+        return True
+
+    def _allowed_positions(self, key: str, ids: np.ndarray, allowed_ids: np.ndarray) -> np.ndarray:
+        """Row positions in a segment of the ids in `allowed_ids` (sorted)"""
+        if key != 'pending':
+            if key not in self._sorted_shards:
+                self._sorted_shards[key] = bool(np.all(ids[1:] >= ids[:-1]))
+            if self._sorted_shards[key]:
+                # Shards are sorted by id: cost grows with the filter, not the shard
+                positions = np.searchsorted(ids, allowed_ids)
+                in_range = positions < len(ids)
+                positions, wanted = positions[in_range], allowed_ids[in_range]
+                return positions[ids[positions] == wanted]
+        return np.nonzero(np.isin(ids, allowed_ids))[0]
+
+    def search(self, queries: np.ndarray, k: int = 5,
+               allowed_ids: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """Exact L2 search over all live vectors; returns (distances, vector ids).
+
+        With `allowed_ids`, only those vectors are gathered and searched, so a
+        selective filter is cheaper than a full scan.
+        """
+        queries = np.ascontiguousarray(queries, dtype='float32').reshape(-1, self.vector_dim)
+        all_distances = [np.full((len(queries), k), np.inf, dtype='float32')]
+        all_ids = [np.full((len(queries), k), -1, dtype='int64')]
+        if allowed_ids is not None:
+            allowed_ids = np.unique(np.asarray(allowed_ids, dtype='int64'))
+
+        for key, vectors, ids in self._segments():
+            if not len(ids):
+                continue
+            dead = self._dead_mask(key, ids)
+            if allowed_ids is not None:
+                positions = self._allowed_positions(key, ids, allowed_ids)
+                if dead is not None:
+                    positions = positions[~dead[positions]]
+                if not len(positions):
+                    continue
+                vectors, ids, dead = np.ascontiguousarray(vectors[positions]), ids[positions], None
+            n_dead = int(dead.sum()) if dead is not None else 0
+            shard_k = min(len(ids), k + n_dead)
+            distances, positions = faiss.knn(queries, vectors, shard_k)
+            found = ids[positions]
+            if dead is not None:
+                is_dead = dead[positions]
+                distances[is_dead] = np.inf
+                found[is_dead] = -1
+            all_distances.append(distances)
+            all_ids.append(found)
+
+        distances = np.concatenate(all_distances, axis=1)
+        found = np.concatenate(all_ids, axis=1)
+        order = np.argsort(distances, axis=1, kind='stable')[:, :k]
+        return np.take_along_axis(distances, order, axis=1), np.take_along_axis(found, order, axis=1)
+
+    def range_search_cosine(self, queries: np.ndarray, min_similarity: float,
+                            chunk_size: int = 16384) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Find all live vectors with cosine similarity >= `min_similarity` to each query.
+
+        Returns FAISS-style (lims, similarities, vector ids): the matches of
+        query i are at [lims[i]:lims[i + 1]]. Shards are scanned in chunks
+        straight from the memory map; inner products are scaled by the stored
+        inverse norms instead of normalising a copy of every chunk.
+        """
+        queries = np.array(queries, dtype='float32').reshape(-1, self.vector_dim)
+        faiss.normalize_L2(queries)
+        matches = [[] for _ in range(len(queries))]
+
+        for key, vectors, ids in self._segments():
+            dead = self._dead_mask(key, ids)
+            inv_norms = self._inv_norms(key, vectors)
+            for start in range(0, len(ids), chunk_size):
+                chunk = slice(start, start + chunk_size)
+                similarities = vectors[chunk] @ queries.T
+                similarities *= inv_norms[chunk, None]
+                if dead is not None:
+                    similarities[dead[chunk]] = -np.inf
+                rows, query_rows = np.nonzero(similarities >= min_similarity)
+                if not len(rows):
+                    continue
+                order = np.argsort(query_rows, kind='stable')
+                rows, query_rows = rows[order], query_rows[order]
+                bounds = np.searchsorted(query_rows, np.arange(len(queries) + 1))
+                for i in np.nonzero(np.diff(bounds))[0]:
+                    found = rows[bounds[i]:bounds[i + 1]]
+                    matches[i].append((similarities[found, i], ids[found + start]))
+
+        lims = np.zeros(len(queries) + 1, dtype='int64')
+        all_similarities, all_ids = [], []
+        for i, query_matches in enumerate(matches):
+            count = 0
+            for similarities, found_ids in query_matches:
+                all_similarities.append(similarities)
+                all_ids.append(found_ids)
+                count += len(found_ids)
+            lims[i + 1] = lims[i] + count
+        if not all_ids:
+            return lims, np.empty(0, dtype='float32'), np.empty(0, dtype='int64')
+        return lims, np.concatenate(all_similarities), np.concatenate(all_ids)
+
+    def maybe_compact(self) -> bool:
+        """Compact when tombstones make up `max_dead_fraction` of the stored
+        vectors (every shard is rewritten) or there are more than `max_shards`
+        shards. In the latter case only the newest shards are merged: going
+        back from the last two, an older shard joins while it is no larger
+        than the newer ones combined, so each vector is rewritten a
+        logarithmic number of times as the index grows."""
+        stored = sum(shard['count'] for shard in self.shards)
+        if stored and len(self.tombstones) >= self.max_dead_fraction * stored:
+            self.compact()
+            return True
+        if len(self.shards) <= self.max_shards:
+            return False
+        first = len(self.shards) - 2
+        newer = self.shards[-1]['count'] + self.shards[-2]['count']
+        while first > 0 and self.shards[first - 1]['count'] <= newer:
+            first -= 1
+            newer += self.shards[first]['count']
+        self.compact(first)
+        return True
+
+    def compact(self, first_shard: int = 0):
+        """Merge the shards from `first_shard` on (all of them by default) into
+        one, physically dropping their tombstoned vectors"""
+        self._write_pending()
+        kept, merging = self.shards[:first_shard], self.shards[first_shard:]
+        dead_masks = [self._dead_mask(shard['name'], self._open_shard(shard)[1]) for shard in merging]
+        if len(merging) <= 1 and all(dead is None for dead in dead_masks):
+            return
+        dropped = [self._open_shard(shard)[1][dead] for shard, dead in zip(merging, dead_masks) if dead is not None]
+        # Tombstones of the merged shards are no longer needed once their rows are gone
+        tombstones = np.setdiff1d(self.tombstones, np.concatenate(dropped)) if dropped else self.tombstones
+        live_total = sum(shard['count'] for shard in merging) - sum(len(ids) for ids in dropped)
+        for shard in merging:
+            self._inv_norms_cache.pop(shard['name'], None)
+            self._sorted_shards.pop(shard['name'], None)
+        if not live_total:
+            for shard in merging:
+                self._shard_cache.pop(shard['name'], None)
+            self.tombstones = tombstones
+            self.shards = kept
+            self._write_manifest()
+            return
+        name = f"shard_{self.generation + 1:08d}"
+        vectors_path = os.path.join(self.index_dir, f"{name}.vectors.npy")
+        ids_path = os.path.join(self.index_dir, f"{name}.ids.npy")
+
+        # Stream shard by shard into a memory-mapped output to bound memory
+        merged = np.lib.format.open_memmap(f"{vectors_path}.tmp", mode='w+', dtype='float32',
+                                           shape=(live_total, self.vector_dim))
+        merged_ids = np.empty(live_total, dtype='int64')
+        offset = 0
+        for shard, dead in zip(merging, dead_masks):
+            vectors, ids = self._open_shard(shard)
+            live = ~dead if dead is not None else slice(None)
+            count = len(ids) - (int(dead.sum()) if dead is not None else 0)
+            merged[offset:offset + count] = vectors[live]
+            merged_ids[offset:offset + count] = ids[live]
+            offset += count
+            # Merged shards are no longer searched; release their mappings
+            self._shard_cache.pop(shard['name'], None)
+        merged.flush()
+        del merged
+        os.replace(f"{vectors_path}.tmp", vectors_path)
+        atomic_save_array(ids_path, merged_ids)
+        merged = np.load(vectors_path, mmap_mode='r')
+        inv_norms = np.empty(live_total, dtype='float32')
+        for start in range(0, live_total, 65536):
+            inv_norms[start:start + 65536] = _inverse_norms(merged[start:start + 65536])
+        atomic_save_array(os.path.join(self.index_dir, f"{name}.inv_norms.npy"), inv_norms)
+        del merged
+
+        self.tombstones = tombstones
+        self.shards = kept + [{
+            'name': name,
+            'count': int(live_total),
+            'min_id': int(merged_ids[0]),
+            'max_id': int(merged_ids[-1]),
+        }]
+        self._write_manifest()
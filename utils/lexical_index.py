@@ -0,0 +1,446 @@
+import os
+import json
+import zlib
+import numpy as np
+from typing import Collection, Dict, List, Optional, Sequence, Tuple
+
+from utils.file_utils import atomic_save_array, atomic_write_bytes, retire_stale_files
+
+LEXICAL_MANIFEST_FILE = 'lexical.json'
+MAX_TERM_BYTES = 64
+TEXT_ID_DTYPE = 'S50'
+
+
+def _encode_term(term: str) -> bytes:
+    return term.encode('utf-8')[:MAX_TERM_BYTES]
+
+
+def encode_postings(doc_ids: np.ndarray, term_freqs: np.ndarray) -> bytes:
+    """Delta-encode sorted doc ids and compress them together with term frequencies"""
+    deltas = np.diff(doc_ids, prepend=0).astype('uint32')
+    freqs = np.minimum(term_freqs, np.iinfo('uint16').max).astype('uint16')
+    return zlib.compress(deltas.tobytes() + freqs.tobytes(), 1)
+
+
+def decode_postings(blob: bytes, doc_freq: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Inverse of `encode_postings`: returns (doc ids, term frequencies)"""
+    raw = zlib.decompress(blob)
+    deltas = np.frombuffer(raw, dtype='uint32', count=doc_freq)
+    freqs = np.frombuffer(raw, dtype='uint16', count=doc_freq, offset=doc_freq * 4)
+    return np.cumsum(deltas, dtype='int64'), freqs
+
+
+class LexicalIndex:
+    """Incrementally maintained on-disk inverted index with BM25 scoring.
+
+    Documents are buffered and written as immutable segments on `flush`. A
+    segment stores its sorted vocabulary (`terms.npy`), per-term offsets and
+    document frequencies, one compressed postings list per term in
+    `postings.bin`, and the text id and token count of every document. Doc
+    ids are global and contiguous per segment. Removed documents are kept as
+    tombstones until `merge` rewrites the segments; they are left out of the
+    BM25 corpus statistics as soon as they are removed. `maybe_merge` bounds
+    the segment count and tombstones. Files dropped from the
+    manifest are deleted once unreferenced for STALE_FILE_GRACE_SECONDS, as in
+    IndexStore, since readers open segments lazily.
+    """
+
+    def __init__(self, index_dir: str, k1: float = 1.2, b: float = 0.75, max_segments: int = 16,
+                 max_dead_fraction: float = 0.2, max_segment_docs: int = 1000000):
+        self.index_dir = index_dir
+        self.k1 = k1
+        self.b = b
+        self.max_segments = max_segments
+        self.max_dead_fraction = max_dead_fraction
+        self.max_segment_docs = max_segment_docs
+        os.makedirs(index_dir, exist_ok=True)
+
+        self.generation = 0
+        self.num_docs = 0
+        self.total_length = 0
+        self.removed_length = 0
+        self.segments: List[Dict] = []
+        self.tombstones = np.empty(0, dtype='int64')
+        self.retired: Dict[str, float] = {}
+        self._tombstones_dirty = False
+        self._segment_cache: Dict[str, Dict] = {}
+        self._reset_pending()
+        self._load_manifest()
+
+    def _reset_pending(self):
+        self._pending_vocab: Dict[bytes, int] = {}
+        self._pending_terms: List[np.ndarray] = []
+        self._pending_text_ids: List[str] = []
+
+    @property
+    def manifest_path(self) -> str:
+        return os.path.join(self.index_dir, LEXICAL_MANIFEST_FILE)
+
+    def _load_manifest(self):
+        if not os.path.exists(self.manifest_path):
+            return
+        with open(self.manifest_path, 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+        self.generation = manifest['generation']
+        self.num_docs = manifest['num_docs']
+        self.total_length = manifest['total_length']
+        self.segments = manifest['segments']
+        if manifest.get('tombstones'):
+            self.tombstones = np.load(os.path.join(self.index_dir, manifest['tombstones']))
+        if 'removed_length' in manifest:
+            self.removed_length = manifest['removed_length']
+        elif len(self.tombstones):
+            self.removed_length = int(self._doc_lengths_of(self.tombstones).sum())
+        self.retired = manifest.get('retired', {})
+
+    def _write_manifest(self):
+        self.generation += 1
+        tombstones_file = None
+        if len(self.tombstones):
+            tombstones_file = f"lex_tombstones_{self.generation:08d}.npy"
+            atomic_save_array(os.path.join(self.index_dir, tombstones_file), self.tombstones)
+        live = {tombstones_file}
+        for segment in self.segments:
+            live.update(f"{segment['name']}.{suffix}" for suffix in self._SEGMENT_FILES)
+        self.retired, expired = retire_stale_files(
+            self.index_dir, lambda filename: filename.startswith('lex_'), live, self.retired
+        )
+        manifest = {
+            'generation': self.generation,
+            'num_docs': self.num_docs,
+            'total_length': self.total_length,
+            'removed_length': self.removed_length,
+            'segments': self.segments,
+            'tombstones': tombstones_file,
+            'retired': self.retired,
+        }
+        atomic_write_bytes(self.manifest_path, json.dumps(manifest, indent=2).encode('utf-8'))
+        self._tombstones_dirty = False
+        for filename in expired:
+            os.remove(os.path.join(self.index_dir, filename))
+
+    _SEGMENT_FILES = ('terms.npy', 'offsets.npy', 'doc_freqs.npy', 'postings.bin', 'text_ids.npy', 'doc_lengths.npy')
+
+    def _open_segment(self, segment: Dict) -> Dict:
+        name = segment['name']
+        if name not in self._segment_cache:
+            path = os.path.join(self.index_dir, name)
+            self._segment_cache[name] = {
+                'terms': np.load(f"{path}.terms.npy", mmap_mode='r'),
+                'offsets': np.load(f"{path}.offsets.npy", mmap_mode='r'),
+                'doc_freqs': np.load(f"{path}.doc_freqs.npy", mmap_mode='r'),
+                'postings': np.memmap(f"{path}.postings.bin", dtype='uint8', mode='r')
+                if segment['postings_bytes'] else np.empty(0, dtype='uint8'),
+                'text_ids': np.load(f"{path}.text_ids.npy", mmap_mode='r'),
+                'doc_lengths': np.load(f"{path}.doc_lengths.npy", mmap_mode='r'),
+            }
+        return self._segment_cache[name]
+
+    @property
+    def live_docs(self) -> int:
+        return self.num_docs + len(self._pending_text_ids) - len(self.tombstones)
+
+    @property
+    def committed_live_docs(self) -> int:
+        """Committed documents that are not tombstoned (the BM25 corpus size)"""
+        return self.num_docs - len(self.tombstones)
+
+    def add(self, text_id: str, processed_text: str):
+        """Buffer a document (already cleaned and stopword-free) for the next flush"""
+        vocab = self._pending_vocab
+        term_ids = [vocab.setdefault(_encode_term(token), len(vocab)) for token in processed_text.split()]
+        self._pending_terms.append(np.array(term_ids, dtype='int64'))
+        self._pending_text_ids.append(text_id)
+
+    def remove(self, text_ids: Sequence[str]) -> int:
+        """Tombstone every committed document with one of the given text ids"""
+        wanted = np.array([text_id.encode('utf-8') for text_id in text_ids], dtype=TEXT_ID_DTYPE)
+        removed = []
+        for segment in self.segments:
+            mask = np.isin(self._open_segment(segment)['text_ids'], wanted)
+            if mask.any():
+                removed.append(segment['doc_base'] + np.nonzero(mask)[0])
+        return self._tombstone(removed)
+
+    def discard_after(self, checkpoint_id: int) -> int:
+        """Tombstone the documents of segments flushed for a checkpoint after
+        `checkpoint_id`.
+
+        The lexical index is flushed before the vector index commits a
+        checkpoint, so after a crash it can hold postings of texts that are
+        still unprocessed and will be indexed again.
+        """
+        removed = [np.arange(segment['doc_base'], segment['doc_base'] + segment['doc_count'])
+                   for segment in self.segments if segment.get('checkpoint', 0) > checkpoint_id]
+        removed = self._tombstone(removed)
+        if removed:
+            self._write_manifest()
+        return removed
+
+    def _tombstone(self, doc_ids: List[np.ndarray]) -> int:
+        if not doc_ids:
+            return 0
+        removed = np.setdiff1d(np.concatenate(doc_ids), self.tombstones)
+        if len(removed):
+            self.tombstones = np.union1d(self.tombstones, removed)
+            self.removed_length += int(self._doc_lengths_of(removed).sum())
+            self._tombstones_dirty = True
+        return len(removed)
+
+    def flush(self, checkpoint_id: Optional[int] = None) -> bool:
+        """Write buffered documents as a new segment and commit the manifest.
+        The segment records the vectorization `checkpoint_id` it belongs to
+        (see `discard_after`)."""
+        if not self._pending_text_ids:
+            if self._tombstones_dirty:
+                self._write_manifest()
+                return True
+            return False
+
+        segment = self._write_segment(f"lex_{self.generation + 1:08d}", self.num_docs)
+        if checkpoint_id is not None:
+            segment['checkpoint'] = checkpoint_id
+        self.segments.append(segment)
+        self.num_docs += segment['doc_count']
+        self.total_length += segment['total_length']
+        self._write_manifest()
+        return True
+
+    def _write_segment(self, name: str, doc_base: int) -> Dict:
+        """Write the buffered documents as segment `name` without committing it"""
+        vocab = self._pending_vocab
+        doc_lengths = np.array([len(terms) for terms in self._pending_terms], dtype='int32')
+        n_docs = len(doc_lengths)
+        path = os.path.join(self.index_dir, name)
+
+        # Renumber term ids in sorted term order so the vocabulary can be binary searched
+        terms = np.array(list(vocab.keys()), dtype=f"S{MAX_TERM_BYTES}")
+        order = np.argsort(terms, kind='stable')
+        rank = np.empty(len(terms), dtype='int64')
+        rank[order] = np.arange(len(terms))
+        terms = terms[order].astype(f"S{max(1, max((len(t) for t in vocab), default=1))}")
+
+        # Sort (term, doc) pairs and count term frequencies in one pass
+        term_ids = np.concatenate(self._pending_terms) if n_docs else np.empty(0, dtype='int64')
+        doc_ids = np.repeat(np.arange(n_docs, dtype='int64'), doc_lengths)
+        keys, freqs = np.unique(rank[term_ids] * n_docs + doc_ids, return_counts=True)
+        pair_terms, pair_docs = keys // n_docs, keys % n_docs
+        starts = np.searchsorted(pair_terms, np.arange(len(terms) + 1))
+        doc_freqs = np.diff(starts).astype('int32')
+
+        offsets = np.zeros(len(terms) + 1, dtype='int64')
+        with open(f"{path}.postings.bin.tmp", 'wb') as f:
+            for i in range(len(terms)):
+                blob = encode_postings(pair_docs[starts[i]:starts[i + 1]], freqs[starts[i]:starts[i + 1]])
+                f.write(blob)
+                offsets[i + 1] = offsets[i] + len(blob)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(f"{path}.postings.bin.tmp", f"{path}.postings.bin")
+        atomic_save_array(f"{path}.terms.npy", terms)
+        atomic_save_array(f"{path}.offsets.npy", offsets)
+        atomic_save_array(f"{path}.doc_freqs.npy", doc_freqs)
+        atomic_save_array(f"{path}.text_ids.npy",
+                           np.array([text_id.encode('utf-8') for text_id in self._pending_text_ids], dtype=TEXT_ID_DTYPE))
+        atomic_save_array(f"{path}.doc_lengths.npy", doc_lengths)
+
+        self._reset_pending()
+        return {
+            'name': name,
+            'doc_base': doc_base,
+            'doc_count': n_docs,
+            'term_count': int(len(terms)),
+            'postings_bytes': int(offsets[-1]),
+            'total_length': int(doc_lengths.sum()),
+        }
+
+    def _postings(self, term: bytes) -> List[Tuple[Dict, np.ndarray, np.ndarray]]:
+        """Postings of a term in every segment: (segment, global doc ids, term frequencies)"""
+        found = []
+        for segment in self.segments:
+            data = self._open_segment(segment)
+            terms = data['terms']
+            position = int(np.searchsorted(terms, term))
+            if position >= len(terms) or terms[position] != term:
+                continue
+            start, end = int(data['offsets'][position]), int(data['offsets'][position + 1])
+            doc_ids, freqs = decode_postings(data['postings'][start:end].tobytes(), int(data['doc_freqs'][position]))
+            found.append((segment, doc_ids, freqs))
+        return found
+
+    def search(self, processed_query: str, k: int = 10,
+               allowed_text_ids: Optional[Collection[str]] = None) -> List[Tuple[str, float]]:
+        """BM25 top-k over committed segments; returns (text_id, score) pairs.
+
+        With `allowed_text_ids`, only those documents compete for the top k.
+        """
+        num_docs = self.committed_live_docs
+        if not self.segments or num_docs <= 0:
+            return []
+        avgdl = (self.total_length - self.removed_length) / num_docs
+        candidate_docs, candidate_scores = [], []
+
+        for term in set(_encode_term(token) for token in processed_query.split()):
+            postings = self._postings(term)
+            if len(self.tombstones):
+                # Removed documents count neither towards document frequencies nor as candidates
+                live_postings = []
+                for segment, doc_ids, freqs in postings:
+                    live = ~np.isin(doc_ids + segment['doc_base'], self.tombstones)
+                    live_postings.append((segment, doc_ids[live], freqs[live]))
+                postings = live_postings
+            doc_freq = sum(len(doc_ids) for _, doc_ids, _ in postings)
+            if not doc_freq:
+                continue
+            idf = np.log(1.0 + (num_docs - doc_freq + 0.5) / (doc_freq + 0.5))
+            for segment, doc_ids, freqs in postings:
+                doc_lengths = self._open_segment(segment)['doc_lengths'][doc_ids]
+                freqs = freqs.astype('float32')
+                norm = self.k1 * (1.0 - self.b + self.b * doc_lengths / avgdl)
+                candidate_docs.append(doc_ids + segment['doc_base'])
+                candidate_scores.append(idf * freqs * (self.k1 + 1.0) / (freqs + norm))
+
+        if not candidate_docs:
+            return []
+        docs = np.concatenate(candidate_docs)
+        scores = np.concatenate(candidate_scores)
+        # Dense accumulation is cheaper once postings cover a large part of the corpus
+        if len(docs) > self.num_docs // 8:
+            totals = np.bincount(docs, weights=scores, minlength=self.num_docs)
+            docs = np.nonzero(totals)[0]
+            scores = totals[docs]
+        else:
+            docs, inverse = np.unique(docs, return_inverse=True)
+            scores = np.bincount(inverse, weights=scores)
+        if allowed_text_ids is not None:
+            wanted = np.array([text_id.encode('utf-8') for text_id in allowed_text_ids], dtype=TEXT_ID_DTYPE)
+            allowed = np.isin(self._text_ids_of(docs), wanted)
+            docs, scores = docs[allowed], scores[allowed]
+        if not len(docs):
+            return []
+
+        top = np.argpartition(-scores, min(k, len(scores)) - 1)[:k] if len(scores) > k else np.arange(len(scores))
+        top = top[np.argsort(-scores[top], kind='stable')]
+        return [(self._text_id(int(doc)), float(scores[i])) for doc, i in zip(docs[top], top)]
+
+    def _text_ids_of(self, doc_ids: np.ndarray) -> np.ndarray:
+        """Encoded text ids of many global doc ids"""
+        bases = np.array([segment['doc_base'] for segment in self.segments])
+        segment_indices = np.searchsorted(bases, doc_ids, side='right') - 1
+        text_ids = np.empty(len(doc_ids), dtype=TEXT_ID_DTYPE)
+        for segment_index in np.unique(segment_indices):
+            segment = self.segments[segment_index]
+            rows = segment_indices == segment_index
+            text_ids[rows] = self._open_segment(segment)['text_ids'][doc_ids[rows] - segment['doc_base']]
+        return text_ids
+
+    def _doc_lengths_of(self, doc_ids: np.ndarray) -> np.ndarray:
+        """Token counts of many global doc ids"""
+        bases = np.array([segment['doc_base'] for segment in self.segments])
+        segment_indices = np.searchsorted(bases, doc_ids, side='right') - 1
+        doc_lengths = np.zeros(len(doc_ids), dtype='int64')
+        for segment_index in np.unique(segment_indices):
+            segment = self.segments[segment_index]
+            rows = segment_indices == segment_index
+            doc_lengths[rows] = self._open_segment(segment)['doc_lengths'][doc_ids[rows] - segment['doc_base']]
+        return doc_lengths
+
+    def _text_id(self, doc_id: int) -> str:
+        bases = [segment['doc_base'] for segment in self.segments]
+        segment = self.segments[int(np.searchsorted(bases, doc_id, side='right')) - 1]
+        return self._open_segment(segment)['text_ids'][doc_id - segment['doc_base']].decode('utf-8')
+
+    def maybe_merge(self) -> bool:
+        """Merge when tombstones make up `max_dead_fraction` of the documents
+        (every segment is rewritten) or there are more than `max_segments`
+        segments. In the latter case only the newest segments below half of
+        `max_segment_docs` are merged: going back from the last two, an older
+        one joins while it is no larger than the newer ones combined, so each
+        document is rewritten a logarithmic number of times.
+
+        Writers call this once the vector index has committed and
+        `discard_after` has run: merged segments count as committed.
+        """
+        if self.num_docs and len(self.tombstones) >= self.max_dead_fraction * self.num_docs:
+            self.merge()
+            return True
+        if len(self.segments) <= self.max_segments:
+            return False
+        first = len(self.segments)
+        while first > 0 and self.segments[first - 1]['doc_count'] < self.max_segment_docs // 2:
+            first -= 1
+        if len(self.segments) - first < 2:
+            return False
+        start = len(self.segments) - 2
+        newer = self.segments[-1]['doc_count'] + self.segments[-2]['doc_count']
+        while start > first and self.segments[start - 1]['doc_count'] <= newer:
+            start -= 1
+            newer += self.segments[start]['doc_count']
+        self.merge(start)
+        return True
+
+    def merge(self, first_segment: int = 0):
+        """Rewrite the segments from `first_segment` on (all of them by
+        default), dropping their tombstoned documents.
+
+        Segments are read one at a time and their live documents rewritten
+        into segments of at most `max_segment_docs` documents, so memory is
+        bounded by the segment size rather than the corpus. The new segments
+        are committed in one manifest write.
+        """
+        self.flush()
+        kept, merging = self.segments[:first_segment], self.segments[first_segment:]
+        doc_base = merging[0]['doc_base'] if merging else self.num_docs
+        kept_tombstones = self.tombstones[self.tombstones < doc_base]
+        if len(merging) <= 1 and len(kept_tombstones) == len(self.tombstones):
+            return
+        merged = []
+        # Segments written before total_length was recorded get it from their documents
+        total_length = sum(segment['total_length'] if 'total_length' in segment
+                           else int(self._open_segment(segment)['doc_lengths'].sum()) for segment in kept)
+
+        def write_merged():
+            nonlocal doc_base, total_length
+            segment = self._write_segment(f"lex_{self.generation + 1:08d}_{len(merged):04d}", doc_base)
+            merged.append(segment)
+            doc_base += segment['doc_count']
+            total_length += segment['total_length']
+
+        for segment in merging:
+            data = self._open_segment(segment)
+            live = ~np.isin(segment['doc_base'] + np.arange(segment['doc_count']), self.tombstones)
+            # Rebuild per-document term lists from the postings of this segment
+            all_docs, all_terms, all_freqs = [], [], []
+            for position, term in enumerate(data['terms']):
+                start, end = int(data['offsets'][position]), int(data['offsets'][position + 1])
+                doc_ids, freqs = decode_postings(data['postings'][start:end].tobytes(), int(data['doc_freqs'][position]))
+                term_id = self._pending_vocab.setdefault(bytes(term), len(self._pending_vocab))
+                all_docs.append(doc_ids)
+                all_terms.append(np.full(len(doc_ids), term_id, dtype='int64'))
+                all_freqs.append(freqs.astype('int64'))
+            if all_docs:
+                docs, terms, freqs = np.concatenate(all_docs), np.concatenate(all_terms), np.concatenate(all_freqs)
+            else:
+                docs = terms = freqs = np.empty(0, dtype='int64')
+            order = np.argsort(docs, kind='stable')
+            doc_of_token = np.repeat(docs[order], freqs[order])
+            term_of_token = np.repeat(terms[order], freqs[order])
+            bounds = np.searchsorted(doc_of_token, np.arange(segment['doc_count'] + 1))
+            for doc_id in np.nonzero(live)[0]:
+                self._pending_terms.append(term_of_token[bounds[doc_id]:bounds[doc_id + 1]])
+                self._pending_text_ids.append(data['text_ids'][doc_id].decode('utf-8'))
+            del all_docs, all_terms, all_freqs, docs, terms, freqs, doc_of_token, term_of_token
+            if len(self._pending_text_ids) >= self.max_segment_docs:
+                write_merged()
+        if self._pending_text_ids:
+            write_merged()
+        self._reset_pending()
+
+        self.removed_length = int(self._doc_lengths_of(kept_tombstones).sum())
+        self.segments = kept + merged
+        self.num_docs = doc_base
+        self.total_length = total_length
+        self.tombstones = kept_tombstones
+        for segment in merging:
+            self._segment_cache.pop(segment['name'], None)
+        self._write_manifest()
@@ -0,0 +1,64 @@
+import os
+import re
+import json
+import hashlib
+import threading
+from pathlib import Path
+from typing import Any, List, Optional
+
+from langchain_core.language_models.chat_models import SimpleChatModel
+from langchain_core.messages import BaseMessage
+
+
+def text_hash(text: str) -> str:
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+class LLMResponseCache:
+    """On-disk cache of LLM responses keyed by model + prompt template + chunk hash"""
+
+    def __init__(self, cache_dir: str = 'data/cache/llm'):
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+
+    @staticmethod
+    def make_key(model: str, prompt_template: str, chunk: str) -> str:
+        return text_hash('\0'.join([model, prompt_template, text_hash(chunk)]))
+
+    def _path(self, key: str) -> Path:
+        return self.cache_dir / key[:2] / f"{key}.json"
+
+    def get(self, key: str) -> Optional[str]:
+        path = self._path(key)
+        if not path.exists():
+            return None
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)['response']
+
+    def set(self, key: str, response: str, **metadata):
+        path = self._path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # Map workers may cache the same key concurrently: one temp file per thread
+        tmp_path = path.with_name(f"{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'response': response, **metadata}, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+
+class FakeSummaryChatModel(SimpleChatModel):
+    """Local stand-in for the chat API: "summarizes" by keeping the first
+    sentences of the text after the prompt's colon. Deterministic and offline."""
+
+    max_sentences: int = 3
+    model_name: str = 'fake-summary'
+
+    @property
+    def _llm_type(self) -> str:
+        return 'fake-summary'
+
+    def _call(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+              run_manager: Any = None, **kwargs: Any) -> str:
+        prompt = messages[-1].content
+        context = prompt.split(':', 1)[-1].strip()
+        sentences = re.split(r'(?<=[.!?])\s+', context)
+        return ' '.join(sentences[:self.max_sentences])
@@ -0,0 +1,178 @@
+import os
+import gc
+import re
+import time
+import threading
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional
+
+_SIZE_UNITS = {'': 1, 'K': 2 ** 10, 'M': 2 ** 20, 'G': 2 ** 30, 'T': 2 ** 40}
+
+
+def parse_size(size: str) -> int:
+    """Bytes in a size such as '512M', '8G' or '1073741824'"""
+    match = re.fullmatch(r'\s*(\d+(?:\.\d+)?)\s*([KMGT]?)i?B?\s*', str(size), re.IGNORECASE)
+    if not match:
+        raise ValueError(f"Invalid size: {size!r}. Use e.g. 512M or 8G")
+    return int(float(match.group(1)) * _SIZE_UNITS[match.group(2).upper()])
+
+
+def format_size(size: Optional[int]) -> str:
+    if size is None:
+        return 'n/a'
+    for unit in ('B', 'KB', 'MB', 'GB'):
+        if size < 1024 or unit == 'GB':
+            return f"{size:.0f} {unit}" if unit == 'B' else f"{size:.1f} {unit}"
+        size /= 1024
+
+
+def current_rss(pid: Optional[int] = None) -> Optional[int]:
+    """Anonymous resident memory of a process in bytes (Linux only).
+
+    File-backed pages, such as those of memory-mapped index shards, are left
+    out: the kernel can drop them at any time, and they grow with the index
+    rather than with the work a process buffers."""
+    try:
+        with open(f"/proc/{pid or 'self'}/status", 'r') as f:
+            for line in f:
+                if line.startswith('RssAnon:'):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError, IndexError):
+        return None
+    return None
+
+
+def _child_pids(pid: int) -> List[int]:
+    children = []
+    try:
+        tasks = os.listdir(f"/proc/{pid}/task")
+    except OSError:
+        return children
+    for task in tasks:
+        try:
+            with open(f"/proc/{pid}/task/{task}/children", 'r') as f:
+                children.extend(int(child) for child in f.read().split())
+        except (OSError, ValueError):
+            continue
+    return children
+
+
+def tree_rss(pid: Optional[int] = None) -> Optional[int]:
+    """Anonymous RSS of a process and all its descendants (worker processes, ffmpeg).
+    Pages shared after fork are counted once per process, so this errs high."""
+    pid = pid or os.getpid()
+    total = current_rss(pid)
+    if total is None:
+        return None
+    pending = _child_pids(pid)
+    while pending:
+        child = pending.pop()
+        total += current_rss(child) or 0
+        pending.extend(_child_pids(child))
+    return total
+
+
+class MemoryBudget:
+    """RSS limit for a run, shared by every stage of the pipeline.
+
+    Stages ask `over_limit()` before taking in more work and size their
+    chunks with `scale()`. The anonymous RSS of the whole process tree rooted
+    at `pid` (this process by default, the parent in worker processes) is
+    sampled at most every `sample_interval` seconds. Over the limit, a garbage
+    collection is run at most every `gc_interval` seconds before re-checking.
+    `stage()` records the peak RSS of a stage. Without `max_rss` nothing is
+    limited and only peaks are recorded.
+    """
+
+    def __init__(self, max_rss: Optional[int] = None, high_water: float = 0.85, pid: Optional[int] = None,
+                 sample_interval: float = 0.25, gc_interval: float = 5.0):
+        self.max_rss = max_rss
+        self.high_water = high_water
+        self.pid = pid or os.getpid()
+        self.sample_interval = sample_interval
+        self.gc_interval = gc_interval
+        self._last_gc = float('-inf')
+        self.peaks: Dict[str, Dict] = {}
+        self._active: List[str] = []
+        self._last_rss: Optional[int] = None
+        self._last_sample = 0.0
+        self._lock = threading.Lock()
+        self._sampler: Optional[threading.Thread] = None
+
+    @property
+    def limit(self) -> Optional[int]:
+        """RSS above which intake pauses"""
+        return int(self.max_rss * self.high_water) if self.max_rss else None
+
+    def rss(self, fresh: bool = False) -> Optional[int]:
+        """Latest RSS sample; `fresh` samples now instead of using a recent one"""
+        now = time.monotonic()
+        if fresh or now - self._last_sample >= self.sample_interval:
+            rss = tree_rss(self.pid)
+            with self._lock:
+                self._last_rss, self._last_sample = rss, now
+                for name in self._active:
+                    if rss is not None and rss > self.peaks[name]['peak_rss']:
+                        self.peaks[name]['peak_rss'] = rss
+        return self._last_rss
+
+    def over_limit(self) -> bool:
+        if not self.max_rss:
+            return False
+        rss = self.rss()
+        if rss is None or rss < self.limit:
+            return False
+        # Freed Python objects may still be held by the allocator until a collection
+        now = time.monotonic()
+        if now - self._last_gc < self.gc_interval:
+            return True
+        self._last_gc = now
+        gc.collect()
+        rss = self.rss(fresh=True)
+        return rss is not None and rss >= self.limit
+
+    def scale(self, size: int, minimum: int = 1) -> int:
+        """`size` while under half the limit, shrinking linearly to `minimum` at the limit"""
+        if not self.max_rss:
+            return size
+        rss = self.rss()
+        if rss is None:
+            return size
+        fraction = (self.limit - rss) / (self.limit / 2)
+        return max(minimum, min(size, int(size * fraction)))
+
+    def _sample(self):
+        while True:
+            with self._lock:
+                if not self._active:
+                    self._sampler = None
+                    return
+            self.rss()
+            time.sleep(self.sample_interval)
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator['MemoryBudget']:
+        """Record the peak RSS and duration of the code run inside the block"""
+        start = time.perf_counter()
+        with self._lock:
+            self.peaks.setdefault(name, {'peak_rss': 0, 'seconds': 0.0})
+            self._active.append(name)
+            if self._sampler is None:
+                self._sampler = threading.Thread(target=self._sample, name='memory-budget', daemon=True)
+                self._sampler.start()
+        self.rss(fresh=True)
+        try:
+            yield self
+        finally:
+            self.rss(fresh=True)
+            with self._lock:
+                self._active.remove(name)
+                self.peaks[name]['seconds'] += time.perf_counter() - start
+
+    def format(self) -> str:
+        lines = [f"{'stage':<12} {'peak RSS':>10} {'time (s)':>9}"]
+        for name, stage in self.peaks.items():
+            lines.append(f"{name:<12} {format_size(stage['peak_rss']):>10} {stage['seconds']:>9.1f}")
+        if self.max_rss:
+            lines.append(f"Memory budget {format_size(self.max_rss)}, intake paused above {format_size(self.limit)}")
+        return '\n'.join(lines)
@@ -0,0 +1,230 @@
+import os
+import json
+import numpy as np
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+from utils.file_utils import atomic_save_array, atomic_write_bytes
+
+METADATA_MANIFEST_FILE = 'metadata.json'
+TEXT_ID_DTYPE = 'S50'  # matches text_data.id String(50)
+COLUMNS = ('vector_ids', 'text_ids', 'source_ids', 'offset_start', 'offset_end')
+
+
+class VectorMetadataStore:
+    """Columnar mapping from vector ids to text ids, source files and offsets.
+
+    Rows are appended in segments of numpy columns (`meta_<n>.<column>.npy`)
+    sorted by vector id and opened memory-mapped. Source file paths are
+    dictionary-encoded in `meta_sources.json` so each row stores only an
+    int32 code. Segments covering a contiguous id range are looked up by
+    direct offset, others by binary search.
+    """
+
+    def __init__(self, directory: str, mmap: bool = True):
+        self.directory = directory
+        self.mmap = mmap
+        os.makedirs(directory, exist_ok=True)
+
+        self.generation = 0
+        self.segments: List[Dict] = []
+        self.sources: List[str] = []
+        self._source_codes: Dict[str, int] = {}
+        self._pending: List[Tuple[np.ndarray, ...]] = []
+        self._segment_cache: Dict[str, Dict[str, np.ndarray]] = {}
+        self._load_manifest()
+
+    @property
+    def manifest_path(self) -> str:
+        return os.path.join(self.directory, METADATA_MANIFEST_FILE)
+
+    def _load_manifest(self):
+        if not os.path.exists(self.manifest_path):
+            return
+        with open(self.manifest_path, 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+        self.generation = manifest['generation']
+        self.segments = manifest['segments']
+        with open(os.path.join(self.directory, manifest['sources']), 'r', encoding='utf-8') as f:
+            self.sources = json.load(f)
+        self._source_codes = {source: code for code, source in enumerate(self.sources)}
+
+    def _write_manifest(self):
+        sources_file = f"meta_sources_{self.generation:08d}.json"
+        atomic_write_bytes(os.path.join(self.directory, sources_file), json.dumps(self.sources).encode('utf-8'))
+        manifest = {'generation': self.generation, 'segments': self.segments, 'sources': sources_file}
+        atomic_write_bytes(self.manifest_path, json.dumps(manifest, indent=2).encode('utf-8'))
+        for filename in os.listdir(self.directory):
+            if filename.startswith('meta_sources_') and filename != sources_file:
+                os.remove(os.path.join(self.directory, filename))
+
+    def _source_code(self, source_file: Optional[str]) -> int:
+        if source_file is None:
+            return -1
+        if source_file not in self._source_codes:
+            self._source_codes[source_file] = len(self.sources)
+            self.sources.append(source_file)
+        return self._source_codes[source_file]
+
+    def _open_segment(self, segment: Dict) -> Dict[str, np.ndarray]:
+        name = segment['name']
+        if name not in self._segment_cache:
+            mmap_mode = 'r' if self.mmap else None
+            self._segment_cache[name] = {
+                column: np.load(os.path.join(self.directory, f"{name}.{column}.npy"), mmap_mode=mmap_mode)
+                for column in COLUMNS
+            }
+        return self._segment_cache[name]
+
+    def __len__(self) -> int:
+        return sum(segment['count'] for segment in self.segments) + sum(len(rows[0]) for rows in self._pending)
+
+    def append(self, vector_ids: Sequence[int], text_ids: Sequence[str], source_files: Sequence[Optional[str]],
+               offsets: Optional[Sequence[Tuple[int, int]]] = None):
+        """Buffer metadata rows for the next flush"""
+        if not (len(vector_ids) == len(text_ids) == len(source_files)):
+            raise ValueError("vector_ids, text_ids and source_files must have the same length")
+        if offsets is None:
+            offsets = np.full((len(vector_ids), 2), -1, dtype='int64')
+        offsets = np.asarray(offsets, dtype='int64').reshape(-1, 2)
+        self._pending.append((
+            np.asarray(vector_ids, dtype='int64'),
+            np.array([text_id.encode('utf-8') for text_id in text_ids], dtype=TEXT_ID_DTYPE),
+            np.array([self._source_code(source) for source in source_files], dtype='int32'),
+            offsets[:, 0].copy(),
+            offsets[:, 1].copy(),
+        ))
+
+    def flush(self) -> bool:
+        """Write buffered rows as a new segment and commit the manifest"""
+        if not self._pending:
+            return False
+        columns = [np.concatenate(parts) for parts in zip(*self._pending)]
+        order = np.argsort(columns[0], kind='stable')
+        columns = [column[order] for column in columns]
+        self._pending = []
+        if not len(columns[0]):
+            return False
+
+        self.generation += 1
+        name = f"meta_{self.generation:08d}"
+        for column_name, column in zip(COLUMNS, columns):
+            atomic_save_array(os.path.join(self.directory, f"{name}.{column_name}.npy"), column)
+        vector_ids = columns[0]
+        self.segments.append({
+            'name': name,
+            'count': int(len(vector_ids)),
+            'min_id': int(vector_ids[0]),
+            'max_id': int(vector_ids[-1]),
+            'contiguous': bool(vector_ids[-1] - vector_ids[0] + 1 == len(vector_ids)),
+        })
+
+        self._write_manifest()
+        return True
+
+    def discard_from(self, vector_id: int) -> int:
+        """Drop committed segments starting at or after `vector_id`.
+
+        Metadata is flushed before the index manifest, so after a crash it can
+        be ahead of the index; those rows describe vectors that were never
+        committed and whose ids will be reused.
+        """
+        stale = [segment for segment in self.segments if segment['min_id'] >= vector_id]
+        if not stale:
+            return 0
+        self.segments = [segment for segment in self.segments if segment['min_id'] < vector_id]
+        self.generation += 1
+        self._write_manifest()
+        for segment in stale:
+            self._segment_cache.pop(segment['name'], None)
+            for column in COLUMNS:
+                path = os.path.join(self.directory, f"{segment['name']}.{column}.npy")
+                if os.path.exists(path):
+                    os.remove(path)
+        return len(stale)
+
+    def _locate(self, vector_ids: np.ndarray) -> List[Tuple[int, np.ndarray, np.ndarray]]:
+        """Group query ids by segment: (segment index, query positions, row positions)"""
+        if not self.segments or not len(vector_ids):
+            return []
+        min_ids = np.array([segment['min_id'] for segment in self.segments])
+        order = np.argsort(min_ids)
+        candidates = order[np.clip(np.searchsorted(min_ids[order], vector_ids, side='right') - 1, 0, None)]
+
+        located = []
+        for segment_index in np.unique(candidates):
+            segment = self.segments[segment_index]
+            query_positions = np.nonzero(candidates == segment_index)[0]
+            wanted = vector_ids[query_positions]
+            in_range = (wanted >= segment['min_id']) & (wanted <= segment['max_id'])
+            query_positions, wanted = query_positions[in_range], wanted[in_range]
+            if segment['contiguous']:
+                rows = wanted - segment['min_id']
+            else:
+                segment_ids = self._open_segment(segment)['vector_ids']
+                rows = np.searchsorted(segment_ids, wanted)
+                found = segment_ids[np.minimum(rows, len(segment_ids) - 1)] == wanted
+                query_positions, rows = query_positions[found], rows[found]
+            located.append((segment_index, query_positions, rows))
+        return located
+
+    def lookup_many(self, vector_ids: Sequence[int]) -> List[Optional[Dict]]:
+        """Bulk lookup of metadata for vector ids (e.g. FAISS search results)"""
+        vector_ids = np.asarray(vector_ids, dtype='int64').ravel()
+        results: List[Optional[Dict]] = [None] * len(vector_ids)
+        for segment_index, query_positions, rows in self._locate(vector_ids):
+            columns = self._open_segment(self.segments[segment_index])
+            text_ids = columns['text_ids'][rows]
+            source_ids = columns['source_ids'][rows]
+            starts = columns['offset_start'][rows]
+            ends = columns['offset_end'][rows]
+            for i, position in enumerate(query_positions):
+                source_id = int(source_ids[i])
+                results[position] = {
+                    'vector_id': int(vector_ids[position]),
+                    'text_id': text_ids[i].decode('utf-8'),
+                    'source_file': self.sources[source_id] if source_id >= 0 else None,
+                    'offsets': (int(starts[i]), int(ends[i])),
+                }
+        if self._pending and any(result is None for result in results):
+            self._lookup_pending(vector_ids, results)
+        return results
+
+    def _lookup_pending(self, vector_ids: np.ndarray, results: List[Optional[Dict]]):
+        """Fill unresolved results from rows that have not been flushed yet"""
+        columns = [np.concatenate(parts) for parts in zip(*self._pending)]
+        order = np.argsort(columns[0], kind='stable')
+        pending_ids = columns[0][order]
+        for position, vector_id in enumerate(vector_ids):
+            if results[position] is not None:
+                continue
+            row = int(np.searchsorted(pending_ids, vector_id))
+            if row < len(pending_ids) and pending_ids[row] == vector_id:
+                row = order[row]
+                source_id = int(columns[2][row])
+                results[position] = {
+                    'vector_id': int(vector_id),
+                    'text_id': columns[1][row].decode('utf-8'),
+                    'source_file': self.sources[source_id] if source_id >= 0 else None,
+                    'offsets': (int(columns[3][row]), int(columns[4][row])),
+                }
+
+    def lookup(self, vector_id: int) -> Optional[Dict]:
+        """Metadata for a single vector id, or None if unknown"""
+        return self.lookup_many([vector_id])[0]
+
+    def vector_ids_for_texts(self, text_ids: Sequence[str]) -> np.ndarray:
+        """All committed vector ids belonging to the given text ids"""
+        wanted = np.array([text_id.encode('utf-8') for text_id in text_ids], dtype=TEXT_ID_DTYPE)
+        matches = []
+        for segment in self.segments:
+            columns = self._open_segment(segment)
+            mask = np.isin(columns['text_ids'], wanted)
+            if mask.any():
+                matches.append(np.asarray(columns['vector_ids'][mask]))
+        return np.concatenate(matches) if matches else np.empty(0, dtype='int64')
+
+    def iter_mappings(self) -> Iterator[Tuple[np.ndarray, List[str]]]:
+        """Yield (vector ids, text ids) for every committed segment"""
+        for segment in self.segments:
+            columns = self._open_segment(segment)
+            yield np.asarray(columns['vector_ids']), [text_id.decode('utf-8') for text_id in columns['text_ids']]
@@ -0,0 +1,147 @@
+import os
+import heapq
+import wave
+import subprocess
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+AUDIO_EXTENSIONS = ('.mp3', '.mp4', '.wav', '.m4a')
+SPREADSHEET_EXTENSIONS = ('.csv', '.xlsx', '.xls')
+MARKUP_EXTENSIONS = ('.json', '.xml', '.html')
+
+# Estimated processing seconds per unit: per second of audio, per PDF page, per MB otherwise.
+# The report printed after a run shows how far off they are on the actual hardware.
+COST_RATES = {
+    'audio': 0.25,
+    'pdf': 0.1,
+    'spreadsheet': 4.0,
+    'markup': 1.0,
+    'text': 0.2,
+}
+# Bitrate assumed for compressed audio when its duration cannot be read from the header
+FALLBACK_AUDIO_BYTES_PER_SECOND = 16000
+
+
+def file_kind(file_path: str) -> str:
+    ext = os.path.splitext(file_path)[1].lower()
+    if ext in AUDIO_EXTENSIONS:
+        return 'audio'
+    if ext == '.pdf':
+        return 'pdf'
+    if ext in SPREADSHEET_EXTENSIONS:
+        return 'spreadsheet'
+    if ext in MARKUP_EXTENSIONS:
+        return 'markup'
+    return 'text'
+
+
+def audio_duration(file_path: str) -> float:
+    """Audio duration in seconds from the container header (ffprobe, or the
+    WAV header), falling back to an estimate from the file size"""
+    try:
+        output = subprocess.run(
+            ['ffprobe', '-v', 'error', '-show_entries', 'format=duration',
+             '-of', 'default=noprint_wrappers=1:nokey=1', file_path],
+            capture_output=True, text=True, timeout=30
+        ).stdout.strip()
+        return float(output)
+    except (OSError, subprocess.SubprocessError, ValueError):
+        pass
+    if file_path.lower().endswith('.wav'):
+        try:
+            with wave.open(file_path, 'rb') as f:
+                return f.getnframes() / float(f.getframerate())
+        except (wave.Error, EOFError, ZeroDivisionError):
+            pass
+    return os.path.getsize(file_path) / FALLBACK_AUDIO_BYTES_PER_SECOND
+
+
+def pdf_page_count(file_path: str) -> int:
+    """Page count from the PDF page tree, without extracting any text"""
+    from pdfminer.pdfdocument import PDFDocument
+    from pdfminer.pdfpage import PDFPage
+    from pdfminer.pdfparser import PDFParser
+    from pdfminer.pdftypes import resolve1
+    with open(file_path, 'rb') as f:
+        document = PDFDocument(PDFParser(f))
+        try:
+            return int(resolve1(resolve1(document.catalog['Pages'])['Count']))
+        except (KeyError, TypeError, ValueError):
+            return sum(1 for _ in PDFPage.create_pages(document))
+
+
+def estimate_cost(file_path: str, rates: Optional[Dict[str, float]] = None) -> Tuple[str, float, float]:
+    """(kind, size in the kind's unit, estimated seconds) for one file"""
+    rates = rates or COST_RATES
+    kind = file_kind(file_path)
+    try:
+        if kind == 'audio':
+            units = audio_duration(file_path)
+        elif kind == 'pdf':
+            units = pdf_page_count(file_path)
+        else:
+            units = os.path.getsize(file_path) / 2 ** 20
+    except Exception:
+        # Unreadable headers still get scheduled, by size
+        units = os.path.getsize(file_path) / 2 ** 20 if os.path.exists(file_path) else 0.0
+    return kind, float(units), float(units) * rates[kind]
+
+
+def plan_lpt(costs: Sequence[float], workers: int) -> Tuple[List[int], float]:
+    """Longest-processing-time-first order of `costs` and the makespan it
+    gives when `workers` each take the next job as soon as they are free"""
+    order = sorted(range(len(costs)), key=lambda i: costs[i], reverse=True)
+    finish_times = [0.0] * max(1, workers)
+    for i in order:
+        heapq.heapreplace(finish_times, finish_times[0] + costs[i])
+    return order, max(finish_times)
+
+
+class CostReport:
+    """Estimated versus actual processing time per file, summarized per kind"""
+
+    def __init__(self):
+        self.records: List[Dict] = []
+        self.estimated_makespan = 0.0
+        self.wall_seconds = 0.0
+
+    def record(self, file_path: str, kind: str, units: float, estimated: float, actual: float):
+        self.records.append({
+            'file_path': file_path, 'kind': kind, 'units': units, 'estimated_s': estimated, 'actual_s': actual
+        })
+
+    def summary(self) -> Dict[str, Dict]:
+        kinds: Dict[str, Dict] = {}
+        for record in self.records:
+            kind = kinds.setdefault(record['kind'], {'files': 0, 'estimated_s': 0.0, 'actual_s': 0.0})
+            kind['files'] += 1
+            kind['estimated_s'] += record['estimated_s']
+            kind['actual_s'] += record['actual_s']
+        for kind in kinds.values():
+            kind['actual_over_estimated'] = kind['actual_s'] / kind['estimated_s'] if kind['estimated_s'] else None
+        return kinds
+
+    def format(self) -> str:
+        lines = [f"{'kind':<12} {'files':>6} {'estimated (s)':>14} {'actual (s)':>11} {'actual/est':>10}"]
+        for name, kind in sorted(self.summary().items()):
+            ratio = kind['actual_over_estimated']
+            lines.append(f"{name:<12} {kind['files']:>6} {kind['estimated_s']:>14.1f} {kind['actual_s']:>11.1f} "
+                         f"{ratio if ratio is not None else float('nan'):>10.2f}")
+        lines.append(f"Estimated makespan {self.estimated_makespan:.1f}s, actual wall time {self.wall_seconds:.1f}s")
+        return '\n'.join(lines)
+
+
+def schedule_files(file_paths: Iterable[str], workers: int, audio_workers: int = 1,
+                   rates: Optional[Dict[str, float]] = None) -> Tuple[List[Tuple[str, str, float, float]],
+                                                                        List[Tuple[str, str, float, float]], float]:
+    """Split files into an audio queue and a document queue, each in LPT order.
+
+    Returns (audio jobs, document jobs, estimated makespan) where each job is
+    (file_path, kind, units, estimated seconds).
+    """
+    jobs = [(file_path,) + estimate_cost(file_path, rates) for file_path in file_paths]
+    audio = [job for job in jobs if job[1] == 'audio']
+    documents = [job for job in jobs if job[1] != 'audio']
+    audio_order, audio_makespan = plan_lpt([job[3] for job in audio], audio_workers)
+    document_order, document_makespan = plan_lpt([job[3] for job in documents], workers)
+    return ([audio[i] for i in audio_order], [documents[i] for i in document_order],
+            max(audio_makespan, document_makespan))
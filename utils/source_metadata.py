@@ -0,0 +1,27 @@
+import json
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+PARTICIPANTS_HEADER = 'Participants:'
+# Characters YouTubeDownloader strips from video titles to name metadata files
+_UNSAFE_FILENAME_CHARS = str.maketrans('', '', ':?<>|"/\\')
+
+
+def split_participants_header(text: str) -> Tuple[List[str], str]:
+    """Split the "Participants: a, b" header written by AudioTranscriberV2 from a transcript"""
+    first_line, _, body = text.partition('\n')
+    if not first_line.startswith(PARTICIPANTS_HEADER):
+        return [], text
+    participants = [name.strip() for name in first_line[len(PARTICIPANTS_HEADER):].split(',')]
+    return [name for name in participants if name], body.lstrip('\n')
+
+
+def load_video_metadata(source_file: str, metadata_dir: str = 'data/metadata') -> Optional[Dict]:
+    """Metadata JSON saved by YouTubeDownloader for a video, its audio or its transcript"""
+    stem = Path(source_file).stem
+    for name in dict.fromkeys((stem, stem.translate(_UNSAFE_FILENAME_CHARS))):
+        path = Path(metadata_dir) / f"{name}.json"
+        if path.exists():
+            with open(path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+    return None
@@ -1,53 +1,191 @@
 import os
 import numpy as np
-import fasttext
 import faiss
-from typing import List, Union
-import pickle
+from typing import Dict, List, Optional, Sequence, Tuple, Union
+
+from utils.embedding_backends import EmbeddingBackend, create_backend
+from utils.index_store import IndexStore
+from utils.metadata_store import VectorMetadataStore
 
 class VectorManager:
-    def __init__(self, model_path: str, vector_dim: int = 300):
-        self.model = fasttext.load_model(model_path)
+    def __init__(self, model_path: str, vector_dim: int = 300, index_dir: Optional[str] = None, mmap: bool = True,
+                 backend: Union[str, EmbeddingBackend] = 'fasttext', read_only: bool = False):
+        """Load the embedding backend (a name from utils.embedding_backends, loaded
+        from `model_path`, or a backend instance); with `index_dir`, vectors go to
+        an incremental on-disk IndexStore.
+
+        Processes that only search or export an index another process writes
+        to (the search service) open it `read_only`: they never write to it,
+        and leave crash recovery of the metadata to the writer."""
+        self.backend = create_backend(backend, model_path) if isinstance(backend, str) else backend
+        if self.backend.dim != vector_dim:
+            raise ValueError(f"Embedding backend {self.backend.name} produces {self.backend.dim}-d vectors, "
+                             f"expected {vector_dim}")
         self.vector_dim = vector_dim
+        self.read_only = read_only
         self.index = faiss.IndexFlatL2(vector_dim)
+        self.store = IndexStore(index_dir, vector_dim, mmap=mmap) if index_dir else None
+        self.metadata = VectorMetadataStore(index_dir, mmap=mmap) if index_dir else None
+        if self.store is not None:
+            self._check_embedding_space(self.store)
+        if self.store is not None and not read_only:
+            # Drop metadata written ahead of an index commit that never happened.
+            # Only the writer may do this: for a reader, those rows may belong to
+            # a commit the writer is making right now.
+            self.metadata.discard_from(self.store.next_id)
+        self._manifest_version = self._read_manifest_version()
+
+    def _check_embedding_space(self, store: IndexStore):
+        """Refuse an index built with another backend or model. An index that
+        does not record them yet gets this backend's on its next flush."""
+        if store.embedding_backend is None:
+            store.embedding_backend, store.embedding_model = self.backend.name, self.backend.model_id
+            return
+        if (store.embedding_backend, store.embedding_model) != (self.backend.name, self.backend.model_id):
+            raise ValueError(f"{store.index_dir} was built with {store.embedding_backend} model "
+                             f"{store.embedding_model}, not {self.backend.name} model {self.backend.model_id}")
 
     def text_to_vector(self, text: str) -> np.ndarray:
-        """Convert text to FastText vector"""
-        return self.model.get_sentence_vector(text)
+        """Convert text to a vector"""
+        return self.backend.embed([text])[0]
 
     def batch_to_vectors(self, texts: List[str]) -> np.ndarray:
         """Convert batch of texts to vectors"""
-        vectors = [self.text_to_vector(text) for text in texts]
-        return np.array(vectors).astype('float32')
+        return self.backend.embed(texts)
 
-    def add_to_index(self, vectors: np.ndarray):
-        """Add vectors to FAISS index"""
+    def add_to_index(self, vectors: np.ndarray, vector_ids: Optional[np.ndarray] = None) -> np.ndarray:
+        """Add vectors to the index and return their vector ids (`vector_ids`
+        keeps given ids, e.g. when rebuilding an IndexStore from an export)"""
         if vectors.shape[1] != self.vector_dim:
             raise ValueError(f"Vector dimension mismatch. Expected {self.vector_dim}, got {vectors.shape[1]}")
+        if self.store is not None:
+            return self.store.add(vectors, vector_ids)
+        if vector_ids is not None:
+            raise ValueError("Explicit vector ids require VectorManager to be created with an index_dir")
+        start = self.index.ntotal
         self.index.add(vectors)
+        return np.arange(start, self.index.ntotal, dtype='int64')
+
+    def remove_from_index(self, vector_ids) -> int:
+        """Remove vectors (e.g. of replaced texts) from the index"""
+        if self.store is not None:
+            return self.store.remove(vector_ids)
+        return self.index.remove_ids(np.asarray(vector_ids, dtype='int64'))
 
-    def search(self, query_vector: np.ndarray, k: int = 5) -> tuple:
-        """Search for similar vectors"""
-        distances, indices = self.index.search(query_vector.reshape(1, -1), k)
+    def search(self, query_vector: np.ndarray, k: int = 5, allowed_ids: Optional[Sequence[int]] = None) -> tuple:
+        """Search for similar vectors, optionally restricted to the vector ids in `allowed_ids`"""
+        distances, indices = self.search_batch(query_vector.reshape(1, -1), k, allowed_ids)
         return distances[0], indices[0]
 
-    def save_index(self, path: str):
-        """Save FAISS index to disk"""
-        faiss.write_index(self.index, path)
+    def search_batch(self, query_vectors: np.ndarray, k: int = 5, allowed_ids: Optional[Sequence[int]] = None) -> tuple:
+        """Search for several query vectors in one index pass, optionally
+        restricted to the vector ids in `allowed_ids`"""
+        query_vectors = np.ascontiguousarray(query_vectors, dtype='float32').reshape(-1, self.vector_dim)
+        if self.store is not None:
+            return self.store.search(query_vectors, k, allowed_ids)
+        if allowed_ids is None:
+            return self.index.search(query_vectors, k)
+        selector = faiss.IDSelectorBatch(np.asarray(allowed_ids, dtype='int64'))
+        return self.index.search(query_vectors, k, params=faiss.SearchParameters(sel=selector))
+
+    def find_near_duplicates(self, vectors: np.ndarray, threshold: float) -> Dict[int, Tuple[str, int, float]]:
+        """Find rows of `vectors` that are near-duplicates (cosine >= threshold)
+        of an indexed vector or of an earlier row in the same batch.
+
+        Returns {row: ('index', vector_id, similarity)} or
+        {row: ('batch', canonical_row, similarity)}; canonical rows are never
+        duplicates themselves.
+        """
+        if self.store is None:
+            raise ValueError("Near-duplicate detection requires VectorManager to be created with an index_dir")
+        vectors = np.ascontiguousarray(vectors, dtype='float32')
+        duplicates = {}
+
+        # Against everything already in the index
+        lims, similarities, vector_ids = self.store.range_search_cosine(vectors, threshold)
+        for row in range(len(vectors)):
+            if lims[row + 1] > lims[row]:
+                best = lims[row] + int(np.argmax(similarities[lims[row]:lims[row + 1]]))
+                duplicates[row] = ('index', int(vector_ids[best]), float(similarities[best]))
+
+        # Within the batch, earlier rows are canonical for later ones
+        normalized = vectors.copy()
+        faiss.normalize_L2(normalized)
+        batch_index = faiss.IndexFlatIP(self.vector_dim)
+        batch_index.add(normalized)
+        lims, similarities, rows = batch_index.range_search(normalized, threshold)
+        for row in range(len(vectors)):
+            if row in duplicates:
+                continue
+            candidates = [(float(similarity), int(other))
+                          for similarity, other in zip(similarities[lims[row]:lims[row + 1]], rows[lims[row]:lims[row + 1]])
+                          if other < row]
+            for similarity, other in sorted(candidates, reverse=True):
+                if other in duplicates:
+                    source, canonical, _ = duplicates[other]
+                    duplicates[row] = (source, canonical, similarity)
+                else:
+                    duplicates[row] = ('batch', other, similarity)
+                break
+        return duplicates
+
+    def save_index(self, path: Optional[str] = None, checkpoint: Optional[Dict] = None):
+        """Save FAISS index to disk (flushes new shards when using an IndexStore,
+        committing `checkpoint` atomically with them)"""
+        self._require_writable()
+        if self.store is not None:
+            self.store.flush(checkpoint)
+        else:
+            faiss.write_index(self.index, path)
 
     def load_index(self, path: str):
         """Load FAISS index from disk"""
         self.index = faiss.read_index(path)
 
-    def save_metadata(self, metadata: dict, path: str):
-        """Save metadata (e.g., mapping between vector indices and original texts)"""
-        with open(path, 'wb') as f:
-            pickle.dump(metadata, f)
+    def _read_manifest_version(self) -> Optional[int]:
+        try:
+            return os.stat(self.store.manifest_path).st_mtime_ns if self.store is not None else None
+        except FileNotFoundError:
+            return None
+
+    def refresh(self) -> bool:
+        """Reopen the on-disk index if another process (e.g. `main.py --watch`)
+        committed to it since it was opened. For `read_only` users such as the
+        search service; returns whether the index changed. Nothing is
+        discarded: metadata ahead of the index belongs to a commit in progress."""
+        version = self._read_manifest_version()
+        if version is None or version == self._manifest_version:
+            return False
+        # Metadata may run ahead of the index, never behind it: reopen it first
+        metadata = VectorMetadataStore(self.metadata.directory, mmap=self.metadata.mmap)
+        store = IndexStore(self.store.index_dir, self.vector_dim, mmap=self.store.mmap)
+        self._check_embedding_space(store)
+        self.metadata, self.store = metadata, store
+        self._manifest_version = version
+        return True
+
+    def add_metadata(self, vector_ids: Sequence[int], text_ids: Sequence[str], source_files: Sequence[Optional[str]],
+                     offsets: Optional[Sequence[Tuple[int, int]]] = None):
+        """Record the text each vector was computed from"""
+        self._require_metadata().append(vector_ids, text_ids, source_files, offsets)
+
+    def save_metadata(self):
+        """Write buffered vector metadata to disk"""
+        self._require_writable()
+        self._require_metadata().flush()
+
+    def lookup_metadata(self, vector_ids: Sequence[int]) -> List[Optional[Dict]]:
+        """Metadata (text_id, source_file, offsets) for search result ids"""
+        return self._require_metadata().lookup_many(vector_ids)
+
+    def _require_writable(self):
+        if self.read_only:
+            raise ValueError("This VectorManager was opened read-only")
 
-    def load_metadata(self, path: str) -> dict:
-        """Load metadata"""
-        with open(path, 'rb') as f:
-            return pickle.load(f)
+    def _require_metadata(self) -> VectorMetadataStore:
+        if self.metadata is None:
+            raise ValueError("Vector metadata requires VectorManager to be created with an index_dir")
+        return self.metadata
 
 class VectorizeResult:
     def __init__(self, text_id: str, vector: np.ndarray, metadata: dict = None):
@@ -0,0 +1,49 @@
+import torch
+import whisper
+from torch import nn
+from typing import Optional
+
+
+def configure_torch_threads(num_threads: Optional[int] = None, interop_threads: Optional[int] = None):
+    """Set the intra-op (and optionally inter-op) thread pools used for CPU inference"""
+    if num_threads:
+        torch.set_num_threads(num_threads)
+    if interop_threads:
+        try:
+            torch.set_num_interop_threads(interop_threads)
+        except RuntimeError:
+            # Can only be set once, before any inter-op parallel work has started
+            pass
+
+
+def _use_plain_linear(module: nn.Module):
+    """Replace Whisper's Linear subclass with nn.Linear sharing the same weights.
+
+    Dynamic quantization only swaps modules whose type is exactly nn.Linear.
+    Whisper's subclass only casts weights to the input dtype, which is a
+    no-op for float32 CPU inference.
+    """
+    for name, child in module.named_children():
+        if isinstance(child, nn.Linear) and type(child) is not nn.Linear:
+            linear = nn.Linear(child.in_features, child.out_features, bias=child.bias is not None)
+            linear.weight = child.weight
+            linear.bias = child.bias
+            setattr(module, name, linear)
+        else:
+            _use_plain_linear(child)
+
+
+def quantize_whisper_model(model: whisper.model.Whisper) -> whisper.model.Whisper:
+    """Dynamically quantize the linear layers of a CPU Whisper model to int8"""
+    model = model.cpu().float().eval()
+    _use_plain_linear(model)
+    return torch.ao.quantization.quantize_dynamic(model, {nn.Linear}, dtype=torch.qint8)
+
+
+def load_whisper_model(model_size: str = 'base', quantize: bool = False, num_threads: Optional[int] = None,
+                       interop_threads: Optional[int] = None) -> whisper.model.Whisper:
+    """Load a Whisper model, optionally int8-quantized for CPU inference"""
+    configure_torch_threads(num_threads, interop_threads)
+    if quantize:
+        return quantize_whisper_model(whisper.load_model(model_size, device='cpu'))
+    return whisper.load_model(model_size)